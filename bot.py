@@ -5,6 +5,7 @@ from aiohttp import web
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.fsm.storage.memory import MemoryStorage
 
 # Импорты конфигурации
@@ -27,6 +28,11 @@ from services.seasonal_adjustment_service import (
 )
 from services.payment_service import process_auto_payments, handle_payment_webhook
 from services.subscription_service import reset_all_usage_limits
+from services.openai_client import (
+    close_openai_client, warm_up_openai, OPENAI_WARMUP_INTERVAL_MINUTES
+)
+from services.plantid_service import close_plantid_client
+from utils.image_utils import shutdown_image_pool
 
 # Импорты handlers
 from handlers import (
@@ -42,7 +48,13 @@ from middleware import ActivityTrackingMiddleware
 logger.info("🚀 Запуск Bloom AI Bot...")
 
 # Инициализация бота
-bot = Bot(token=BOT_TOKEN)
+# Одна долгоживущая HTTP-сессия к Bot API: при массовой рассылке напоминаний
+# соединения переиспользуются, а не открываются заново с TLS-рукопожатием
+# (limit - публичный параметр сессии; отдельного лимита на хост у TCPConnector по умолчанию нет)
+TELEGRAM_CONNECTION_LIMIT = 100
+
+telegram_session = AiohttpSession(limit=TELEGRAM_CONNECTION_LIMIT)
+bot = Bot(token=BOT_TOKEN, session=telegram_session)
 dp = Dispatcher(storage=MemoryStorage())
 
 # Планировщик
@@ -116,6 +128,18 @@ async def on_shutdown():
     except:
         pass
     
+    try:
+        await close_openai_client()
+    except:
+        pass
+    
+    try:
+        await close_plantid_client()
+    except:
+        pass
+    
+    shutdown_image_pool()
+    
     try:
         await bot.session.close()
         logger.info("✅ Сессия бота закрыта")
@@ -220,6 +244,17 @@ def setup_scheduler():
     )
     logger.info(f"✅ Задача 'reset_usage_limits' добавлена: 1 числа каждого месяца в 00:05 МСК")
     
+    # 🔥 ПРОГРЕВ OPENAI — держим соединение открытым, первый запрос сразу после старта
+    scheduler.add_job(
+        warm_up_openai,
+        'interval',
+        minutes=OPENAI_WARMUP_INTERVAL_MINUTES,
+        next_run_time=get_moscow_now(),
+        id='openai_warmup',
+        replace_existing=True
+    )
+    logger.info(f"✅ Задача 'openai_warmup' добавлена: при старте и каждые {OPENAI_WARMUP_INTERVAL_MINUTES} минут")
+    
     # КРИТИЧЕСКИ ВАЖНО: Запускаем планировщик
     scheduler.start()
     logger.info("")
@@ -367,7 +402,19 @@ async def main():
         raise
 
 
+def install_event_loop_policy():
+    """uvloop ускоряет event loop под нагрузкой; если его нет - работаем на стандартном"""
+    try:
+        import uvloop
+    except ImportError:
+        logger.info("ℹ️ uvloop не установлен, используется стандартный event loop")
+        return
+    uvloop.install()
+    logger.info("✅ uvloop активирован")
+
+
 if __name__ == "__main__":
+    install_event_loop_policy()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -17,6 +17,12 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 PORT = int(os.getenv("PORT", 8000))
 
+# Фоновые запросы к OpenAI через Batch API (дешевле, но ответ приходит с задержкой)
+OPENAI_BATCH_ENABLED = os.getenv("OPENAI_BATCH_ENABLED", "false").lower() == "true"
+
+# Глубина рассуждений GPT-5.1: none / low / medium / high
+GPT5_REASONING_EFFORT = os.getenv("GPT5_REASONING_EFFORT", "low")
+
 # YooKassa
 YOOKASSA_SHOP_ID = os.getenv("YOOKASSA_SHOP_ID")
 YOOKASSA_SECRET_KEY = os.getenv("YOOKASSA_SECRET_KEY")
@@ -25,7 +31,7 @@ YOOKASSA_SECRET_KEY = os.getenv("YOOKASSA_SECRET_KEY")
 MOSCOW_TZ = pytz.timezone('Europe/Moscow')
 
 # Администраторы (получают ежедневную статистику)
-ADMIN_USER_IDS = [455263261, 8390994875]
+ADMIN_USER_IDS = frozenset({455263261, 8390994875})
 
 # === ПОДПИСКА ===
 # Лимиты бесплатного плана (в месяц)
@@ -59,6 +65,10 @@ STATE_NAMES = {
     'adaptation': 'Адаптация'
 }
 
+# Эмодзи и название состояния одной парой - для мест, где нужны оба
+DEFAULT_STATE_UI = ('🌱', 'Здоровое')
+STATE_UI = {state: (STATE_EMOJI[state], STATE_NAMES[state]) for state in STATE_EMOJI}
+
 # Промпт для анализа растений
 PLANT_IDENTIFICATION_PROMPT = """
 Вы - профессиональный ботаник-диагност с 30-летним опытом идентификации и диагностики комнатных растений.
@@ -205,6 +215,6 @@ def validate_config():
     logger.info(f"🔑 OPENAI_API_KEY: {'✅ Установлен' if OPENAI_API_KEY else '❌ Отсутствует'}")
     logger.info(f"🔑 PLANTID_API_KEY: {'✅ Установлен' if PLANTID_API_KEY else '❌ Отсутствует'}")
     logger.info(f"🌐 WEBHOOK_URL: {WEBHOOK_URL if WEBHOOK_URL else '❌ Не установлен (polling режим)'}")
-    logger.info(f"👨‍💼 ADMIN_USER_IDS: {ADMIN_USER_IDS}")
+    logger.info(f"👨‍💼 ADMIN_USER_IDS: {', '.join(map(str, sorted(ADMIN_USER_IDS)))}")
     logger.info(f"💳 YOOKASSA_SHOP_ID: {'✅ Установлен' if YOOKASSA_SHOP_ID else '❌ Отсутствует'}")
     logger.info(f"💳 YOOKASSA_SECRET_KEY: {'✅ Установлен' if YOOKASSA_SECRET_KEY else '❌ Отсутствует'}")
@@ -1,24 +1,69 @@
 import os
 import asyncpg
-import json
+import orjson
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import logging
 
+from utils.time_utils import get_moscow_naive_now
+
 logger = logging.getLogger(__name__)
 
+# Пул общий для обработчиков и фоновых рассылок: запас, чтобы рассылка не забирала все соединения
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 5))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 20))
+DB_POOL_MAX_INACTIVE_LIFETIME = int(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", 300))
+
+# Сезонный интервал для вида считается раз в месяц, запись с запасом живёт 40 дней
+SEASONAL_CACHE_DAYS = 40
+# Вид растения для кэша сезонных интервалов: название вида, иначе своё имя; в нижнем регистре
+_PLANT_SPECIES_SQL = "lower(btrim(COALESCE(NULLIF(btrim(p.plant_name), ''), p.custom_name)))"
+
+
+def _dumps_json(value) -> str:
+    """JSON для JSONB-колонок; int-ключи сериализуются строками, как в json.dumps"""
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+async def _reset_connection(conn: asyncpg.Connection):
+    """Сброс соединения при возврате в пул
+    
+    Бот не держит сессионного состояния (SET, LISTEN, advisory-блокировки, временные таблицы),
+    поэтому стандартный RESET ALL/UNLISTEN - лишний запрос на каждое освобождение.
+    Откатываем только транзакцию, оставшуюся открытой после ошибки или отмены
+    """
+    if conn.is_in_transaction():
+        await conn.execute("ROLLBACK")
+
+
 class PlantDatabase:
     def __init__(self):
         self.database_url = os.getenv("DATABASE_URL")
         self.pool = None
+    
+    @asynccontextmanager
+    async def _connection(self, conn: asyncpg.Connection = None):
+        """Переданное соединение (например, внутри транзакции) или новое из пула"""
+        if conn is not None:
+            yield conn
+        else:
+            async with self.pool.acquire() as new_conn:
+                yield new_conn
         
     async def init_pool(self):
         """Инициализация пула соединений"""
         try:
+            # statement_cache_size: горячие запросы (get_plant_by_id, полив и т.п.)
+            # готовятся один раз на соединение, без лишнего Parse/Describe.
+            # reset: без запроса-сброса при каждом возврате соединения в пул
             self.pool = await asyncpg.create_pool(
                 self.database_url,
-                min_size=1,
-                max_size=3
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                statement_cache_size=256,
+                max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+                reset=_reset_connection
             )
             await self.create_tables()
             logger.info("✅ База данных подключена")
@@ -73,7 +118,7 @@ class PlantDatabase:
                     plant_name TEXT,
                     custom_name TEXT,
                     saved_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_watered TIMESTAMP,
+                    last_watered TIMESTAMP,  -- московское время без пояса
                     watering_count INTEGER DEFAULT 0,
                     watering_interval INTEGER DEFAULT 5,
                     base_watering_interval INTEGER,
@@ -356,6 +401,8 @@ class PlantDatabase:
             # Индексы для подписки
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_plan ON subscriptions(plan)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_expires ON subscriptions(expires_at)")
+            # Поиск подписок для автопродления (get_expiring_subscriptions) - только платные PRO с картой
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_renewal ON subscriptions(expires_at) WHERE plan = 'pro' AND auto_pay_method_id IS NOT NULL AND granted_by_admin IS NULL")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_payment_id ON payments(payment_id)")
@@ -387,6 +434,8 @@ class PlantDatabase:
             
             # Индексы для оптимизации
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_plants_user_id ON plants (user_id)")
+            # Пересчёт users.plants_count триггером: COUNT(*) обычных растений пользователя по индексу
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_plants_user_regular ON plants (user_id) WHERE plant_type = 'regular'")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_plants_state ON plants (current_state)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_plant_state_history_plant_id ON plant_state_history (plant_id)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_plant_analyses_full_plant_id ON plant_analyses_full (plant_id)")
@@ -396,6 +445,12 @@ class PlantDatabase:
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_growing_plants_user_id ON growing_plants (user_id)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_user_id ON reminders (user_id)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_next_date ON reminders (next_date, is_active)")
+            # Частичные индексы под ежедневную выборку напоминаний (сравнения по next_date без ::date)
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_watering_due ON reminders (next_date) WHERE reminder_type = 'watering' AND is_active = TRUE")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_task_due ON reminders (next_date) WHERE reminder_type = 'task' AND is_active = TRUE")
+            # Только пользователи и растения с включенными напоминаниями - join в выборке напоминаний идёт по ним
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_user_settings_reminder_enabled ON user_settings (user_id) WHERE reminder_enabled = TRUE")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_plants_reminder_regular ON plants (id, user_id) WHERE reminder_enabled = TRUE AND plant_type = 'regular'")
             # === МИГРАЦИЯ: Добавление user_id в care_history ===
             logger.info("🔄 Проверка миграции care_history.user_id...")
             try:
@@ -476,6 +531,17 @@ class PlantDatabase:
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_admin_messages_from ON admin_messages(from_user_id, sent_at DESC)")
             await conn.execute("CREATE INDEX IF NOT EXISTS idx_admin_messages_unread ON admin_messages(to_user_id, read) WHERE read = FALSE")
 
+            # === КЭШ СЕЗОННЫХ ИНТЕРВАЛОВ ПОЛИВА (ответы GPT по виду и месяцу) ===
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS seasonal_interval_cache (
+                    species TEXT NOT NULL,
+                    month SMALLINT NOT NULL,
+                    watering_interval SMALLINT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (species, month)
+                )
+            """)
+
             # === КРИТИЧНАЯ МИГРАЦИЯ ДЛЯ УНИКАЛЬНОСТИ НАПОМИНАНИЙ ===
             logger.info("🔔 Применение миграции для уникальности напоминаний...")
             
@@ -756,7 +822,7 @@ class PlantDatabase:
                 ON CONFLICT (user_id) DO NOTHING
             """, user_id)
     
-    async def update_user_activity(self, user_id: int, action: str):
+    async def update_user_activity(self, user_id: int, action: str, conn: asyncpg.Connection = None):
         """
         Обновить активность пользователя
         
@@ -767,7 +833,7 @@ class PlantDatabase:
         - asked_question: задал вопрос
         - sent_photo: отправил фото на анализ
         """
-        async with self.pool.acquire() as conn:
+        async with self._connection(conn) as conn:
             await conn.execute("""
                 UPDATE users 
                 SET last_activity = CURRENT_TIMESTAMP,
@@ -790,9 +856,10 @@ class PlantDatabase:
     
     # === МЕТОДЫ ДЛЯ РАСТЕНИЙ С СОСТОЯНИЯМИ ===
     
-    async def save_plant(self, user_id: int, analysis: str, photo_file_id: str, plant_name: str = None) -> int:
+    async def save_plant(self, user_id: int, analysis: str, photo_file_id: str, plant_name: str = None,
+                         conn: asyncpg.Connection = None) -> int:
         """Сохранить растение"""
-        async with self.pool.acquire() as conn:
+        async with self._connection(conn) as conn:
             if not plant_name:
                 plant_name = self.extract_plant_name_from_analysis(analysis)
             
@@ -803,15 +870,17 @@ class PlantDatabase:
             """, user_id, analysis, photo_file_id, plant_name)
             
             try:
-                await conn.execute("""
-                    INSERT INTO care_history (plant_id, user_id, action_type, notes)
-                    VALUES ($1, $2, 'added', 'Растение добавлено в коллекцию')
-                """, plant_id, user_id)
+                # Savepoint: ошибка истории не прерывает внешнюю транзакцию
+                async with conn.transaction():
+                    await conn.execute("""
+                        INSERT INTO care_history (plant_id, user_id, action_type, notes)
+                        VALUES ($1, $2, 'added', 'Растение добавлено в коллекцию')
+                    """, plant_id, user_id)
             except Exception as e:
                 logger.error(f"Ошибка добавления в историю: {e}")
             
             # Обновляем активность пользователя
-            await self.update_user_activity(user_id, 'added_plant')
+            await self.update_user_activity(user_id, 'added_plant', conn=conn)
             
             return plant_id
     
@@ -836,13 +905,63 @@ class PlantDatabase:
                 return dict(row)
             return None
     
+    async def get_plant_with_history(self, plant_id: int, user_id: int, limit: int = 10) -> tuple:
+        """Растение и последние изменения состояния одним запросом
+        
+        Returns:
+            tuple: (dict растения или None, список записей истории)
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT p.id, p.current_state, p.watering_interval, p.state_changes_count,
+                       p.last_watered,
+                       COALESCE(p.custom_name, p.plant_name, 'Растение #' || p.id) as display_name,
+                       h.change_date, h.previous_state, h.new_state, h.change_reason
+                FROM plants p
+                LEFT JOIN LATERAL (
+                    SELECT change_date, previous_state, new_state, change_reason
+                    FROM plant_state_history
+                    WHERE plant_id = p.id
+                    ORDER BY change_date DESC
+                    LIMIT $3
+                ) h ON TRUE
+                WHERE p.id = $1 AND p.user_id = $2
+            """, plant_id, user_id, limit)
+            
+            if not rows:
+                return None, []
+            
+            first = rows[0]
+            plant = {
+                'id': first['id'],
+                'display_name': first['display_name'],
+                'current_state': first['current_state'],
+                'watering_interval': first['watering_interval'],
+                'state_changes_count': first['state_changes_count'],
+                'last_watered': first['last_watered']
+            }
+            history = [
+                {
+                    'change_date': row['change_date'],
+                    'previous_state': row['previous_state'],
+                    'new_state': row['new_state'],
+                    'change_reason': row['change_reason']
+                }
+                for row in rows if row['change_date'] is not None
+            ]
+            return plant, history
+    
     async def update_plant_state(self, plant_id: int, user_id: int, new_state: str, 
                                 change_reason: str = None, photo_file_id: str = None,
                                 ai_analysis: str = None, watering_adjustment: int = 0,
                                 feeding_adjustment: int = None, recommendations: str = None,
-                                manual_event: bool = False, event_type: str = None):
-        """Обновить состояние растения"""
-        async with self.pool.acquire() as conn:
+                                manual_event: bool = False, event_type: str = None,
+                                update_last_photo: bool = False, conn: asyncpg.Connection = None):
+        """Обновить состояние растения
+        
+        update_last_photo: в том же UPDATE записать photo_file_id и дату последнего фото
+        """
+        async with self._connection(conn) as conn:
             current = await conn.fetchrow("""
                 SELECT current_state FROM plants WHERE id = $1 AND user_id = $2
             """, plant_id, user_id)
@@ -852,13 +971,24 @@ class PlantDatabase:
             
             previous_state = current['current_state']
             
-            await conn.execute("""
-                UPDATE plants 
-                SET current_state = $1,
-                    state_changed_date = CURRENT_TIMESTAMP,
-                    state_changes_count = COALESCE(state_changes_count, 0) + 1
-                WHERE id = $2 AND user_id = $3
-            """, new_state, plant_id, user_id)
+            if update_last_photo:
+                await conn.execute("""
+                    UPDATE plants 
+                    SET current_state = $1,
+                        state_changed_date = CURRENT_TIMESTAMP,
+                        state_changes_count = COALESCE(state_changes_count, 0) + 1,
+                        last_photo_analysis = CURRENT_TIMESTAMP,
+                        photo_file_id = $4
+                    WHERE id = $2 AND user_id = $3
+                """, new_state, plant_id, user_id, photo_file_id)
+            else:
+                await conn.execute("""
+                    UPDATE plants 
+                    SET current_state = $1,
+                        state_changed_date = CURRENT_TIMESTAMP,
+                        state_changes_count = COALESCE(state_changes_count, 0) + 1
+                    WHERE id = $2 AND user_id = $3
+                """, new_state, plant_id, user_id)
             
             await conn.execute("""
                 INSERT INTO plant_state_history 
@@ -896,8 +1026,11 @@ class PlantDatabase:
         """Получить растения для месячного напоминания"""
         async with self.pool.acquire() as conn:
             rows = await conn.fetch("""
-                SELECT p.*, 
-                       COALESCE(p.custom_name, p.plant_name, 'Растение #' || p.id) as display_name
+                SELECT p.id, p.user_id, p.current_state,
+                       COALESCE(p.custom_name, p.plant_name, 'Растение #' || p.id) as display_name,
+                       (CURRENT_TIMESTAMP AT TIME ZONE 'Europe/Moscow')::date
+                           - ((p.last_photo_analysis AT TIME ZONE 'UTC') AT TIME ZONE 'Europe/Moscow')::date
+                           as days_ago
                 FROM plants p
                 JOIN user_settings us ON p.user_id = us.user_id
                 WHERE p.plant_type = 'regular'
@@ -910,19 +1043,44 @@ class PlantDatabase:
                     us.last_monthly_reminder IS NULL
                     OR us.last_monthly_reminder < CURRENT_TIMESTAMP - INTERVAL '30 days'
                   )
+                ORDER BY p.user_id, p.id
             """)
             
             return [dict(row) for row in rows]
     
-    async def mark_monthly_reminder_sent(self, user_id: int):
-        """Отметить отправку месячного напоминания"""
+    async def mark_monthly_reminders_sent(self, user_ids: List[int]):
+        """Отметить отправку месячного напоминания сразу нескольким пользователям"""
+        if not user_ids:
+            return
         async with self.pool.acquire() as conn:
             await conn.execute("""
                 UPDATE user_settings
                 SET last_monthly_reminder = CURRENT_TIMESTAMP
+                WHERE user_id = ANY($1::bigint[])
+            """, user_ids)
+    
+    async def disable_user_reminders(self, user_id: int):
+        """Выключить все напоминания пользователя (например, если он заблокировал бота)"""
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE user_settings
+                SET reminder_enabled = FALSE,
+                    monthly_photo_reminder = FALSE
                 WHERE user_id = $1
             """, user_id)
     
+    async def mark_reminders_sent(self, reminder_ids: List[int], sent_at: datetime):
+        """Отметить отправку пачки напоминаний одним запросом"""
+        if not reminder_ids:
+            return
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE reminders
+                SET last_sent = $1,
+                    send_count = COALESCE(send_count, 0) + 1
+                WHERE id = ANY($2::int[])
+            """, sent_at, reminder_ids)
+    
     async def update_plant_name(self, plant_id: int, user_id: int, new_name: str):
         """Обновить название растения"""
         async with self.pool.acquire() as conn:
@@ -949,6 +1107,90 @@ class PlantDatabase:
                 WHERE id = $2
             """, interval_days, plant_id)
     
+    async def set_initial_watering(self, plant_id: int, interval_days: int, last_watered: datetime = None,
+                                   now: datetime = None, conn: asyncpg.Connection = None) -> Dict:
+        """Интервал и базовый интервал нового растения и (если известна) дата последнего полива
+        
+        last_watered и now - московское время без пояса (now по умолчанию - текущее);
+        дни считаются здесь, а не по часам базы
+        
+        Returns:
+            dict: days_since_watered (None без last_watered) и next_watering_days
+        """
+        async with self._connection(conn) as conn:
+            await conn.execute("""
+                UPDATE plants 
+                SET watering_interval = $1,
+                    base_watering_interval = $1,
+                    last_watered = COALESCE($2, last_watered)
+                WHERE id = $3
+            """, interval_days, last_watered, plant_id)
+        
+        if last_watered is None:
+            return {'days_since_watered': None, 'next_watering_days': interval_days}
+        
+        days_since_watered = ((now or get_moscow_naive_now()) - last_watered).days
+        return {
+            'days_since_watered': days_since_watered,
+            'next_watering_days': max(1, interval_days - days_since_watered),
+        }
+    
+    async def get_seasonal_interval(self, species: str, month: int) -> Optional[int]:
+        """Сохранённый интервал полива для вида в этом месяце (свежее SEASONAL_CACHE_DAYS дней)"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval("""
+                SELECT watering_interval FROM seasonal_interval_cache
+                WHERE species = $1 AND month = $2
+                  AND created_at > CURRENT_TIMESTAMP - make_interval(days => $3)
+            """, species, month, SEASONAL_CACHE_DAYS)
+    
+    async def save_seasonal_interval(self, species: str, month: int, interval: int):
+        """Запомнить интервал полива для вида в этом месяце"""
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO seasonal_interval_cache (species, month, watering_interval)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (species, month) DO UPDATE
+                SET watering_interval = EXCLUDED.watering_interval,
+                    created_at = CURRENT_TIMESTAMP
+            """, species, month, interval)
+    
+    async def apply_seasonal_intervals(self, month: int) -> int:
+        """Интервалы полива из seasonal_interval_cache и перенос напоминаний одним запросом
+        
+        Returns:
+            int: количество обновлённых растений
+        """
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(f"""
+                WITH updated AS (
+                    UPDATE plants p
+                    SET watering_interval = c.watering_interval
+                    FROM seasonal_interval_cache c
+                    WHERE c.species = {_PLANT_SPECIES_SQL}
+                      AND c.month = $1
+                      AND c.created_at > CURRENT_TIMESTAMP - make_interval(days => $2)
+                      AND p.plant_type = 'regular'
+                      AND p.reminder_enabled = TRUE
+                      AND p.watering_interval IS DISTINCT FROM c.watering_interval
+                    RETURNING p.id, p.user_id, p.watering_interval AS new_interval
+                ), reminders_upserted AS (
+                    INSERT INTO reminders (user_id, plant_id, reminder_type, next_date, is_active)
+                    SELECT user_id, id, 'watering',
+                           (CURRENT_TIMESTAMP AT TIME ZONE 'Europe/Moscow')
+                               + make_interval(days => new_interval),
+                           TRUE
+                    FROM updated
+                    ON CONFLICT (user_id, plant_id, reminder_type)
+                        WHERE is_active = TRUE AND plant_id IS NOT NULL
+                    DO UPDATE SET next_date = EXCLUDED.next_date,
+                                  created_at = CURRENT_TIMESTAMP,
+                                  last_sent = NULL,
+                                  send_count = 0
+                )
+                SELECT COUNT(*) FROM updated
+            """, month, SEASONAL_CACHE_DAYS)
+    
     async def set_base_watering_interval(self, plant_id: int, base_interval: int):
         """Установить базовый интервал полива"""
         async with self.pool.acquire() as conn:
@@ -958,21 +1200,33 @@ class PlantDatabase:
                 WHERE id = $2
             """, base_interval, plant_id)
     
-    async def get_all_plants_for_seasonal_update(self) -> list:
-        """Получить все растения для сезонной корректировки через GPT"""
+    async def get_species_for_seasonal_update(self, month: int) -> list:
+        """Виды растений для сезонной корректировки и есть ли для них свежий ответ в кэше"""
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch("""
+            rows = await conn.fetch(f"""
                 SELECT 
-                    p.id,
-                    p.user_id,
-                    COALESCE(p.custom_name, p.plant_name, 'Растение #' || p.id) as display_name,
-                    p.plant_name,
-                    p.watering_interval as current_interval
-                FROM plants p
-                WHERE p.plant_type = 'regular'
-                  AND p.reminder_enabled = TRUE
-                ORDER BY p.user_id, p.id
-            """)
+                    s.species,
+                    MIN(s.plant_name) as plant_name,
+                    MODE() WITHIN GROUP (ORDER BY s.current_interval) as current_interval,
+                    COUNT(*) as plants,
+                    bool_or(c.species IS NOT NULL) as cached
+                FROM (
+                    SELECT 
+                        {_PLANT_SPECIES_SQL} as species,
+                        btrim(COALESCE(NULLIF(btrim(p.plant_name), ''), p.custom_name)) as plant_name,
+                        COALESCE(p.watering_interval, 7) as current_interval
+                    FROM plants p
+                    WHERE p.plant_type = 'regular'
+                      AND p.reminder_enabled = TRUE
+                ) s
+                LEFT JOIN seasonal_interval_cache c
+                       ON c.species = s.species
+                      AND c.month = $1
+                      AND c.created_at > CURRENT_TIMESTAMP - make_interval(days => $2)
+                WHERE s.species <> ''
+                GROUP BY s.species
+                ORDER BY s.species
+            """, month, SEASONAL_CACHE_DAYS)
             return [dict(row) for row in rows]
     
     async def get_plant_by_id(self, plant_id: int, user_id: int = None) -> Optional[Dict]:
@@ -1019,7 +1273,9 @@ class PlantDatabase:
                        COALESCE(watering_interval, 5) as watering_interval,
                        COALESCE(reminder_enabled, TRUE) as reminder_enabled,
                        notes, plant_type, growing_id,
-                       current_state, state_changed_date, state_changes_count
+                       current_state, state_changed_date, state_changes_count,
+                       (CURRENT_TIMESTAMP AT TIME ZONE 'Europe/Moscow')::date - last_watered::date
+                           as water_days_ago
                 FROM plants 
                 WHERE user_id = $1 AND (plant_type = 'regular' OR plant_type IS NULL)
                 ORDER BY saved_date DESC
@@ -1087,13 +1343,56 @@ class PlantDatabase:
             
             return plants[:limit]
     
+    async def water_plant_atomic(self, user_id: int, plant_id: int) -> Optional[Dict]:
+        """Отметить полив одного растения одним запросом (с историей и активностью пользователя)
+        
+        Returns:
+            dict с id, display_name и watering_interval или None, если растение не найдено
+        """
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow("""
+                WITH watered AS (
+                    UPDATE plants 
+                    SET last_watered = CURRENT_TIMESTAMP AT TIME ZONE 'Europe/Moscow',
+                        watering_count = COALESCE(watering_count, 0) + 1
+                    WHERE id = $1 AND user_id = $2
+                    RETURNING id, user_id, custom_name, plant_name,
+                              CASE WHEN custom_name IS NULL AND plant_name IS NULL
+                                   THEN analysis END as analysis,
+                              COALESCE(watering_interval, 5) as watering_interval
+                ), history AS (
+                    INSERT INTO care_history (plant_id, user_id, action_type, notes)
+                    SELECT id, user_id, 'watered', 'Растение полито' FROM watered
+                ), activity AS (
+                    UPDATE users
+                    SET last_activity = CURRENT_TIMESTAMP,
+                        last_action = 'watered_plant'
+                    WHERE user_id = $2 AND EXISTS (SELECT 1 FROM watered)
+                )
+                SELECT * FROM watered
+            """, plant_id, user_id)
+            
+            if not row:
+                return None
+            
+            display_name = row['custom_name'] or row['plant_name']
+            if not display_name:
+                extracted_name = self.extract_plant_name_from_analysis(row['analysis'])
+                display_name = extracted_name or f"Растение #{row['id']}"
+            
+            return {
+                'id': row['id'],
+                'display_name': display_name,
+                'watering_interval': row['watering_interval']
+            }
+    
     async def update_watering(self, user_id: int, plant_id: int = None):
         """Отметить полив"""
         async with self.pool.acquire() as conn:
             if plant_id:
                 await conn.execute("""
                     UPDATE plants 
-                    SET last_watered = CURRENT_TIMESTAMP,
+                    SET last_watered = CURRENT_TIMESTAMP AT TIME ZONE 'Europe/Moscow',
                         watering_count = COALESCE(watering_count, 0) + 1
                     WHERE user_id = $1 AND id = $2
                 """, user_id, plant_id)
@@ -1112,7 +1411,7 @@ class PlantDatabase:
                 
                 await conn.execute("""
                     UPDATE plants 
-                    SET last_watered = CURRENT_TIMESTAMP,
+                    SET last_watered = CURRENT_TIMESTAMP AT TIME ZONE 'Europe/Moscow',
                         watering_count = COALESCE(watering_count, 0) + 1
                     WHERE user_id = $1
                 """, user_id)
@@ -1129,6 +1428,49 @@ class PlantDatabase:
             # Обновляем активность пользователя
             await self.update_user_activity(user_id, 'watered_plant')
     
+    async def water_all_plants(self, user_id: int) -> int:
+        """Полить все растения пользователя и перенести их напоминания одним запросом
+        
+        Следующий полив каждого растения - через его watering_interval от текущего
+        московского времени, как в create_plant_reminder.
+        
+        Returns:
+            int: количество политых растений
+        """
+        async with self.pool.acquire() as conn:
+            watered_count = await conn.fetchval("""
+                WITH watered AS (
+                    UPDATE plants 
+                    SET last_watered = CURRENT_TIMESTAMP AT TIME ZONE 'Europe/Moscow',
+                        watering_count = COALESCE(watering_count, 0) + 1
+                    WHERE user_id = $1
+                    RETURNING id, user_id, plant_type, COALESCE(watering_interval, 5) as watering_interval
+                ), history AS (
+                    INSERT INTO care_history (plant_id, user_id, action_type, notes)
+                    SELECT id, user_id, 'watered', 'Растение полито (массовый полив)' FROM watered
+                ), reminders_upserted AS (
+                    INSERT INTO reminders (user_id, plant_id, reminder_type, next_date, is_active)
+                    SELECT user_id, id, 'watering',
+                           (CURRENT_TIMESTAMP AT TIME ZONE 'Europe/Moscow')
+                               + make_interval(days => watering_interval),
+                           TRUE
+                    FROM watered
+                    WHERE plant_type = 'regular' OR plant_type IS NULL
+                    ON CONFLICT (user_id, plant_id, reminder_type)
+                        WHERE is_active = TRUE AND plant_id IS NOT NULL
+                    DO UPDATE SET next_date = EXCLUDED.next_date,
+                                  created_at = CURRENT_TIMESTAMP,
+                                  last_sent = NULL,
+                                  send_count = 0
+                )
+                SELECT COUNT(*) FROM watered
+            """, user_id)
+            
+            # Обновляем активность пользователя
+            await self.update_user_activity(user_id, 'watered_plant', conn=conn)
+            
+            return watered_count
+    
     async def delete_plant(self, user_id: int, plant_id: int):
         """Удалить растение"""
         async with self.pool.acquire() as conn:
@@ -1162,7 +1504,7 @@ class PlantDatabase:
                                  photo_file_id: str = None) -> int:
         """Создать выращиваемое растение"""
         async with self.pool.acquire() as conn:
-            calendar_json = json.dumps(task_calendar) if task_calendar else None
+            calendar_json = _dumps_json(task_calendar) if task_calendar else None
             
             growing_id = await conn.fetchval("""
                 INSERT INTO growing_plants 
@@ -1341,9 +1683,9 @@ class PlantDatabase:
                                 full_analysis: str, confidence: float, identified_species: str,
                                 detected_state: str, detected_problems: dict = None,
                                 recommendations: dict = None, watering_advice: str = None,
-                                lighting_advice: str = None) -> int:
+                                lighting_advice: str = None, conn: asyncpg.Connection = None) -> int:
         """Сохранить полный анализ растения"""
-        async with self.pool.acquire() as conn:
+        async with self._connection(conn) as conn:
             analysis_id = await conn.fetchval("""
                 INSERT INTO plant_analyses_full 
                 (plant_id, user_id, photo_file_id, full_analysis, confidence, 
@@ -1353,12 +1695,12 @@ class PlantDatabase:
                 RETURNING id
             """, plant_id, user_id, photo_file_id, full_analysis, confidence,
                 identified_species, detected_state, 
-                json.dumps(detected_problems) if detected_problems else None,
-                json.dumps(recommendations) if recommendations else None,
+                _dumps_json(detected_problems) if detected_problems else None,
+                _dumps_json(recommendations) if recommendations else None,
                 watering_advice, lighting_advice)
             
             # Обновляем активность пользователя
-            await self.update_user_activity(user_id, 'sent_photo')
+            await self.update_user_activity(user_id, 'sent_photo', conn=conn)
             
             return analysis_id
     
@@ -1384,7 +1726,7 @@ class PlantDatabase:
                 VALUES ($1, $2, $3, $4, $5)
                 RETURNING id
             """, plant_id, user_id, question, answer,
-                json.dumps(context_used) if context_used else None)
+                _dumps_json(context_used) if context_used else None)
             
             # Обновляем активность пользователя
             await self.update_user_activity(user_id, 'asked_question')
@@ -1457,13 +1799,13 @@ class PlantDatabase:
                         occurrences = occurrences + 1,
                         last_updated = CURRENT_TIMESTAMP
                     WHERE id = $3
-                """, json.dumps(pattern_data), new_confidence, existing['id'])
+                """, _dumps_json(pattern_data), new_confidence, existing['id'])
             else:
                 await conn.execute("""
                     INSERT INTO plant_user_patterns
                     (plant_id, user_id, pattern_type, pattern_data, confidence)
                     VALUES ($1, $2, $3, $4, $5)
-                """, plant_id, user_id, pattern_type, json.dumps(pattern_data), confidence)
+                """, plant_id, user_id, pattern_type, _dumps_json(pattern_data), confidence)
     
     async def get_user_patterns(self, plant_id: int, min_confidence: float = 0.3) -> List[Dict]:
         """Получить паттерны ухода пользователя"""
@@ -1498,7 +1840,7 @@ class PlantDatabase:
                 VALUES ($1, $2, $3, $4)
                 RETURNING id
             """, from_user_id, to_user_id, message_text, 
-                json.dumps(context) if context else None)
+                _dumps_json(context) if context else None)
             
             return message_id
     
@@ -230,7 +230,7 @@ async def test_reminders_command(message: types.Message):
         await message.answer(
             f"❌ Эта команда доступна только администраторам\n\n"
             f"🔑 Ваш ID: <code>{user_id}</code>\n"
-            f"👥 Список админов: {ADMIN_USER_IDS}",
+            f"👥 Список админов: {', '.join(map(str, sorted(ADMIN_USER_IDS)))}",
             parse_mode="HTML"
         )
         return
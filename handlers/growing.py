@@ -10,6 +10,7 @@ from keyboards.plant_menu import growing_plant_menu, delete_confirmation
 from keyboards.main_menu import simple_back_menu
 from database import get_db
 from utils.time_utils import get_moscow_now
+from utils.stream_utils import make_message_streamer
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +33,10 @@ async def handle_plant_choice_for_growing(message: types.Message, state: FSMCont
             parse_mode="HTML"
         )
         
-        growing_plan, task_calendar = await generate_growing_plan(plant_name)
+        growing_plan, task_calendar = await generate_growing_plan(
+            plant_name,
+            on_delta=make_message_streamer(processing_msg, f"🧠 Готовлю план выращивания: {plant_name}")
+        )
         
         await processing_msg.delete()
         
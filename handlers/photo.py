@@ -6,11 +6,12 @@ from aiogram.filters import StateFilter
 
 from states.user_states import PlantStates
 from services.ai_service import analyze_plant_image
-from services.plant_service import temp_analyses, update_plant_state_from_photo
+from services.plant_service import set_temp_analysis, update_plant_state_from_photo
 from services.subscription_service import check_limit, increment_usage
 from keyboards.plant_menu import plant_analysis_actions
 from utils.formatters import get_state_recommendations
 from utils.time_utils import get_moscow_now
+from utils.stream_utils import make_message_streamer
 from config import STATE_EMOJI, STATE_NAMES
 
 logger = logging.getLogger(__name__)
@@ -167,7 +168,11 @@ async def handle_photo(message: types.Message, bot):
         
         user_question = message.caption if message.caption else None
         
-        result = await analyze_plant_image(image_bytes, user_question)
+        # Рекомендации показываем по мере генерации, итог придёт отдельным сообщением
+        result = await analyze_plant_image(
+            image_bytes, user_question,
+            on_delta=make_message_streamer(processing_msg, "🔍 Готовлю рекомендации...")
+        )
         
         await processing_msg.delete()
         
@@ -175,7 +180,7 @@ async def handle_photo(message: types.Message, bot):
             # Увеличиваем счётчик использования
             await increment_usage(user_id, 'analyses')
             
-            temp_analyses[user_id] = {
+            set_temp_analysis(user_id, {
                 "analysis": result.get("raw_analysis", result["analysis"]),
                 "formatted_analysis": result["analysis"],
                 "photo_file_id": photo.file_id,
@@ -185,7 +190,7 @@ async def handle_photo(message: types.Message, bot):
                 "confidence": result.get("confidence", 0),
                 "needs_retry": result.get("needs_retry", False),
                 "state_info": result.get("state_info", {})
-            }
+            })
             
             state_info = result.get("state_info", {})
             current_state = state_info.get('current_state', 'healthy')
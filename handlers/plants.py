@@ -6,9 +6,9 @@ from aiogram.filters import StateFilter
 
 from states.user_states import PlantStates
 from services.plant_service import (
-    temp_analyses, save_analyzed_plant, get_user_plants_list, 
+    get_temp_analysis, pop_temp_analysis, save_analyzed_plant, get_user_plants_list, 
     water_plant, water_all_plants, delete_plant, rename_plant,
-    get_plant_details, get_plant_state_history
+    get_plant_details, get_plant_details_with_history
 )
 from services.subscription_service import check_limit
 from keyboards.main_menu import main_menu, simple_back_menu
@@ -16,6 +16,7 @@ from keyboards.plant_menu import plant_control_menu, delete_confirmation
 from config import STATE_EMOJI, STATE_NAMES
 from database import get_db
 from utils.date_parser import parse_user_date, format_date_ago, get_days_offset
+from utils.time_utils import get_moscow_naive_now
 
 logger = logging.getLogger(__name__)
 
@@ -275,13 +276,11 @@ async def view_state_history_callback(callback: types.CallbackQuery):
         plant_id = int(callback.data.split("_")[-1])
         user_id = callback.from_user.id
         
-        details = await get_plant_details(plant_id, user_id)
+        details, history = await get_plant_details_with_history(plant_id, user_id, limit=10)
         if not details:
             await callback.answer("❌ Растение не найдено", show_alert=True)
             return
         
-        history = await get_plant_state_history(plant_id, limit=10)
-        
         text = f"📊 <b>История состояний: {details['plant_name']}</b>\n\n"
         text += f"{details['state_emoji']} <b>Текущее:</b> {details['state_name']}\n"
         text += f"🔄 <b>Всего изменений:</b> {details['state_changes_count']}\n\n"
@@ -486,7 +485,8 @@ async def save_plant_handler(callback: types.CallbackQuery, state: FSMContext):
     
     logger.info(f"💾 save_plant_handler вызван для user_id={user_id}")
     
-    if user_id not in temp_analyses:
+    analysis_data = get_temp_analysis(user_id)
+    if analysis_data is None:
         await callback.message.answer("❌ Нет данных. Сначала проанализируйте растение")
         await callback.answer()
         return
@@ -498,7 +498,6 @@ async def save_plant_handler(callback: types.CallbackQuery, state: FSMContext):
         await send_limit_message(callback, error_msg)
         return
     
-    analysis_data = temp_analyses[user_id]
     plant_name = analysis_data.get("plant_name", "растение")
     
     # Устанавливаем состояние ожидания даты полива
@@ -525,14 +524,14 @@ async def handle_last_water_choice(callback: types.CallbackQuery, state: FSMCont
     user_id = callback.from_user.id
     choice = callback.data.replace("last_water_", "")
     
-    if user_id not in temp_analyses:
+    if get_temp_analysis(user_id) is None:
         await callback.message.answer("❌ Данные потеряны. Проанализируйте растение заново.")
         await state.clear()
         await callback.answer()
         return
     
-    # Определяем дату последнего полива
-    now = datetime.now()
+    # Определяем дату последнего полива (московское время, как хранится last_watered)
+    now = get_moscow_naive_now()
     last_watered = None
     
     if choice == "today":
@@ -558,7 +557,7 @@ async def handle_last_water_text(message: types.Message, state: FSMContext):
     
     logger.info(f"📅 handle_last_water_text вызван для user_id={user_id}, текст='{message.text}'")
     
-    if user_id not in temp_analyses:
+    if get_temp_analysis(user_id) is None:
         await message.reply("❌ Данные потеряны. Проанализируйте растение заново.")
         await state.clear()
         return
@@ -587,13 +586,17 @@ async def handle_last_water_text(message: types.Message, state: FSMContext):
 async def finish_save_plant(message_or_callback, user_id: int, last_watered: datetime, state: FSMContext):
     """Завершение сохранения растения"""
     try:
-        analysis_data = temp_analyses[user_id]
+        analysis_data = get_temp_analysis(user_id)
+        if analysis_data is None:
+            await message_or_callback.answer("❌ Данные потеряны. Проанализируйте растение заново.")
+            await state.clear()
+            return
         
         # Передаём дату последнего полива в save_analyzed_plant
         result = await save_analyzed_plant(user_id, analysis_data, last_watered=last_watered)
         
         if result["success"]:
-            del temp_analyses[user_id]
+            pop_temp_analysis(user_id)
             
             # Формируем сообщение об успехе
             success_text = f"✅ <b>Растение добавлено!</b>\n\n"
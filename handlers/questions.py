@@ -6,11 +6,12 @@ from aiogram.filters import StateFilter
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from states.user_states import PlantStates
-from services.ai_service import answer_plant_question
+from services.ai_service import answer_plant_question, CANNED_ANSWER_MODEL
 from services.subscription_service import check_limit, increment_usage
 from plant_memory import get_plant_context, save_interaction
 from keyboards.main_menu import main_menu
 from database import get_db
+from utils.stream_utils import make_message_streamer
 
 logger = logging.getLogger(__name__)
 
@@ -227,14 +228,17 @@ async def handle_question(message: types.Message, state: FSMContext):
         
         # Если нет контекста растения - проверяем временный анализ
         if not context_text:
-            from services.plant_service import temp_analyses
-            if user_id in temp_analyses:
-                plant_info = temp_analyses[user_id]
+            from services.plant_service import get_temp_analysis
+            plant_info = get_temp_analysis(user_id)
+            if plant_info:
                 temp_plant_name = plant_info.get("plant_name", "растение")
                 context_text = f"Контекст: Недавно анализировал {temp_plant_name}"
         
         # Получаем ответ от AI
-        answer = await answer_plant_question(question_text, context_text)
+        answer = await answer_plant_question(
+            question_text, context_text,
+            on_delta=make_message_streamer(processing_msg, "🤔 Думаю над ответом...", strip_html=True)
+        )
         
         await processing_msg.delete()
         
@@ -253,7 +257,10 @@ async def handle_question(message: types.Message, state: FSMContext):
         if model_name:
             logger.info(f"✅ Ответ от модели: {model_name}")
         
-        if answer_text and len(answer_text) > 50 and not answer_text.startswith("❌"):
+        if model_name == CANNED_ANSWER_MODEL:
+            # Приветствие или пустой вопрос - отвечаем без списания лимита
+            await message.reply(answer_text, reply_markup=question_continue_keyboard())
+        elif answer_text and len(answer_text) > 50 and not answer_text.startswith("❌"):
             # Увеличиваем счётчик использования
             await increment_usage(user_id, 'questions')
             
@@ -4,10 +4,12 @@ Plant Memory Manager - Система управления полным конт
 """
 
 import logging
-import json
+import orjson
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
+from utils.time_utils import get_moscow_naive_now
+
 logger = logging.getLogger(__name__)
 
 class PlantMemoryManager:
@@ -213,7 +215,7 @@ class PlantMemoryManager:
                 # Если это строка JSON, парсим
                 if isinstance(pattern_data, str):
                     try:
-                        pattern_data = json.loads(pattern_data)
+                        pattern_data = orjson.loads(pattern_data)
                     except:
                         pattern_data = {"raw": pattern_data}
                 
@@ -329,7 +331,7 @@ class PlantMemoryManager:
             watering = context.get('watering_info', {})
             if watering.get('last_watered'):
                 try:
-                    days_ago = (datetime.now() - watering['last_watered']).days
+                    days_ago = (get_moscow_naive_now() - watering['last_watered']).days
                     lines.append(f"ПОЛИВ: последний {days_ago} дней назад, интервал {watering.get('watering_interval', 5)} дней")
                 except:
                     lines.append(f"ПОЛИВ: интервал {watering.get('watering_interval', 5)} дней")
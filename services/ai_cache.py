@@ -0,0 +1,80 @@
+"""
+Кэш ответов OpenAI для анализа растений
+Повторный анализ того же фото с теми же параметрами не отправляется в API
+"""
+
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Параметры кэша
+CACHE_MAX_SIZE = 1000
+CACHE_TTL_SECONDS = 24 * 60 * 60  # 24 часа
+
+
+class ResponseCache:
+    """LRU-кэш в памяти с ограничением времени жизни записей"""
+
+    def __init__(self, name: str, maxsize: int = CACHE_MAX_SIZE, ttl: int = CACHE_TTL_SECONDS):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Получить копию результата или None"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        logger.info(f"⚡ Кэш {self.name}: попадание")
+        return dict(value)
+
+    def has(self, key: str) -> bool:
+        """Есть ли живая запись (без копирования и без лога попадания)"""
+        entry = self._data.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def set(self, key: str, value: dict):
+        """Сохранить результат"""
+        self._data[key] = (time.monotonic() + self.ttl, dict(value))
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        """Очистить кэш"""
+        self._data.clear()
+
+
+def make_cache_key(image_data: bytes = None, *parts) -> str:
+    """Ключ кэша: sha256 от изображения и параметров запроса"""
+    digest = hashlib.sha256()
+    if image_data:
+        digest.update(image_data)
+    for part in parts:
+        digest.update(b'\x00')
+        digest.update(str(part if part is not None else '').encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Глобальные экземпляры
+vision_cache = ResponseCache('vision')
+reasoning_cache = ResponseCache('reasoning')
+# Закодированные фото живут недолго: нужны только на время одного анализа с откатами
+image_url_cache = ResponseCache('image', maxsize=16, ttl=10 * 60)
+# Ответы на вопросы: тот же вопрос с той же историей растения в тот же сезон
+answer_cache = ResponseCache('answer')
+# Plant.id / Plant.health: результат для того же фото не меняется, живёт неделю
+plantid_cache = ResponseCache('plantid', ttl=7 * 24 * 60 * 60)
@@ -1,20 +1,257 @@
+import asyncio
 import logging
-import base64
-from openai import AsyncOpenAI
-
-from config import OPENAI_API_KEY, PLANT_IDENTIFICATION_PROMPT
-from utils.image_utils import optimize_image_for_analysis
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from config import PLANT_IDENTIFICATION_PROMPT, GPT5_REASONING_EFFORT
+from services.openai_client import openai_client, vision_semaphore, text_semaphore
+from services.ai_cache import vision_cache, reasoning_cache, image_url_cache, answer_cache, make_cache_key
+from utils.image_utils import encode_image_for_analysis
 from utils.formatters import format_plant_analysis
 from utils.season_utils import get_current_season, get_seasonal_care_tips
 
 logger = logging.getLogger(__name__)
 
-# Инициализация OpenAI клиента
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-
 # Модель GPT-5.1 для reasoning задач
 GPT_5_1_MODEL = "gpt-5.1-2025-11-13"  # Правильный model ID для GPT-5.1
 
+# Лимит ответа reasoning-шага: 2-4 абзаца плюс reasoning при effort=low.
+# Фактический расход пишется в лог (_log_usage) - по нему и подбирать
+REASONING_MAX_COMPLETION_TOKENS = 1500
+# Лимиты текстовых ответов GPT-5.1 (reasoning + ответ). Ответ на вопрос - 4 коротких
+# раздела, план - 4 этапа. Если ответ упёрся в лимит, запрос повторяется с удвоенным
+ANSWER_MAX_COMPLETION_TOKENS = 1000
+PLAN_MAX_COMPLETION_TOKENS = 2000
+
+# Проверка фото до любых запросов к OpenAI
+MIN_IMAGE_BYTES = 1024
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+_IMAGE_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG', b'RIFF')  # JPEG, PNG, WEBP
+
+# Вопросы без содержания: отвечаем сразу, без модели и без списания лимита
+CANNED_ANSWER_MODEL = "canned"
+_TRIVIAL_QUESTIONS = frozenset({
+    'привет', 'здравствуйте', 'здравствуй', 'добрый день', 'добрый вечер', 'доброе утро',
+    'hi', 'hello', 'спасибо', 'спс', 'ок', 'ok', 'ага', 'да', 'нет',
+})
+_TRIVIAL_ANSWER = (
+    "🌱 Здравствуйте! Задайте вопрос о вашем растении - например, "
+    "почему желтеют листья или как часто его поливать."
+)
+
+# Через сколько секунд без ответа основной модели параллельно запускать запасную
+HEDGE_DELAY_SECONDS = 20
+
+# С такой уверенностью vision и без проблем на фото reasoning не вызываем
+FAST_PATH_MIN_CONFIDENCE = 85
+
+# Правила определения состояния: (подстрока, состояние, корректировка полива, подкормка)
+# Порядок важен - проверяются сверху вниз до первого совпадения.
+# None - значение не меняется
+_STATE_RULES = (
+    ('flowering', 'flowering', -2, None),      # Поливать чаще
+    ('цветен', 'flowering', -2, None),
+    ('active_growth', 'active_growth', None, 7),  # Подкормка раз в неделю
+    ('активн', 'active_growth', None, 7),
+    ('dormancy', 'dormancy', 5, None),         # Поливать реже
+    ('покой', 'dormancy', 5, None),
+    ('stress', 'stress', None, None),
+    ('стресс', 'stress', None, None),
+    ('болезн', 'stress', None, None),
+    ('adaptation', 'adaptation', None, None),
+    ('адаптац', 'adaptation', None, None),
+)
+
+# Этап роста: (подстрока, этап), первое совпадение
+_GROWTH_STAGE_RULES = (
+    ('young', 'young'),
+    ('молод', 'young'),
+    ('mature', 'mature'),
+    ('взросл', 'mature'),
+    ('old', 'old'),
+    ('стар', 'old'),
+)
+
+# Рекомендации по подкормке для PLANT_IDENTIFICATION_PROMPT
+_SEASON_FEEDING_NOTES = {
+    'winter': 'Прекратить подкормки или минимизировать до 1 раза в месяц половинной дозой',
+    'spring': 'Начать подкормки с половинной дозы, постепенно увеличивая до полной каждые 2 недели',
+    'summer': 'Регулярные подкормки каждые 1-2 недели полной дозой',
+    'autumn': 'Постепенно сокращать подкормки, с октября прекратить для большинства видов'
+}
+
+# Сезонная корректировка интервала полива, дней
+_SEASON_WATER_ADJUSTMENT_DAYS = {
+    'winter': +5,  # Зимой поливать реже
+    'spring': 0,   # Весной базовый интервал
+    'summer': -2,  # Летом поливать чаще
+    'autumn': +2,  # Осенью начинать сокращать
+}
+
+# ПОЛИВ_АНАЛИЗ: почва не видна или есть проблемы с поливом - интервал нужно уточнить
+_NEEDS_ADJUSTMENT_WORDS = (
+    "не видна", "невозможно оценить",
+    "переувлажн", "перелив", "недополит", "пересушен", "проблем",
+)
+
+# Поля и секции ответа vision-модели (и PLANT_IDENTIFICATION_PROMPT)
+_VISION_FIELD_RE = re.compile(
+    r'^[ \t]*(РАСТЕНИЕ|УВЕРЕННОСТЬ|ЧТО ВИДНО|ВОЗМОЖНЫЕ ПРОБЛЕМЫ):(.*)$',
+    re.MULTILINE
+)
+
+_VISION_SECTIONS = {
+    'ЧТО ВИДНО': 'vision_analysis',
+    'ВОЗМОЖНЫЕ ПРОБЛЕМЫ': 'possible_problems',
+}
+
+# Интервал полива в ответе reasoning-модели
+_WATERING_INTERVAL_RE = re.compile(r'\n?ПОЛИВ_ИНТЕРВАЛ:\s*(\d+)\s*')
+_WATERING_INTERVAL_TAIL_RE = re.compile(r'ПОЛИВ_ИНТЕРВАЛ:\s*(\d+)\s*')
+
+# "Неизвестное растение (возможно, X)" → X
+_UNKNOWN_PAREN_RE = re.compile(r'\((?:возможно,?\s*)?([^)]+)\)', re.IGNORECASE)
+
+# Пометка "(возможно ...)" после названия
+_POSSIBLY_STRIP_RE = re.compile(r'\s*\(возможно[^)]*\)\s*', re.IGNORECASE)
+
+_DIGITS_RE = re.compile(r'\d+')
+
+_DATA_URL_PREFIX = "data:image/jpeg;base64,"
+
+# Поля анализа, разбираемые extract_plant_state_from_analysis и extract_watering_info
+_FIELD_RE = re.compile(
+    r'^[ \t]*(ТЕКУЩЕЕ_СОСТОЯНИЕ|ПРИЧИНА_СОСТОЯНИЯ|ЭТАП_РОСТА|ДИНАМИЧЕСКИЕ_РЕКОМЕНДАЦИИ'
+    r'|ПОЛИВ_ИНТЕРВАЛ|ПОЛИВ_АНАЛИЗ|ПОЛИВ_РЕКОМЕНДАЦИИ):(.*)$',
+    re.MULTILINE
+)
+
+
+# Календарь задач выращивания (упрощенная версия, одинаков для всех растений)
+_DEFAULT_TASK_CALENDAR = {
+    "stage_1": {
+        "name": "Подготовка и посадка",
+        "duration_days": 7,
+        "tasks": [
+            {"day": 1, "title": "Посадка", "description": "Посадите семена/черенок", "icon": "🌱"},
+            {"day": 3, "title": "Первый полив", "description": "Умеренно полейте", "icon": "💧"},
+            {"day": 7, "title": "Проверка", "description": "Проверьте влажность", "icon": "🔍"},
+        ]
+    },
+    "stage_2": {
+        "name": "Прорастание",
+        "duration_days": 14,
+        "tasks": [
+            {"day": 10, "title": "Первые всходы", "description": "Проверьте появление ростков", "icon": "🌱"},
+            {"day": 14, "title": "Регулярный полив", "description": "Поддерживайте влажность", "icon": "💧"},
+        ]
+    },
+    "stage_3": {
+        "name": "Активный рост",
+        "duration_days": 30,
+        "tasks": [
+            {"day": 21, "title": "Первая подкормка", "description": "Внесите удобрение", "icon": "🍽️"},
+            {"day": 35, "title": "Проверка роста", "description": "Оцените развитие растения", "icon": "📊"},
+        ]
+    },
+    "stage_4": {
+        "name": "Взрослое растение",
+        "duration_days": 30,
+        "tasks": [
+            {"day": 50, "title": "Пересадка", "description": "Пересадите в больший горшок", "icon": "🪴"},
+            {"day": 60, "title": "Формирование", "description": "При необходимости обрежьте", "icon": "✂️"},
+        ]
+    }
+}
+
+
+@dataclass
+class VisionParse:
+    """Разобранный ответ vision-модели"""
+    plant_name: str = "Неизвестное растение"
+    confidence: Optional[float] = None  # None - строки нет или число не распознано
+    has_confidence_line: bool = False
+    vision_analysis: str = ""
+    possible_problems: str = ""
+
+
+def _clean_plant_name(raw_name: str) -> str:
+    """Очистить название: 'Неизвестное растение (возможно, X)' → 'X', убрать '(возможно)'"""
+    if "(" not in raw_name:
+        return raw_name
+    if "неизвестное растение" in raw_name.lower():
+        match = _UNKNOWN_PAREN_RE.search(raw_name)
+        return match.group(1).strip() if match else raw_name
+    return _POSSIBLY_STRIP_RE.sub('', raw_name).strip() or raw_name
+
+
+def _parse_vision_response(raw: str) -> VisionParse:
+    """Разобрать ответ за один проход по заголовкам полей"""
+    parsed = VisionParse()
+    matches = list(_VISION_FIELD_RE.finditer(raw))
+    name_found = False
+    
+    for index, match in enumerate(matches):
+        field, value = match.group(1), match.group(2).strip()
+        
+        if field == 'РАСТЕНИЕ':
+            if not name_found:
+                parsed.plant_name = _clean_plant_name(value)
+                name_found = True
+        elif field == 'УВЕРЕННОСТЬ':
+            parsed.has_confidence_line = True
+            try:
+                parsed.confidence = float(value.replace("%", "").strip())
+            except ValueError:
+                parsed.confidence = None
+        else:
+            # Секция продолжается до следующего заголовка
+            end = matches[index + 1].start() if index + 1 < len(matches) else len(raw)
+            body_lines = [value] + [line.strip() for line in raw[match.end():end].split('\n')]
+            setattr(parsed, _VISION_SECTIONS[field], '\n'.join(body_lines).strip())
+    
+    return parsed
+
+
+def _apply_current_state(state_info: dict, value: str):
+    state_text = value.lower()
+    # Определяем состояние: первое совпадение по таблице, иначе healthy
+    state_info['current_state'] = 'healthy'
+    for needle, state, watering_adj, feeding_adj in _STATE_RULES:
+        if needle in state_text:
+            state_info['current_state'] = state
+            if watering_adj is not None:
+                state_info['watering_adjustment'] = watering_adj
+            if feeding_adj is not None:
+                state_info['feeding_adjustment'] = feeding_adj
+            break
+
+
+def _apply_growth_stage(state_info: dict, value: str):
+    stage_text = value.lower()
+    for needle, stage in _GROWTH_STAGE_RULES:
+        if needle in stage_text:
+            state_info['growth_stage'] = stage
+            break
+
+
+def _apply_state_reason(state_info: dict, value: str):
+    state_info['state_reason'] = value
+
+
+def _apply_recommendations(state_info: dict, value: str):
+    state_info['recommendations'] = value
+
+
+_STATE_FIELD_HANDLERS = {
+    'ТЕКУЩЕЕ_СОСТОЯНИЕ': _apply_current_state,
+    'ПРИЧИНА_СОСТОЯНИЯ': _apply_state_reason,
+    'ЭТАП_РОСТА': _apply_growth_stage,
+    'ДИНАМИЧЕСКИЕ_РЕКОМЕНДАЦИИ': _apply_recommendations,
+}
+
 
 def extract_plant_state_from_analysis(raw_analysis: str) -> dict:
     """Извлечь информацию о состоянии из анализа AI"""
@@ -30,48 +267,40 @@ def extract_plant_state_from_analysis(raw_analysis: str) -> dict:
     if not raw_analysis:
         return state_info
     
-    lines = raw_analysis.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        
-        if line.startswith("ТЕКУЩЕЕ_СОСТОЯНИЕ:"):
-            state_text = line.replace("ТЕКУЩЕЕ_СОСТОЯНИЕ:", "").strip().lower()
-            # Определяем состояние
-            if 'flowering' in state_text or 'цветен' in state_text:
-                state_info['current_state'] = 'flowering'
-                state_info['watering_adjustment'] = -2  # Поливать чаще
-            elif 'active_growth' in state_text or 'активн' in state_text:
-                state_info['current_state'] = 'active_growth'
-                state_info['feeding_adjustment'] = 7  # Подкормка раз в неделю
-            elif 'dormancy' in state_text or 'покой' in state_text:
-                state_info['current_state'] = 'dormancy'
-                state_info['watering_adjustment'] = 5  # Поливать реже
-            elif 'stress' in state_text or 'стресс' in state_text or 'болезн' in state_text:
-                state_info['current_state'] = 'stress'
-            elif 'adaptation' in state_text or 'адаптац' in state_text:
-                state_info['current_state'] = 'adaptation'
-            else:
-                state_info['current_state'] = 'healthy'
-        
-        elif line.startswith("ПРИЧИНА_СОСТОЯНИЯ:"):
-            state_info['state_reason'] = line.replace("ПРИЧИНА_СОСТОЯНИЯ:", "").strip()
-        
-        elif line.startswith("ЭТАП_РОСТА:"):
-            stage_text = line.replace("ЭТАП_РОСТА:", "").strip().lower()
-            if 'young' in stage_text or 'молод' in stage_text:
-                state_info['growth_stage'] = 'young'
-            elif 'mature' in stage_text or 'взросл' in stage_text:
-                state_info['growth_stage'] = 'mature'
-            elif 'old' in stage_text or 'стар' in stage_text:
-                state_info['growth_stage'] = 'old'
-        
-        elif line.startswith("ДИНАМИЧЕСКИЕ_РЕКОМЕНДАЦИИ:"):
-            state_info['recommendations'] = line.replace("ДИНАМИЧЕСКИЕ_РЕКОМЕНДАЦИИ:", "").strip()
+    for match in _FIELD_RE.finditer(raw_analysis):
+        handler = _STATE_FIELD_HANDLERS.get(match.group(1))
+        if handler:
+            handler(state_info, match.group(2).strip())
     
     return state_info
 
 
+def _apply_watering_interval(watering_info: dict, value: str):
+    numbers = _DIGITS_RE.findall(value)
+    if numbers:
+        interval = int(numbers[0])
+        if 2 <= interval <= 28:
+            watering_info["interval_days"] = interval
+
+
+def _apply_watering_analysis(watering_info: dict, value: str):
+    watering_info["current_state"] = value
+    value_lower = value.lower()
+    if any(word in value_lower for word in _NEEDS_ADJUSTMENT_WORDS):
+        watering_info["needs_adjustment"] = True
+
+
+def _apply_watering_recommendations(watering_info: dict, value: str):
+    watering_info["personal_recommendations"] = value
+
+
+_WATERING_FIELD_HANDLERS = {
+    'ПОЛИВ_ИНТЕРВАЛ': _apply_watering_interval,
+    'ПОЛИВ_АНАЛИЗ': _apply_watering_analysis,
+    'ПОЛИВ_РЕКОМЕНДАЦИИ': _apply_watering_recommendations,
+}
+
+
 def extract_watering_info(analysis_text: str) -> dict:
     """Извлечь информацию о поливе"""
     watering_info = {
@@ -84,38 +313,24 @@ def extract_watering_info(analysis_text: str) -> dict:
     if not analysis_text:
         return watering_info
     
-    lines = analysis_text.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        
-        if line.startswith("ПОЛИВ_ИНТЕРВАЛ:"):
-            interval_text = line.replace("ПОЛИВ_ИНТЕРВАЛ:", "").strip()
-            import re
-            numbers = re.findall(r'\d+', interval_text)
-            if numbers:
-                try:
-                    interval = int(numbers[0])
-                    if 2 <= interval <= 28:
-                        watering_info["interval_days"] = interval
-                except:
-                    pass
-        
-        elif line.startswith("ПОЛИВ_АНАЛИЗ:"):
-            current_state = line.replace("ПОЛИВ_АНАЛИЗ:", "").strip()
-            watering_info["current_state"] = current_state
-            if "не видна" in current_state.lower() or "невозможно оценить" in current_state.lower():
-                watering_info["needs_adjustment"] = True
-            elif any(word in current_state.lower() for word in ["переувлажн", "перелив", "недополит", "пересушен", "проблем"]):
-                watering_info["needs_adjustment"] = True
-        
-        elif line.startswith("ПОЛИВ_РЕКОМЕНДАЦИИ:"):
-            recommendations = line.replace("ПОЛИВ_РЕКОМЕНДАЦИИ:", "").strip()
-            watering_info["personal_recommendations"] = recommendations
+    for match in _FIELD_RE.finditer(analysis_text):
+        handler = _WATERING_FIELD_HANDLERS.get(match.group(1))
+        if handler:
+            handler(watering_info, match.group(2).strip())
             
     return watering_info
 
 
+def get_default_watering_interval(season_info: dict) -> int:
+    """Default интервал полива в зависимости от сезона"""
+    season = season_info.get('season')
+    if season == 'summer':
+        return 7
+    if season == 'winter':
+        return 12
+    return 10  # Безопасный default для весны и осени
+
+
 def extract_and_remove_watering_interval(text: str, season_info: dict) -> tuple:
     """
     Извлечь интервал полива из текста и удалить эту строку.
@@ -127,21 +342,22 @@ def extract_and_remove_watering_interval(text: str, season_info: dict) -> tuple:
     Returns:
         tuple: (interval: int, clean_text: str)
     """
-    import re
-    
-    # Default интервал зависит от сезона
-    default_interval = 10  # Безопасный default для зимы
-    if season_info.get('season') == 'summer':
-        default_interval = 7
-    elif season_info.get('season') == 'winter':
-        default_interval = 12
+    default_interval = get_default_watering_interval(season_info)
     
     interval = default_interval
     clean_text = text
     
-    # Ищем строку ПОЛИВ_ИНТЕРВАЛ: число
-    pattern = r'\n?ПОЛИВ_ИНТЕРВАЛ:\s*(\d+)\s*'
-    match = re.search(pattern, text)
+    # Строка ПОЛИВ_ИНТЕРВАЛ по инструкции идёт последней - сначала проверяем конец текста
+    tail_start = text.rfind("ПОЛИВ_ИНТЕРВАЛ:")
+    if tail_start >= 0:
+        match = _WATERING_INTERVAL_TAIL_RE.match(text, tail_start)
+        if match and match.end() == len(text):
+            interval = max(3, min(28, int(match.group(1))))
+            logger.info(f"💧 Извлечён интервал полива: {interval} дней")
+            return interval, text[:tail_start].strip()
+    
+    # Ищем строку ПОЛИВ_ИНТЕРВАЛ: число в любом месте
+    match = _WATERING_INTERVAL_RE.search(text)
     
     if match:
         try:
@@ -154,34 +370,15 @@ def extract_and_remove_watering_interval(text: str, season_info: dict) -> tuple:
             interval = default_interval
         
         # Удаляем строку из текста
-        clean_text = re.sub(pattern, '', text).strip()
+        clean_text = _WATERING_INTERVAL_RE.sub('', text).strip()
     else:
         logger.warning(f"⚠️ Строка ПОЛИВ_ИНТЕРВАЛ не найдена, используем default: {default_interval}")
     
     return interval, clean_text
 
 
-async def analyze_vision_step(image_data: bytes, user_question: str = None, previous_state: str = None) -> dict:
-    """ШАГ 1: Vision анализ через GPT-4o - что видно, проблемы, уверенность
-    
-    Returns:
-        dict: {
-            "success": bool,
-            "vision_analysis": str,  # Что видно на фото
-            "possible_problems": str,  # Возможные проблемы
-            "confidence": float,  # Уровень уверенности 0-100
-            "plant_name": str,
-            "raw_observations": str  # Сырые наблюдения для передачи в reasoning
-        }
-    """
-    if not openai_client:
-        return {"success": False, "error": "OpenAI API недоступен"}
-    
-    try:
-        optimized_image = await optimize_image_for_analysis(image_data, high_quality=True)
-        base64_image = base64.b64encode(optimized_image).decode('utf-8')
-        
-        vision_prompt = """Вы - профессиональный ботаник-диагност. Проанализируйте фотографию растения и опишите ТОЛЬКО то, что видно на изображении.
+# Промпт vision-шага; вопрос и предыдущее состояние дописываются в конец
+_VISION_PROMPT = """Вы - профессиональный ботаник-диагност. Проанализируйте фотографию растения и опишите ТОЛЬКО то, что видно на изображении.
 
 ВАША ЗАДАЧА:
 1. Опишите что видно на фото (морфология, состояние листьев, стеблей, цветов)
@@ -207,6 +404,93 @@ async def analyze_vision_step(image_data: bytes, user_question: str = None, prev
 - Описывайте ТОЛЬКО то, что реально видно на фото
 - Если что-то не видно - укажите "не видно на фото"
 - Будьте объективны и точны"""
+
+
+# System-промпт reasoning-шага. Не зависит от запроса, поэтому OpenAI
+# кэширует его как общий префикс - не подставлять сюда данные пользователя
+_REASONING_SYSTEM_PROMPT = """Вы - профессиональный ботаник-консультант с многолетним опытом. Ваша задача - проанализировать визуальные наблюдения и дать глубокое объяснение с планом действий.
+
+СТИЛЬ ОБЩЕНИЯ:
+- Авторитетный, экспертный, но доступный
+- Конкретные рекомендации на основе фактов
+- Обращение на "вы" (профессиональное)
+- Структурированные ответы: диагноз → причина → решение
+
+ВАЖНО: НЕ ИСПОЛЬЗУЙТЕ markdown форматирование (**, *, _). Пишите обычным текстом.
+
+КРИТИЧЕСКИ ВАЖНО: Всегда учитывайте текущий сезон и время года при рекомендациях по поливу и уходу!
+Зимой полив значительно сокращается, летом увеличивается. Игнорирование сезона может погубить растение.
+
+ВАША ЗАДАЧА:
+1. ОБЪЯСНИТЕ ПОЧЕМУ - проанализируйте визуальные наблюдения и объясните причины проблем или текущего состояния
+2. ДАЙТЕ ПЛАН ДЕЙСТВИЙ - конкретные шаги для решения проблем или улучшения состояния
+3. АДАПТИРУЙТЕ ПОД УСЛОВИЯ - учтите сезон, условия содержания (дом), частоту полива
+
+ФОРМАТ ОТВЕТА (2-4 абзаца БЕЗ нумерации и markdown):
+
+Абзац 1: ОБЪЯСНЕНИЕ ПОЧЕМУ - диагноз ситуации на основе визуальных наблюдений
+Абзац 2: ПЛАН ДЕЙСТВИЙ - конкретные шаги с параметрами (температура, частота, количество)
+Абзац 3: АДАПТАЦИЯ - как адаптировать уход под текущий сезон и условия
+Абзац 4 (при необходимости): КОНТРОЛЬ - когда ожидать результат
+
+ОБЯЗАТЕЛЬНО учитывайте текущий сезон в рекомендациях по поливу и уходу!
+
+ТИПИЧНЫЕ ИНТЕРВАЛЫ ПОЛИВА ДЛЯ ЗИМЫ:
+- Суккуленты, кактусы: 21-28 дней
+- Фикусы, монстеры: 12-16 дней  
+- Спатифиллум, папоротники: 7-10 дней
+- Драцены, юкки: 14-21 дней
+- Пальмы: 12-16 дней
+
+В САМОМ КОНЦЕ ответа ОБЯЗАТЕЛЬНО добавьте отдельной строкой:
+ПОЛИВ_ИНТЕРВАЛ: [число от 3 до 28]
+
+Это число - рекомендуемый интервал полива в днях с учётом вида растения и текущего сезона (указан в запросе)."""
+
+
+async def _prepare_image_url(image_data: bytes) -> str:
+    """
+    Оптимизировать фото и собрать data URL для vision-запроса
+    
+    При откате на analyze_with_openai_advanced то же фото не
+    оптимизируется и не кодируется повторно.
+    """
+    key = make_cache_key(image_data)
+    cached = image_url_cache.get(key)
+    if cached:
+        return cached['url']
+    
+    image_url = _DATA_URL_PREFIX + await encode_image_for_analysis(image_data, high_quality=True)
+    image_url_cache.set(key, {'url': image_url})
+    return image_url
+
+
+async def analyze_vision_step(image_data: bytes, user_question: str = None, previous_state: str = None) -> dict:
+    """ШАГ 1: Vision анализ через GPT-4o - что видно, проблемы, уверенность
+    
+    Returns:
+        dict: {
+            "success": bool,
+            "vision_analysis": str,  # Что видно на фото
+            "possible_problems": str,  # Возможные проблемы
+            "confidence": float,  # Уровень уверенности 0-100
+            "plant_name": str,
+            "raw_observations": str  # Сырые наблюдения для передачи в reasoning
+        }
+    """
+    if not openai_client:
+        return {"success": False, "error": "OpenAI API недоступен"}
+    
+    # Повторный анализ того же фото берём из кэша
+    cache_key = make_cache_key(image_data, "gpt-4o", user_question, previous_state)
+    cached = vision_cache.get(cache_key)
+    if cached:
+        return cached
+    
+    try:
+        image_url = await _prepare_image_url(image_data)
+        
+        vision_prompt = _VISION_PROMPT
         
         if previous_state:
             vision_prompt += f"\n\nПредыдущее состояние растения: {previous_state}. Обратите внимание на изменения."
@@ -215,30 +499,31 @@ async def analyze_vision_step(image_data: bytes, user_question: str = None, prev
             vision_prompt += f"\n\nДополнительный вопрос пользователя: {user_question}"
         
         logger.info("📸 Vision анализ: использую модель GPT-4o")
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Вы - профессиональный ботаник-диагност. Анализируйте только визуальные признаки на фотографии. Будьте точны и объективны."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": vision_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                                "detail": "high"
+        async with vision_semaphore:
+            response = await openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Вы - профессиональный ботаник-диагност. Анализируйте только визуальные признаки на фотографии. Будьте точны и объективны."
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": vision_prompt},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": image_url,
+                                    "detail": "high"
+                                }
                             }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000,
-            temperature=0.2
-        )
+                        ]
+                    }
+                ],
+                max_tokens=1000,
+                temperature=0.2
+            )
         
         raw_vision = response.choices[0].message.content
         
@@ -246,49 +531,11 @@ async def analyze_vision_step(image_data: bytes, user_question: str = None, prev
             raise Exception("Некачественный ответ от vision модели")
         
         # Извлекаем данные из ответа
-        plant_name = "Неизвестное растение"
-        confidence = 50
-        vision_analysis = ""
-        possible_problems = ""
-        
-        lines = raw_vision.split('\n')
-        current_section = None
-        
-        for line in lines:
-            line = line.strip()
-            
-            if line.startswith("РАСТЕНИЕ:"):
-                raw_name = line.replace("РАСТЕНИЕ:", "").strip()
-                # Очищаем от "Неизвестное растение (возможно, X)" → "X"
-                import re
-                if "неизвестное растение" in raw_name.lower() and "(" in raw_name:
-                    # Извлекаем то что в скобках
-                    match = re.search(r'\((?:возможно,?\s*)?([^)]+)\)', raw_name, re.IGNORECASE)
-                    if match:
-                        plant_name = match.group(1).strip()
-                    else:
-                        plant_name = raw_name
-                else:
-                    # Убираем "(возможно)" если есть
-                    plant_name = re.sub(r'\s*\(возможно[^)]*\)\s*', '', raw_name, flags=re.IGNORECASE).strip()
-                    if not plant_name:
-                        plant_name = raw_name
-            elif line.startswith("УВЕРЕННОСТЬ:"):
-                try:
-                    conf_str = line.replace("УВЕРЕННОСТЬ:", "").strip().replace("%", "")
-                    confidence = float(conf_str)
-                except:
-                    confidence = 50
-            elif line.startswith("ЧТО ВИДНО:"):
-                current_section = "vision"
-                vision_analysis = line.replace("ЧТО ВИДНО:", "").strip() + "\n"
-            elif line.startswith("ВОЗМОЖНЫЕ ПРОБЛЕМЫ:"):
-                current_section = "problems"
-                possible_problems = line.replace("ВОЗМОЖНЫЕ ПРОБЛЕМЫ:", "").strip() + "\n"
-            elif current_section == "vision":
-                vision_analysis += line + "\n"
-            elif current_section == "problems":
-                possible_problems += line + "\n"
+        parsed = _parse_vision_response(raw_vision)
+        plant_name = parsed.plant_name
+        confidence = parsed.confidence if parsed.confidence is not None else 50
+        vision_analysis = parsed.vision_analysis
+        possible_problems = parsed.possible_problems
         
         # Если не удалось извлечь структурированно, используем весь текст
         if not vision_analysis:
@@ -296,7 +543,7 @@ async def analyze_vision_step(image_data: bytes, user_question: str = None, prev
         
         logger.info(f"✅ Vision анализ завершен (модель: GPT-4o, растение={plant_name}, уверенность={confidence}%)")
         
-        return {
+        result = {
             "success": True,
             "vision_analysis": vision_analysis.strip(),
             "possible_problems": possible_problems.strip() if possible_problems else "Проблем не обнаружено",
@@ -304,19 +551,121 @@ async def analyze_vision_step(image_data: bytes, user_question: str = None, prev
             "plant_name": plant_name,
             "raw_observations": raw_vision
         }
+        vision_cache.set(cache_key, result)
+        return result
         
     except Exception as e:
         logger.error(f"❌ Vision анализ ошибка: {e}", exc_info=True)
         return {"success": False, "error": str(e)}
 
 
-async def analyze_reasoning_step(vision_result: dict, plant_context: str = None, user_question: str = None) -> dict:
+@lru_cache(maxsize=8)
+def _seasonal_block(season_ru: str, month_name_ru: str, growth_phase: str, light_hours: str,
+                    watering_adjustment: str, recommendations: str) -> str:
+    return f"""ТЕКУЩИЙ СЕЗОН: {season_ru} ({month_name_ru})
+ФАЗА РОСТА: {growth_phase}
+СВЕТОВОЙ ДЕНЬ: {light_hours}
+КОРРЕКТИРОВКА ПОЛИВА: {watering_adjustment}
+
+СЕЗОННЫЕ ОСОБЕННОСТИ:
+{recommendations}"""
+
+
+def _build_seasonal_block(season_info: dict) -> str:
+    """Блок о текущем сезоне для промптов; собирается один раз на месяц"""
+    return _seasonal_block(
+        season_info['season_ru'], season_info['month_name_ru'], season_info['growth_phase'],
+        season_info['light_hours'], season_info['watering_adjustment'], season_info['recommendations']
+    )
+
+
+def _build_reasoning_prompt(season_info: dict, plant_context: str = None, user_question: str = None) -> str:
+    """Часть промпта reasoning, не зависящая от результата vision (сезон, история, вопрос)"""
+    seasonal_context = _build_seasonal_block(season_info)
+    
+    # Сезон меняется реже всего - идёт первым, вопрос пользователя - последним
+    return f"""{seasonal_context}
+
+ИСТОРИЯ РАСТЕНИЯ:
+{plant_context if plant_context else "Контекст отсутствует"}
+
+{f'ВОПРОС ПОЛЬЗОВАТЕЛЯ: {user_question}' if user_question else ''}"""
+
+
+def _prepare_reasoning(plant_context: str = None, user_question: str = None) -> tuple:
+    """Подготовка данных для reasoning до завершения vision: (season_info, prompt_context)"""
+    season_info = get_current_season()
+    return season_info, _build_reasoning_prompt(season_info, plant_context, user_question)
+
+
+def _log_usage(response, model: str):
+    """Расход токенов: сколько промпта взято из кэша префиксов и сколько ушло на reasoning"""
+    usage = response.usage
+    if not usage:
+        return
+    prompt_details = getattr(usage, 'prompt_tokens_details', None)
+    completion_details = getattr(usage, 'completion_tokens_details', None)
+    cached_tokens = getattr(prompt_details, 'cached_tokens', 0) or 0
+    reasoning_tokens = getattr(completion_details, 'reasoning_tokens', 0) or 0
+    logger.info(
+        f"🗄️ {model}: prompt {usage.prompt_tokens} (из кэша {cached_tokens}), "
+        f"ответ {usage.completion_tokens} (reasoning {reasoning_tokens})"
+    )
+
+
+async def _stream_completion(params: dict, on_delta, stop_marker: str = None) -> tuple:
+    """
+    Получить ответ потоком, передавая накопленный текст в on_delta
+    
+    Текст начиная со stop_marker (служебные строки в конце ответа) в on_delta
+    не попадает. Ошибка в on_delta не прерывает генерацию.
+    
+    Returns:
+        tuple: (text, finish_reason)
+    """
+    stream = await openai_client.chat.completions.create(
+        **params, stream=True, stream_options={"include_usage": True}
+    )
+    
+    parts = []
+    finish_reason = None
+    async for chunk in stream:
+        if chunk.usage:
+            _log_usage(chunk, params["model"])
+        if not chunk.choices:
+            continue
+        if chunk.choices[0].finish_reason:
+            finish_reason = chunk.choices[0].finish_reason
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        parts.append(delta)
+        
+        visible = ''.join(parts)
+        if stop_marker:
+            marker_pos = visible.find(stop_marker)
+            if marker_pos >= 0:
+                visible = visible[:marker_pos]
+        try:
+            await on_delta(visible)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка в on_delta: {e}")
+    
+    return ''.join(parts), finish_reason
+
+
+async def analyze_reasoning_step(vision_result: dict, plant_context: str = None, user_question: str = None,
+                                 season_info: dict = None, prompt_context: str = None,
+                                 on_delta=None) -> dict:
     """ШАГ 2: Reasoning через GPT-5.1 - объясняет почему, план действий, адаптация
     
     Args:
         vision_result: Результат от analyze_vision_step
         plant_context: Контекст истории растения (опционально)
         user_question: Вопрос пользователя (опционально)
+        season_info: Заранее полученная информация о сезоне (опционально)
+        prompt_context: Заранее собранная часть промпта из _build_reasoning_prompt (опционально)
+        on_delta: async-callback, получает накопленный текст ответа по мере генерации (опционально)
     
     Returns:
         dict: {
@@ -332,86 +681,50 @@ async def analyze_reasoning_step(vision_result: dict, plant_context: str = None,
         return {"success": False, "error": "OpenAI API недоступен"}
     
     try:
-        # Получаем информацию о сезоне
-        season_info = get_current_season()
+        # Сезон и не зависящая от vision часть промпта могли быть подготовлены заранее
+        if season_info is None:
+            season_info = get_current_season()
+        if prompt_context is None:
+            prompt_context = _build_reasoning_prompt(season_info, plant_context, user_question)
         
-        seasonal_context = f"""
-ТЕКУЩИЙ СЕЗОН: {season_info['season_ru']} ({season_info['month_name_ru']})
-ФАЗА РОСТА: {season_info['growth_phase']}
-СВЕТОВОЙ ДЕНЬ: {season_info['light_hours']}
-КОРРЕКТИРОВКА ПОЛИВА: {season_info['watering_adjustment']}
+        # Постоянная часть промпта целиком в system, переменные данные - в конце user:
+        # так OpenAI переиспользует закэшированный префикс между запросами
+        system_prompt = _REASONING_SYSTEM_PROMPT
+        user_prompt = f"""{prompt_context}
 
-СЕЗОННЫЕ ОСОБЕННОСТИ:
-{season_info['recommendations']}
-"""
+ВИЗУАЛЬНЫЕ НАБЛЮДЕНИЯ (от vision модели):
+{vision_result.get('raw_observations', '')}"""
         
-        system_prompt = """Вы - профессиональный ботаник-консультант с многолетним опытом. Ваша задача - проанализировать визуальные наблюдения и дать глубокое объяснение с планом действий.
-
-СТИЛЬ ОБЩЕНИЯ:
-- Авторитетный, экспертный, но доступный
-- Конкретные рекомендации на основе фактов
-- Обращение на "вы" (профессиональное)
-- Структурированные ответы: диагноз → причина → решение
-
-ВАЖНО: НЕ ИСПОЛЬЗУЙТЕ markdown форматирование (**, *, _). Пишите обычным текстом.
-
-КРИТИЧЕСКИ ВАЖНО: Всегда учитывайте текущий сезон и время года при рекомендациях по поливу и уходу!
-Зимой полив значительно сокращается, летом увеличивается. Игнорирование сезона может погубить растение."""
-
-        user_prompt = f"""ВИЗУАЛЬНЫЕ НАБЛЮДЕНИЯ (от vision модели):
-{vision_result.get('raw_observations', '')}
-
-ЧТО ВИДНО: {vision_result.get('vision_analysis', '')}
-ВОЗМОЖНЫЕ ПРОБЛЕМЫ: {vision_result.get('possible_problems', '')}
-УВЕРЕННОСТЬ: {vision_result.get('confidence', 50)}%
-
-ИСТОРИЯ РАСТЕНИЯ:
-{plant_context if plant_context else "Контекст отсутствует"}
-
-{seasonal_context}
-
-{f'ВОПРОС ПОЛЬЗОВАТЕЛЯ: {user_question}' if user_question else ''}
-
-ВАША ЗАДАЧА:
-1. ОБЪЯСНИТЕ ПОЧЕМУ - проанализируйте визуальные наблюдения и объясните причины проблем или текущего состояния
-2. ДАЙТЕ ПЛАН ДЕЙСТВИЙ - конкретные шаги для решения проблем или улучшения состояния
-3. АДАПТИРУЙТЕ ПОД УСЛОВИЯ - учтите сезон, условия содержания (дом), частоту полива
-
-ФОРМАТ ОТВЕТА (2-4 абзаца БЕЗ нумерации и markdown):
-
-Абзац 1: ОБЪЯСНЕНИЕ ПОЧЕМУ - диагноз ситуации на основе визуальных наблюдений
-Абзац 2: ПЛАН ДЕЙСТВИЙ - конкретные шаги с параметрами (температура, частота, количество)
-Абзац 3: АДАПТАЦИЯ - как адаптировать уход под текущий сезон и условия
-Абзац 4 (при необходимости): КОНТРОЛЬ - когда ожидать результат
-
-ОБЯЗАТЕЛЬНО учитывайте текущий сезон в рекомендациях по поливу и уходу!
-
-ТИПИЧНЫЕ ИНТЕРВАЛЫ ПОЛИВА ДЛЯ ЗИМЫ:
-- Суккуленты, кактусы: 21-28 дней
-- Фикусы, монстеры: 12-16 дней  
-- Спатифиллум, папоротники: 7-10 дней
-- Драцены, юкки: 14-21 дней
-- Пальмы: 12-16 дней
-
-В САМОМ КОНЦЕ ответа ОБЯЗАТЕЛЬНО добавьте отдельной строкой:
-ПОЛИВ_ИНТЕРВАЛ: [число от 3 до 28]
-
-Это число - рекомендуемый интервал полива в днях с учётом вида растения и текущего сезона ({season_info['season_ru']})."""
+        cache_key = make_cache_key(None, system_prompt, user_prompt)
+        cached = reasoning_cache.get(cache_key)
+        if cached:
+            return cached
         
         # Используем GPT-5.1 для reasoning (Chat Completions API)
         logger.info(f"🧠 Reasoning анализ: использую модель {GPT_5_1_MODEL}")
-        response = await openai_client.chat.completions.create(
-            model=GPT_5_1_MODEL,
-            messages=[
+        reasoning_params = {
+            "model": GPT_5_1_MODEL,
+            "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            max_completion_tokens=4000,  # GPT-5.1 тратит токены на reasoning + ответ
-            extra_body={"reasoning_effort": "low"}
+            "max_completion_tokens": REASONING_MAX_COMPLETION_TOKENS,
+            "extra_body": {"reasoning_effort": GPT5_REASONING_EFFORT}
             # GPT-5.1 не поддерживает temperature
+        }
+        reasoning_text, finish_reason = await _request_text_completion(
+            reasoning_params, on_delta, stop_marker="\nПОЛИВ"
         )
-        
-        reasoning_text = response.choices[0].message.content
+        # Reasoning-токены effort=low тратятся из того же лимита: обрезанный ответ теряет
+        # строку ПОЛИВ_ИНТЕРВАЛ, поэтому повторяем с удвоенным лимитом, как _run_text_completion
+        if finish_reason == "length":
+            budget = REASONING_MAX_COMPLETION_TOKENS * 2
+            logger.warning(f"✂️ {GPT_5_1_MODEL}: reasoning обрезан по лимиту, повтор с лимитом {budget}")
+            reasoning_text, finish_reason = await _request_text_completion(
+                {**reasoning_params, "max_completion_tokens": budget}, on_delta, stop_marker="\nПОЛИВ"
+            )
+        if finish_reason == "length":
+            raise Exception("Ответ reasoning модели обрезан по лимиту токенов")
         
         if not reasoning_text or len(reasoning_text) < 50:
             raise Exception("Некачественный ответ от reasoning модели")
@@ -431,7 +744,7 @@ async def analyze_reasoning_step(vision_result: dict, plant_context: str = None,
 <b>Рекомендации:</b>
 {clean_reasoning}"""
         
-        return {
+        result = {
             "success": True,
             "reasoning": clean_reasoning,
             "action_plan": clean_reasoning,  # План действий включен в reasoning
@@ -439,22 +752,28 @@ async def analyze_reasoning_step(vision_result: dict, plant_context: str = None,
             "full_analysis": full_analysis,
             "watering_interval": watering_interval
         }
+        reasoning_cache.set(cache_key, result)
+        return result
         
     except Exception as e:
         logger.error(f"❌ Reasoning анализ ошибка: {e}", exc_info=True)
         # Fallback на более простую модель если gpt-5.1 недоступна
         try:
             logger.warning(f"🔄 {GPT_5_1_MODEL} недоступна, использую fallback модель GPT-4o для reasoning")
-            response = await openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=800,
-                temperature=0.3
-            )
+            async with text_semaphore:
+                response = await openai_client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    max_tokens=800,
+                    temperature=0.3
+                )
             
+            # Обрезанный ответ без строки интервала не отдаём и не кэшируем
+            if response.choices[0].finish_reason == "length":
+                raise Exception("Ответ GPT-4o обрезан по лимиту токенов")
             reasoning_text = response.choices[0].message.content
             
             # Извлекаем интервал полива и удаляем строку из текста
@@ -471,7 +790,7 @@ async def analyze_reasoning_step(vision_result: dict, plant_context: str = None,
 <b>Рекомендации:</b>
 {clean_reasoning}"""
             
-            return {
+            result = {
                 "success": True,
                 "reasoning": clean_reasoning,
                 "action_plan": clean_reasoning,
@@ -479,13 +798,45 @@ async def analyze_reasoning_step(vision_result: dict, plant_context: str = None,
                 "full_analysis": full_analysis,
                 "watering_interval": watering_interval
             }
+            reasoning_cache.set(cache_key, result)
+            return result
         except Exception as fallback_error:
             logger.error(f"❌ Fallback reasoning ошибка: {fallback_error}")
             return {"success": False, "error": str(e)}
 
 
-async def analyze_with_openai_advanced(image_data: bytes, user_question: str = None, previous_state: str = None) -> dict:
-    """Продвинутый анализ с определением состояния через OpenAI"""
+def _format_advanced_result(raw_analysis: str, plant_name: str, confidence: float, season_data: dict) -> dict:
+    """Разбор состояния и форматирование ответа analyze_with_openai_advanced"""
+    state_info = extract_plant_state_from_analysis(raw_analysis)
+    
+    # ИСПРАВЛЕНО: Применяем сезонную корректировку
+    state_info['season_adjustment'] = _SEASON_WATER_ADJUSTMENT_DAYS.get(season_data['season'], 0)
+    
+    formatted_analysis = format_plant_analysis(raw_analysis, confidence, state_info)
+    
+    logger.info(f"✅ Анализ завершен. Сезон: {season_data['season_ru']}, Состояние: {state_info['current_state']}, Уверенность: {confidence}%")
+    
+    return {
+        "success": True,
+        "analysis": formatted_analysis,
+        "raw_analysis": raw_analysis,
+        "plant_name": plant_name,
+        "confidence": confidence,
+        "source": "openai_advanced",
+        "state_info": state_info,
+        "season_data": season_data,
+        "needs_retry": confidence < 50
+    }
+
+
+async def analyze_with_openai_advanced(image_data: bytes, user_question: str = None, previous_state: str = None,
+                                       retry_count: int = 0) -> dict:
+    """Продвинутый анализ с определением состояния через OpenAI
+    
+    При низкой уверенности на первой попытке возвращает результат без
+    форматирования (state_info=None, needs_retry=True) - решение о повторе
+    принимает вызывающий код.
+    """
     if not openai_client:
         return {"success": False, "error": "OpenAI API недоступен"}
     
@@ -493,27 +844,16 @@ async def analyze_with_openai_advanced(image_data: bytes, user_question: str = N
         # Получаем информацию о текущем сезоне
         season_data = get_current_season()
         
-        # ИСПРАВЛЕНО: Формируем рекомендации по подкормке на основе сезона
-        feeding_recommendations = {
-            'winter': 'Прекратить подкормки или минимизировать до 1 раза в месяц половинной дозой',
-            'spring': 'Начать подкормки с половинной дозы, постепенно увеличивая до полной каждые 2 недели',
-            'summer': 'Регулярные подкормки каждые 1-2 недели полной дозой',
-            'autumn': 'Постепенно сокращать подкормки, с октября прекратить для большинства видов'
-        }
-        
         # ИСПРАВЛЕНО: Вычисляем числовую корректировку полива
-        water_adjustment_days = 0
-        if season_data['season'] == 'winter':
-            water_adjustment_days = +5  # Зимой поливать реже
-        elif season_data['season'] == 'spring':
-            water_adjustment_days = 0  # Весной базовый интервал
-        elif season_data['season'] == 'summer':
-            water_adjustment_days = -2  # Летом поливать чаще
-        elif season_data['season'] == 'autumn':
-            water_adjustment_days = +2  # Осенью начинать сокращать
-        
-        optimized_image = await optimize_image_for_analysis(image_data, high_quality=True)
-        base64_image = base64.b64encode(optimized_image).decode('utf-8')
+        water_adjustment_days = _SEASON_WATER_ADJUSTMENT_DAYS.get(season_data['season'], 0)
+        
+        # Повторный анализ того же фото в том же сезоне берём из кэша
+        cache_key = make_cache_key(image_data, "openai_advanced", season_data['season'], user_question, previous_state)
+        cached = vision_cache.get(cache_key)
+        if cached:
+            return cached
+        
+        image_url = await _prepare_image_url(image_data)
         
         # ИСПРАВЛЕНО: Форматируем промпт с правильными ключами
         prompt = PLANT_IDENTIFICATION_PROMPT.format(
@@ -522,7 +862,7 @@ async def analyze_with_openai_advanced(image_data: bytes, user_question: str = N
             season_water_note=season_data['watering_adjustment'],  # ✅ строка с описанием
             season_light_note=season_data['light_hours'],  # ✅ описание светового дня
             season_temperature_note=season_data['temperature_note'],  # ✅ рекомендации по температуре
-            season_feeding_note=feeding_recommendations.get(season_data['season'], 'Стандартный режим'),  # ✅ рекомендации по подкормке
+            season_feeding_note=_SEASON_FEEDING_NOTES.get(season_data['season'], 'Стандартный режим'),  # ✅ рекомендации по подкормке
             season_water_adjustment=f"{water_adjustment_days:+d} дня к базовому интервалу"  # ✅ числовая корректировка
         )
         
@@ -532,103 +872,154 @@ async def analyze_with_openai_advanced(image_data: bytes, user_question: str = N
         if user_question:
             prompt += f"\n\nДополнительный вопрос пользователя: {user_question}"
         
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Вы - профессиональный ботаник-диагност с 30-летним опытом. Проводите точную идентификацию и профессиональную оценку состояния растений. Все выводы обосновывайте наблюдаемыми признаками. ОБЯЗАТЕЛЬНО учитывайте сезонность при рекомендациях по поливу."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                                "detail": "high"
+        async with vision_semaphore:
+            response = await openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Вы - профессиональный ботаник-диагност с 30-летним опытом. Проводите точную идентификацию и профессиональную оценку состояния растений. Все выводы обосновывайте наблюдаемыми признаками. ОБЯЗАТЕЛЬНО учитывайте сезонность при рекомендациях по поливу."
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": image_url,
+                                    "detail": "high"
+                                }
                             }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1500,
-            temperature=0.2
-        )
+                        ]
+                    }
+                ],
+                max_tokens=1500,
+                temperature=0.2
+            )
         
         raw_analysis = response.choices[0].message.content
         
         if len(raw_analysis) < 100:
             raise Exception("Некачественный ответ")
         
-        # Извлекаем уверенность
-        confidence = 0
-        for line in raw_analysis.split('\n'):
-            if line.startswith("УВЕРЕННОСТЬ:"):
-                try:
-                    conf_str = line.replace("УВЕРЕННОСТЬ:", "").strip().replace("%", "")
-                    confidence = float(conf_str)
-                except:
-                    confidence = 70
-                break
-        
-        # Извлекаем название растения
-        plant_name = "Неизвестное растение"
-        import re
-        for line in raw_analysis.split('\n'):
-            if line.startswith("РАСТЕНИЕ:"):
-                raw_name = line.replace("РАСТЕНИЕ:", "").strip()
-                # Очищаем от "Неизвестное растение (возможно, X)" → "X"
-                if "неизвестное растение" in raw_name.lower() and "(" in raw_name:
-                    match = re.search(r'\((?:возможно,?\s*)?([^)]+)\)', raw_name, re.IGNORECASE)
-                    if match:
-                        plant_name = match.group(1).strip()
-                    else:
-                        plant_name = raw_name
-                else:
-                    plant_name = re.sub(r'\s*\(возможно[^)]*\)\s*', '', raw_name, flags=re.IGNORECASE).strip()
-                    if not plant_name:
-                        plant_name = raw_name
-                break
-        
-        # Извлекаем состояние
-        state_info = extract_plant_state_from_analysis(raw_analysis)
-        
-        # ИСПРАВЛЕНО: Применяем сезонную корректировку
-        state_info['season_adjustment'] = water_adjustment_days
-        
-        formatted_analysis = format_plant_analysis(raw_analysis, confidence, state_info)
-        
-        logger.info(f"✅ Анализ завершен. Сезон: {season_data['season_ru']}, Состояние: {state_info['current_state']}, Уверенность: {confidence}%")
+        # Разбираем ответ за один проход: уверенность и название растения
+        parsed = _parse_vision_response(raw_analysis)
+        if parsed.confidence is not None:
+            confidence = parsed.confidence
+        elif parsed.has_confidence_line:
+            confidence = 70
+        else:
+            confidence = 0
         
-        return {
-            "success": True,
-            "analysis": formatted_analysis,
-            "raw_analysis": raw_analysis,
-            "plant_name": plant_name,
-            "confidence": confidence,
-            "source": "openai_advanced",
-            "state_info": state_info,
-            "season_data": season_data
-        }
+        # Низкая уверенность - не тратим время на разбор и форматирование,
+        # вызывающий код решит, нужен ли повторный анализ
+        if confidence < 50 and retry_count == 0:
+            logger.info(f"⚠️ Низкая уверенность ({confidence}%), форматирование пропущено")
+            return {
+                "success": True,
+                "raw_analysis": raw_analysis,
+                "plant_name": parsed.plant_name,
+                "confidence": confidence,
+                "source": "openai_advanced",
+                "state_info": None,
+                "season_data": season_data,
+                "needs_retry": True
+            }
+        
+        result = _format_advanced_result(raw_analysis, parsed.plant_name, confidence, season_data)
+        vision_cache.set(cache_key, result)
+        return result
         
     except Exception as e:
         logger.error(f"❌ OpenAI error: {e}", exc_info=True)  # ИСПРАВЛЕНО: добавлен exc_info для полного стека
         return {"success": False, "error": str(e)}
 
 
+def _validate_image(image_data: bytes) -> str:
+    """Вернуть текст ошибки, если данные не похожи на фото, иначе пустую строку"""
+    if not image_data or len(image_data) < MIN_IMAGE_BYTES:
+        return "Изображение слишком маленькое или пустое"
+    if len(image_data) > MAX_IMAGE_BYTES:
+        return "Изображение слишком большое"
+    if not image_data.startswith(_IMAGE_SIGNATURES):
+        return "Неподдерживаемый формат изображения"
+    return ""
+
+
+def _is_trivial_question(question: str) -> bool:
+    """Вопрос без содержания: пустой, слишком короткий или просто приветствие"""
+    normalized = (question or '').strip().lower().strip('!.?,)( ')
+    return len(normalized) < 3 or normalized in _TRIVIAL_QUESTIONS
+
+
+def _should_use_two_stage(vision_result: dict, user_question: str = None, previous_state: str = None) -> bool:
+    """
+    Нужен ли reasoning после vision
+    
+    Reasoning пропускаем, только если растение уверенно определено, проблем
+    не видно и нет ни вопроса пользователя, ни предыдущего состояния для сравнения.
+    """
+    if user_question or previous_state:
+        return True
+    if vision_result.get('confidence', 0) < FAST_PATH_MIN_CONFIDENCE:
+        return True
+    return "проблем не обнаружено" not in vision_result.get('possible_problems', '').lower()
+
+
+def _build_vision_only_result(vision_result: dict, season_info: dict) -> dict:
+    """Результат анализа без reasoning: здоровое растение с высокой уверенностью"""
+    plant_name = vision_result.get('plant_name', 'Неизвестное растение')
+    watering_interval = get_default_watering_interval(season_info)
+    raw_observations = vision_result.get('raw_observations', '')
+    state_info = extract_plant_state_from_analysis(raw_observations)
+    season_tip = get_seasonal_care_tips(season_info['season'], state_info['current_state'])
+    
+    analysis = (
+        f"🌱 <b>Растение:</b> {plant_name}\n\n"
+        f"<b>Визуальный анализ:</b>\n{vision_result.get('vision_analysis', '')}\n\n"
+        f"<b>Возможные проблемы:</b>\n{vision_result.get('possible_problems', '')}\n\n"
+        f"🌍 <b>{season_info['season_ru']}:</b> {season_tip}\n\n"
+        f"💧 <b>Полив:</b> раз в {watering_interval} дней"
+    )
+    
+    return {
+        "success": True,
+        "analysis": analysis,
+        "raw_analysis": f"ПОЛИВ_ИНТЕРВАЛ: {watering_interval}\n" + raw_observations,
+        "plant_name": plant_name,
+        "confidence": vision_result.get('confidence', 50),
+        "source": "vision_fast_path",
+        "state_info": state_info,
+        "vision_result": vision_result,
+        "watering_interval": watering_interval,
+        "needs_retry": False
+    }
+
+
 async def analyze_plant_image(image_data: bytes, user_question: str = None, 
-                             previous_state: str = None, retry_count: int = 0, plant_context: str = None) -> dict:
+                             previous_state: str = None, retry_count: int = 0, plant_context: str = None,
+                             on_delta=None) -> dict:
     """Анализ изображения растения - ДВУХЭТАПНЫЙ ПРОЦЕСС:
     Шаг 1: Vision (gpt-4o) - что видно, проблемы, уверенность
-    Шаг 2: Reasoning (gpt-5.1) - объясняет почему, план действий, адаптация + интервал полива"""
+    Шаг 2: Reasoning (gpt-5.1) - объясняет почему, план действий, адаптация + интервал полива
+    
+    on_delta (опционально) получает текст reasoning по мере генерации"""
+    
+    image_error = _validate_image(image_data)
+    if image_error:
+        logger.warning(f"⚠️ Фото отклонено до анализа: {image_error}")
+        return {"success": False, "error": image_error}
     
     logger.info("🔍 Начало двухэтапного анализа: Vision → Reasoning")
     
     # ШАГ 1: Vision анализ через GPT-4o
+    # Параллельно в потоке готовим сезон и не зависящую от vision часть промпта reasoning
     logger.info("📸 Шаг 1: Vision анализ (GPT-4o)...")
-    vision_result = await analyze_vision_step(image_data, user_question, previous_state)
+    vision_result, (season_info, prompt_context) = await asyncio.gather(
+        analyze_vision_step(image_data, user_question, previous_state),
+        asyncio.to_thread(_prepare_reasoning, plant_context, user_question)
+    )
     
     if not vision_result["success"]:
         logger.error(f"❌ Vision анализ не удался: {vision_result.get('error')}")
@@ -636,13 +1027,36 @@ async def analyze_plant_image(image_data: bytes, user_question: str = None,
         if retry_count == 0:
             logger.info("🔄 Fallback на старый метод анализа...")
             openai_result = await analyze_with_openai_advanced(image_data, user_question, previous_state)
+            if openai_result["success"] and openai_result["state_info"] is None:
+                # Низкая уверенность - одна повторная попытка с полным форматированием
+                logger.info("🔄 Повторный анализ из-за низкой уверенности...")
+                first_result = openai_result
+                openai_result = await analyze_with_openai_advanced(
+                    image_data, user_question, previous_state, retry_count=1
+                )
+                if not openai_result["success"]:
+                    # Повтор не удался - отдаём первый ответ, как есть
+                    logger.warning(f"⚠️ Повторный анализ не удался: {openai_result.get('error')}")
+                    openai_result = _format_advanced_result(
+                        first_result["raw_analysis"], first_result["plant_name"],
+                        first_result["confidence"], first_result["season_data"]
+                    )
             if openai_result["success"]:
                 return openai_result
         return {"success": False, "error": vision_result.get("error", "Vision анализ не удался")}
     
+    # Здоровое, уверенно определённое растение - reasoning не нужен
+    if not _should_use_two_stage(vision_result, user_question, previous_state):
+        logger.info(f"⚡ Reasoning пропущен: уверенность {vision_result.get('confidence')}%, проблем не обнаружено")
+        return _build_vision_only_result(vision_result, season_info)
+    
     # ШАГ 2: Reasoning анализ через GPT-5.1 (включает извлечение интервала полива)
     logger.info(f"🧠 Шаг 2: Reasoning анализ ({GPT_5_1_MODEL})...")
-    reasoning_result = await analyze_reasoning_step(vision_result, plant_context, user_question)
+    reasoning_result = await analyze_reasoning_step(
+        vision_result, plant_context, user_question,
+        season_info=season_info, prompt_context=prompt_context,
+        on_delta=on_delta
+    )
     
     if not reasoning_result["success"]:
         logger.error(f"❌ Reasoning анализ не удался: {reasoning_result.get('error')}")
@@ -686,30 +1100,8 @@ async def analyze_plant_image(image_data: bytes, user_question: str = None,
     }
 
 
-async def answer_plant_question(question: str, plant_context: str = None) -> dict:
-    """Ответить на вопрос о растении с контекстом
-    
-    Returns:
-        dict: {"answer": str, "model": str} или {"error": str} в случае ошибки
-    """
-    if not openai_client:
-        return {"error": "❌ OpenAI API недоступен"}
-    
-    try:
-        # Получаем информацию о сезоне
-        season_info = get_current_season()
-        
-        seasonal_context = f"""
-ТЕКУЩИЙ СЕЗОН: {season_info['season_ru']} ({season_info['month_name_ru']})
-ФАЗА РОСТА: {season_info['growth_phase']}
-СВЕТОВОЙ ДЕНЬ: {season_info['light_hours']}
-КОРРЕКТИРОВКА ПОЛИВА: {season_info['watering_adjustment']}
-
-СЕЗОННЫЕ ОСОБЕННОСТИ:
-{season_info['recommendations']}
-"""
-        
-        system_prompt = """Вы - профессиональный ботаник-консультант с многолетним опытом диагностики и ухода за растениями.
+# System-промпт ответов на вопросы о растениях
+_ANSWER_SYSTEM_PROMPT = """Вы - профессиональный ботаник-консультант с многолетним опытом диагностики и ухода за растениями.
 
 СТИЛЬ ОБЩЕНИЯ:
 - Авторитетный, экспертный, но доступный
@@ -746,110 +1138,24 @@ async def answer_plant_question(question: str, plant_context: str = None) -> dic
 - Каждый раздел отделяйте пустой строкой
 - Ответ должен быть компактным, но информативным"""
 
-        user_prompt = f"""ИСТОРИЯ РАСТЕНИЯ:
-{plant_context if plant_context else "Контекст отсутствует"}
-
-{seasonal_context}
+# User-промпт ответа на вопрос: только переменные данные, формат ответа - в system-промпте
+_ANSWER_USER_PROMPT_TEMPLATE = """ИСТОРИЯ РАСТЕНИЯ:
+{plant_context}
 
 ВОПРОС ПОЛЬЗОВАТЕЛЯ:
 {question}
 
-Дайте структурированный ответ в формате:
-
-🔍 <b>Диагноз</b>
-[оценка состояния]
-
-⚠️ <b>Причины</b>
-• [причина 1]
-• [причина 2]
-
-💊 <b>Что делать</b>
-1. [действие с параметрами]
-2. [действие с параметрами]
-
-📅 <b>Когда ждать результат</b>
-[сроки и признаки]
-
-Используйте HTML-теги <b></b> для заголовков. Учитывайте сезон ({season_info['season_ru']}) в рекомендациях!"""
-        
-        # Пробуем сначала gpt-5.1, если не получается - fallback на gpt-4o
-        models_to_try = [GPT_5_1_MODEL, "gpt-4o"]
-        last_error = None
-        
-        for model_name in models_to_try:
-            try:
-                logger.info(f"🔄 Пробую модель: {model_name}")
-                
-                # GPT-5.1 использует max_completion_tokens, остальные модели - max_tokens
-                api_params = {
-                    "model": model_name,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ]
-                }
-                
-                if model_name == GPT_5_1_MODEL:
-                    api_params["max_completion_tokens"] = 4000  # GPT-5.1 тратит токены на reasoning + ответ
-                    api_params["extra_body"] = {"reasoning_effort": "low"}
-                    # GPT-5.1 не поддерживает temperature, убираем
-                else:
-                    api_params["max_tokens"] = 500
-                    api_params["temperature"] = 0.3
-                
-                response = await openai_client.chat.completions.create(**api_params)
-                
-                answer = response.choices[0].message.content
-                
-                if answer and len(answer) > 10:
-                    logger.info(f"✅ OpenAI ответил с контекстом (модель: {model_name}, сезон: {season_info['season_ru']})")
-                    return {"answer": answer, "model": model_name}
-                else:
-                    logger.warning(f"⚠️ Модель {model_name} вернула пустой ответ")
-                    
-            except Exception as model_error:
-                last_error = model_error
-                logger.warning(f"⚠️ Ошибка с моделью {model_name}: {model_error}")
-                if model_name == models_to_try[-1]:
-                    # Это была последняя модель, пробрасываем ошибку
-                    raise
-                # Пробуем следующую модель
-                continue
-        
-        # Если дошли сюда, значит все модели вернули пустой ответ
-        raise Exception("Все модели вернули пустой ответ")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка ответа на вопрос: {e}", exc_info=True)
-        logger.error(f"❌ Тип ошибки: {type(e).__name__}")
-        if hasattr(e, 'response'):
-            logger.error(f"❌ Response: {e.response}")
-        if hasattr(e, 'status_code'):
-            logger.error(f"❌ Status code: {e.status_code}")
-        return {"error": "❌ Не могу дать ответ. Попробуйте переформулировать вопрос."}
-
-
-async def generate_growing_plan(plant_name: str) -> tuple:
-    """Генерация плана выращивания через OpenAI"""
-    if not openai_client:
-        return None, None
-    
-    try:
-        # Получаем информацию о сезоне
-        season_info = get_current_season()
-        
-        prompt = f"""
-Составьте профессиональный агротехнический план выращивания для: {plant_name}
+Ответьте в формате из системного промпта (HTML-теги <b></b> для заголовков). Учитывайте сезон ({season_ru}) в рекомендациях!"""
 
-ТЕКУЩИЙ СЕЗОН: {season_info['season_ru']} ({season_info['month_name_ru']})
-УЧИТЫВАЙТЕ: {season_info['recommendations']}
+# System-промпт плана выращивания; сезон передаётся отдельным сообщением
+_PLAN_SYSTEM_PROMPT = """Вы - агроном-консультант с опытом выращивания широкого спектра растений. Составляйте практичные, научно обоснованные планы. Учитывайте текущий сезон и фазу роста из следующего сообщения.
 
 Требования к плану:
 - Научно обоснованные рекомендации с учетом текущего сезона
 - Конкретные сроки и параметры
 - Учет критических факторов успеха
 - Превентивные меры против типичных проблем
-- Адаптация под {season_info['season_ru'].lower()}
+- Адаптация под текущий сезон
 
 Формат ответа:
 
@@ -871,126 +1177,232 @@ async def generate_growing_plan(plant_name: str) -> tuple:
 • Критерии готовности растения
 
 В конце добавьте:
-КАЛЕНДАРЬ_ЗАДАЧ: [структурированный JSON с задачами по дням]
-"""
+КАЛЕНДАРЬ_ЗАДАЧ: [структурированный JSON с задачами по дням]"""
+
+
+def _build_text_params(model_name: str, system_prompt: str, user_prompt: str,
+                       max_tokens: int, temperature: float = None, context_prompt: str = None) -> dict:
+    """
+    Параметры chat.completions для текстового запроса
+    
+    context_prompt (например, сезон) идёт отдельным system-сообщением между
+    постоянным промптом и вопросом пользователя.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    if context_prompt:
+        messages.append({"role": "system", "content": context_prompt})
+    messages.append({"role": "user", "content": user_prompt})
+    
+    params = {
+        "model": model_name,
+        "messages": messages
+    }
+    
+    # GPT-5.1 использует max_completion_tokens, остальные модели - max_tokens
+    if model_name == GPT_5_1_MODEL:
+        params["max_completion_tokens"] = max_tokens  # GPT-5.1 тратит токены на reasoning + ответ
+        params["extra_body"] = {"reasoning_effort": GPT5_REASONING_EFFORT}
+        # GPT-5.1 не поддерживает temperature
+    else:
+        params["max_tokens"] = max_tokens
+        if temperature is not None:
+            params["temperature"] = temperature
+    
+    return params
+
+
+async def _request_text_completion(params: dict, on_delta=None, stop_marker: str = None) -> tuple:
+    """Один запрос: (text, finish_reason)"""
+    async with text_semaphore:
+        if on_delta:
+            return await _stream_completion(params, on_delta, stop_marker)
+        response = await openai_client.chat.completions.create(**params)
+    _log_usage(response, params["model"])
+    choice = response.choices[0]
+    return choice.message.content, choice.finish_reason
+
+
+async def _run_text_completion(params: dict, on_delta=None) -> str:
+    """Текстовый запрос; обрезанный по лимиту ответ GPT-5.1 повторяется с удвоенным лимитом"""
+    text, finish_reason = await _request_text_completion(params, on_delta)
+    
+    if finish_reason == "length" and "max_completion_tokens" in params:
+        budget = params["max_completion_tokens"] * 2
+        logger.warning(f"✂️ {params['model']}: ответ обрезан по лимиту, повтор с лимитом {budget}")
+        text, _ = await _request_text_completion({**params, "max_completion_tokens": budget}, on_delta)
+    
+    return text
+
+
+async def _hedged_completion(primary: dict, fallback: dict, is_valid, hedge_delay: float = None,
+                             on_delta=None) -> tuple:
+    """
+    Запрос к основной модели с подстраховкой запасной
+    
+    Запасная модель запускается параллельно, если основная ответила ошибкой
+    или невалидным ответом, либо не уложилась в hedge_delay секунд.
+    Побеждает первый валидный ответ, оставшийся запрос отменяется.
+    
+    С on_delta основная модель отвечает потоком; если она уже начала
+    присылать текст, запасная по таймауту не запускается.
+    
+    Returns:
+        tuple: (text, model_name); если ни одна модель не ответила - исключение
+    """
+    if hedge_delay is None:
+        hedge_delay = HEDGE_DELAY_SECONDS
+    
+    primary_streaming = False
+    primary_on_delta = None
+    if on_delta:
+        async def primary_on_delta(text: str):
+            nonlocal primary_streaming
+            primary_streaming = True
+            await on_delta(text)
+    
+    tasks = {asyncio.create_task(_run_text_completion(primary, primary_on_delta)): primary["model"]}
+    fallback_started = False
+    last_error = None
+    
+    def start_fallback():
+        nonlocal fallback_started
+        fallback_started = True
+        logger.warning(f"🔄 Подключаю запасную модель {fallback['model']}")
+        tasks[asyncio.create_task(_run_text_completion(fallback))] = fallback["model"]
+    
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(
+                tasks,
+                timeout=None if fallback_started or primary_streaming else hedge_delay,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            
+            if not done and primary_streaming:
+                # Основная модель уже отвечает - ждём её без подстраховки
+                continue
+            
+            if not done:
+                logger.warning(f"⏱️ {primary['model']} не ответила за {hedge_delay} с")
+                start_fallback()
+                continue
+            
+            for task in done:
+                model_name = tasks.pop(task)
+                try:
+                    text = task.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"⚠️ Ошибка с моделью {model_name}: {e}")
+                    continue
+                if is_valid(text):
+                    return text, model_name
+                logger.warning(f"⚠️ Модель {model_name} вернула пустой ответ")
+            
+            if not fallback_started:
+                start_fallback()
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    raise last_error or Exception("Все модели вернули пустой ответ")
+
+
+async def answer_plant_question(question: str, plant_context: str = None, on_delta=None) -> dict:
+    """Ответить на вопрос о растении с контекстом
+    
+    on_delta (опционально) получает текст ответа по мере генерации
+    
+    Returns:
+        dict: {"answer": str, "model": str} или {"error": str} в случае ошибки
+    """
+    if _is_trivial_question(question):
+        return {"answer": _TRIVIAL_ANSWER, "model": CANNED_ANSWER_MODEL}
+    
+    if not openai_client:
+        return {"error": "❌ OpenAI API недоступен"}
+    
+    try:
+        # Получаем информацию о сезоне
+        season_info = get_current_season()
         
-        logger.info(f"📋 Генерация плана выращивания: использую модель {GPT_5_1_MODEL}")
-        response = await openai_client.chat.completions.create(
-            model=GPT_5_1_MODEL,
-            messages=[
-                {
-                    "role": "system", 
-                    "content": f"Вы - агроном-консультант с опытом выращивания широкого спектра растений. Составляйте практичные, научно обоснованные планы. Учитывайте, что сейчас {season_info['season_ru']} - {season_info['growth_phase'].lower()}."
-                },
-                {"role": "user", "content": prompt}
-            ],
-            max_completion_tokens=5000,  # GPT-5.1 тратит токены на reasoning + ответ
-            extra_body={"reasoning_effort": "low"}
-            # GPT-5.1 не поддерживает temperature
+        # Повтор того же вопроса о том же растении не идёт в API
+        cache_key = make_cache_key(
+            None, ' '.join(question.lower().split()), plant_context,
+            season_info['season'], season_info['month']
         )
+        cached = answer_cache.get(cache_key)
+        if cached:
+            return cached
         
-        plan_text = response.choices[0].message.content
-        logger.info(f"✅ План выращивания сгенерирован (модель: {GPT_5_1_MODEL})")
-        
-        # Создаем календарь задач (упрощенная версия)
-        task_calendar = {
-            "stage_1": {
-                "name": "Подготовка и посадка",
-                "duration_days": 7,
-                "tasks": [
-                    {"day": 1, "title": "Посадка", "description": "Посадите семена/черенок", "icon": "🌱"},
-                    {"day": 3, "title": "Первый полив", "description": "Умеренно полейте", "icon": "💧"},
-                    {"day": 7, "title": "Проверка", "description": "Проверьте влажность", "icon": "🔍"},
-                ]
-            },
-            "stage_2": {
-                "name": "Прорастание",
-                "duration_days": 14,
-                "tasks": [
-                    {"day": 10, "title": "Первые всходы", "description": "Проверьте появление ростков", "icon": "🌱"},
-                    {"day": 14, "title": "Регулярный полив", "description": "Поддерживайте влажность", "icon": "💧"},
-                ]
-            },
-            "stage_3": {
-                "name": "Активный рост",
-                "duration_days": 30,
-                "tasks": [
-                    {"day": 21, "title": "Первая подкормка", "description": "Внесите удобрение", "icon": "🍽️"},
-                    {"day": 35, "title": "Проверка роста", "description": "Оцените развитие растения", "icon": "📊"},
-                ]
-            },
-            "stage_4": {
-                "name": "Взрослое растение",
-                "duration_days": 30,
-                "tasks": [
-                    {"day": 50, "title": "Пересадка", "description": "Пересадите в больший горшок", "icon": "🪴"},
-                    {"day": 60, "title": "Формирование", "description": "При необходимости обрежьте", "icon": "✂️"},
-                ]
-            }
-        }
+        # Порядок сообщений - от постоянного к переменному, чтобы OpenAI
+        # переиспользовал закэшированный префикс: промпт, сезон, вопрос
+        system_prompt = _ANSWER_SYSTEM_PROMPT
+        seasonal_context = _build_seasonal_block(season_info)
+
+        user_prompt = _ANSWER_USER_PROMPT_TEMPLATE.format(
+            plant_context=plant_context if plant_context else "Контекст отсутствует",
+            question=question,
+            season_ru=season_info['season_ru']
+        )
         
-        return plan_text, task_calendar
+        # gpt-5.1 с подстраховкой gpt-4o: запасная модель стартует, если основная
+        # ошиблась, вернула пустой ответ или не уложилась в HEDGE_DELAY_SECONDS
+        answer, model_name = await _hedged_completion(
+            _build_text_params(GPT_5_1_MODEL, system_prompt, user_prompt, ANSWER_MAX_COMPLETION_TOKENS,
+                               context_prompt=seasonal_context),
+            _build_text_params("gpt-4o", system_prompt, user_prompt, 500, temperature=0.3,
+                               context_prompt=seasonal_context),
+            lambda text: bool(text) and len(text) > 10,
+            on_delta=on_delta
+        )
+        
+        logger.info(f"✅ OpenAI ответил с контекстом (модель: {model_name}, сезон: {season_info['season_ru']})")
+        result = {"answer": answer, "model": model_name}
+        answer_cache.set(cache_key, result)
+        return result
         
     except Exception as e:
-        logger.error(f"Ошибка генерации плана: {e}")
-        # Fallback на GPT-4o
-        try:
-            logger.warning(f"🔄 {GPT_5_1_MODEL} недоступна для генерации плана, использую GPT-4o")
-            response = await openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": f"Вы - агроном-консультант с опытом выращивания широкого спектра растений. Составляйте практичные, научно обоснованные планы. Учитывайте, что сейчас {season_info['season_ru']} - {season_info['growth_phase'].lower()}."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1200,
-                temperature=0.2
-            )
-            
-            plan_text = response.choices[0].message.content
-            logger.info("✅ План выращивания сгенерирован (модель: GPT-4o fallback)")
-            
-            # Тот же календарь задач
-            task_calendar = {
-                "stage_1": {
-                    "name": "Подготовка и посадка",
-                    "duration_days": 7,
-                    "tasks": [
-                        {"day": 1, "title": "Посадка", "description": "Посадите семена/черенок", "icon": "🌱"},
-                        {"day": 3, "title": "Первый полив", "description": "Умеренно полейте", "icon": "💧"},
-                        {"day": 7, "title": "Проверка", "description": "Проверьте влажность", "icon": "🔍"},
-                    ]
-                },
-                "stage_2": {
-                    "name": "Прорастание",
-                    "duration_days": 14,
-                    "tasks": [
-                        {"day": 10, "title": "Первые всходы", "description": "Проверьте появление ростков", "icon": "🌱"},
-                        {"day": 14, "title": "Регулярный полив", "description": "Поддерживайте влажность", "icon": "💧"},
-                    ]
-                },
-                "stage_3": {
-                    "name": "Активный рост",
-                    "duration_days": 30,
-                    "tasks": [
-                        {"day": 21, "title": "Первая подкормка", "description": "Внесите удобрение", "icon": "🍽️"},
-                        {"day": 35, "title": "Проверка роста", "description": "Оцените развитие растения", "icon": "📊"},
-                    ]
-                },
-                "stage_4": {
-                    "name": "Взрослое растение",
-                    "duration_days": 30,
-                    "tasks": [
-                        {"day": 50, "title": "Пересадка", "description": "Пересадите в больший горшок", "icon": "🪴"},
-                        {"day": 60, "title": "Формирование", "description": "При необходимости обрежьте", "icon": "✂️"},
-                    ]
-                }
-            }
-            
-            return plan_text, task_calendar
-            
-        except Exception as fallback_error:
-            logger.error(f"❌ Fallback генерации плана ошибка: {fallback_error}")
-            return None, None
+        # Одна запись с ленивым форматированием: при всплеске ошибок API
+        # не собираем несколько строк лога на каждый запрос
+        logger.exception(
+            "❌ Ошибка ответа на вопрос: type=%s status=%s response=%s",
+            type(e).__name__, getattr(e, 'status_code', None), getattr(e, 'response', None)
+        )
+        return {"error": "❌ Не могу дать ответ. Попробуйте переформулировать вопрос."}
+
+
+async def generate_growing_plan(plant_name: str, on_delta=None) -> tuple:
+    """Генерация плана выращивания через OpenAI
+    
+    on_delta (опционально) получает текст плана по мере генерации"""
+    if not openai_client:
+        return None, None
+    
+    try:
+        # Получаем информацию о сезоне
+        season_info = get_current_season()
+        
+        # Постоянная инструкция, затем сезон, затем растение - для кэша префикса OpenAI
+        system_prompt = _PLAN_SYSTEM_PROMPT
+        seasonal_context = _build_seasonal_block(season_info)
+        prompt = f"Составьте профессиональный агротехнический план выращивания для: {plant_name}"
+        
+        logger.info(f"📋 Генерация плана выращивания: использую модель {GPT_5_1_MODEL}")
+        plan_text, model_name = await _hedged_completion(
+            _build_text_params(GPT_5_1_MODEL, system_prompt, prompt, PLAN_MAX_COMPLETION_TOKENS,
+                               context_prompt=seasonal_context),
+            _build_text_params("gpt-4o", system_prompt, prompt, 1200, temperature=0.2,
+                               context_prompt=seasonal_context),
+            bool,
+            on_delta=on_delta
+        )
+        logger.info(f"✅ План выращивания сгенерирован (модель: {model_name})")
+        
+        # Календарь общий для всех растений и только сериализуется в JSON,
+        # поэтому отдаём общий экземпляр без копирования
+        return plan_text, _DEFAULT_TASK_CALENDAR
+        
+    except Exception as e:
+        logger.error("❌ Ошибка генерации плана: %s: %s", type(e).__name__, e)
+        return None, None
@@ -0,0 +1,105 @@
+"""
+Пакетные запросы к OpenAI через Batch API
+Для фоновых задач, которым не важна задержка (сезонная корректировка и т.п.):
+запросы отправляются одним файлом и обходятся вдвое дешевле.
+Интерактивные запросы пользователей идут через обычный API.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict
+
+import orjson
+
+from services.openai_client import openai_client
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_POLL_INTERVAL_SECONDS = 60
+BATCH_MAX_WAIT_SECONDS = 6 * 60 * 60  # 6 часов, дальше уходим на обычный API
+
+_PENDING_STATUSES = ("validating", "in_progress", "finalizing")
+
+
+def _build_batch_file(requests: Dict[str, dict]) -> bytes:
+    """JSONL-файл для Batch API: одна строка на запрос"""
+    lines = [
+        orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": body
+        })
+        for custom_id, body in requests.items()
+    ]
+    return b"\n".join(lines)
+
+
+def _parse_batch_output(output_text: str) -> Dict[str, str]:
+    """Разобрать JSONL с результатами: custom_id -> текст ответа"""
+    results = {}
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            item = orjson.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") != 200:
+                continue
+            content = response["body"]["choices"][0]["message"]["content"]
+            if content:
+                results[item["custom_id"]] = content.strip()
+        except (orjson.JSONDecodeError, KeyError, IndexError, TypeError) as e:
+            logger.warning(f"⚠️ Batch: не удалось разобрать строку результата: {e}")
+    return results
+
+
+async def run_chat_batch(requests: Dict[str, dict]) -> Dict[str, str]:
+    """
+    Выполнить набор chat.completions запросов через Batch API
+
+    Args:
+        requests: custom_id -> тело запроса (model, messages, ...)
+
+    Returns:
+        dict: custom_id -> текст ответа. Запросы без ответа в результат не попадают,
+        вызывающий код должен выполнить их обычным способом.
+    """
+    if not openai_client or not requests:
+        return {}
+
+    try:
+        batch_file = await openai_client.files.create(
+            file=("batch.jsonl", _build_batch_file(requests)),
+            purpose="batch"
+        )
+        batch = await openai_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h"
+        )
+        logger.info(f"📦 Batch {batch.id}: отправлено {len(requests)} запросов")
+
+        started = time.monotonic()
+        while batch.status in _PENDING_STATUSES:
+            if time.monotonic() - started > BATCH_MAX_WAIT_SECONDS:
+                logger.warning(f"⏰ Batch {batch.id}: превышено время ожидания, отменяем")
+                await openai_client.batches.cancel(batch.id)
+                return {}
+            await asyncio.sleep(BATCH_POLL_INTERVAL_SECONDS)
+            batch = await openai_client.batches.retrieve(batch.id)
+
+        if batch.status != "completed" or not batch.output_file_id:
+            logger.warning(f"⚠️ Batch {batch.id}: завершён со статусом {batch.status}")
+            return {}
+
+        output = await openai_client.files.content(batch.output_file_id)
+        results = _parse_batch_output(output.text)
+        logger.info(f"✅ Batch {batch.id}: получено {len(results)}/{len(requests)} ответов")
+        return results
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка Batch API: {e}", exc_info=True)
+        return {}
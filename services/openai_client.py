@@ -0,0 +1,59 @@
+"""
+Общий клиент OpenAI для всех сервисов
+Один пул HTTP/2-соединений вместо отдельного клиента в каждом модуле
+"""
+
+import asyncio
+import logging
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import OPENAI_API_KEY
+
+logger = logging.getLogger(__name__)
+
+# Reasoning-модели отвечают долго, поэтому общий таймаут большой, а на соединение - короткий
+OPENAI_TIMEOUT = httpx.Timeout(180.0, connect=5.0)
+# Простаивающее соединение держим до 10 минут (по умолчанию httpx закрывает его через 5 с),
+# чтобы после паузы запрос пользователя не платил за новый TLS-хендшейк
+OPENAI_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=600)
+OPENAI_WARMUP_MODEL = "gpt-4o"
+OPENAI_WARMUP_INTERVAL_MINUTES = 10
+
+_http_client = httpx.AsyncClient(
+    http2=True,
+    limits=OPENAI_POOL_LIMITS,
+    timeout=OPENAI_TIMEOUT
+)
+
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=_http_client) if OPENAI_API_KEY else None
+
+# Ограничение одновременных запросов: лишние ждут здесь, а не висят в API с фото в памяти.
+# На 429 SDK сам повторяет запрос с учётом retry-after
+VISION_CONCURRENCY = 20
+TEXT_CONCURRENCY = 10
+vision_semaphore = asyncio.Semaphore(VISION_CONCURRENCY)
+text_semaphore = asyncio.Semaphore(TEXT_CONCURRENCY)
+
+
+async def close_openai_client():
+    """Закрыть соединения при остановке бота"""
+    if not _http_client.is_closed:
+        await _http_client.aclose()
+        logger.info("✅ Соединения OpenAI закрыты")
+
+
+async def warm_up_openai():
+    """
+    Открыть соединение с API заранее: при старте и периодически из планировщика
+    
+    Бесплатный запрос метаданных модели, без генерации. Ошибки не критичны.
+    """
+    if not openai_client:
+        return
+    try:
+        await openai_client.models.retrieve(OPENAI_WARMUP_MODEL)
+        logger.debug("🔥 Соединение с OpenAI прогрето")
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось прогреть соединение с OpenAI: {e}")
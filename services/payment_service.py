@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import uuid
 import aiohttp
@@ -11,6 +12,8 @@ from config import YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY, PRO_PRICE, WEBHOOK_URL
 logger = logging.getLogger(__name__)
 
 YOOKASSA_API_URL = "https://api.yookassa.ru/v3"
+# Одновременных запросов к YooKassa при ежедневном автопродлении
+AUTO_PAYMENT_CONCURRENCY = 5
 
 
 def _get_auth_header() -> str:
@@ -109,20 +112,13 @@ async def create_payment(user_id: int, save_method: bool = True) -> Optional[Dic
         return None
 
 
-async def create_recurring_payment(user_id: int, payment_method_id: str) -> Optional[Dict]:
-    """
-    Создать рекуррентный (автоматический) платёж.
-    
-    Args:
-        user_id: ID пользователя
-        payment_method_id: сохранённый метод оплаты
+async def _request_recurring_payment(session: aiohttp.ClientSession, user_id: int,
+                                     payment_method_id: str) -> Optional[Dict]:
+    """Запрос рекуррентного платежа в YooKassa без записи в БД
     
     Returns:
-        dict с результатом или None
+        {'payment_id', 'status', 'description'} или None при ошибке
     """
-    if not YOOKASSA_SHOP_ID or not YOOKASSA_SECRET_KEY:
-        return None
-    
     idempotency_key = str(uuid.uuid4())
     
     payload = {
@@ -140,39 +136,41 @@ async def create_recurring_payment(user_id: int, payment_method_id: str) -> Opti
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{YOOKASSA_API_URL}/payments",
-                headers=_get_headers(idempotency_key),
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as resp:
-                data = await resp.json()
+        async with session.post(
+            f"{YOOKASSA_API_URL}/payments",
+            headers=_get_headers(idempotency_key),
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=30)
+        ) as resp:
+            data = await resp.json()
+            
+            if resp.status == 200:
+                logger.info(f"✅ Рекуррентный платёж создан: {data['id']} для user_id={user_id}")
+                return {
+                    'payment_id': data['id'],
+                    'status': data['status'],
+                    'description': payload['description'],
+                }
+            else:
+                logger.error(f"❌ Ошибка рекуррентного платежа: {resp.status} {data}")
+                return None
                 
-                if resp.status == 200:
-                    logger.info(f"✅ Рекуррентный платёж создан: {data['id']} для user_id={user_id}")
-                    
-                    from database import get_db
-                    db = await get_db()
-                    async with db.pool.acquire() as conn:
-                        await conn.execute("""
-                            INSERT INTO payments (payment_id, user_id, amount, currency, status, description, is_recurring, created_at)
-                            VALUES ($1, $2, $3, 'RUB', $4, $5, TRUE, CURRENT_TIMESTAMP)
-                        """, data['id'], user_id, PRO_PRICE, data['status'], payload['description'])
-                    
-                    return {
-                        'payment_id': data['id'],
-                        'status': data['status'],
-                    }
-                else:
-                    logger.error(f"❌ Ошибка рекуррентного платежа: {resp.status} {data}")
-                    return None
-                    
     except Exception as e:
         logger.error(f"❌ Ошибка рекуррентного платежа: {e}", exc_info=True)
         return None
 
 
+async def _save_recurring_payment(user_id: int, payment: Dict):
+    """Записать созданный рекуррентный платёж (результат _request_recurring_payment)"""
+    from database import get_db
+    db = await get_db()
+    async with db.pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO payments (payment_id, user_id, amount, currency, status, description, is_recurring, created_at)
+            VALUES ($1, $2, $3, 'RUB', $4, $5, TRUE, CURRENT_TIMESTAMP)
+        """, payment['payment_id'], user_id, PRO_PRICE, payment['status'], payment['description'])
+
+
 async def handle_payment_webhook(payload: dict) -> bool:
     """
     Обработка webhook от YooKassa.
@@ -262,28 +260,46 @@ async def process_auto_payments():
     """
     Обработка автоплатежей — вызывается scheduler'ом ежедневно.
     Ищет подписки, истекающие завтра, и создаёт рекуррентные платежи.
+    
+    Запросы к YooKassa идут параллельно (не больше AUTO_PAYMENT_CONCURRENCY) через одну
+    HTTP-сессию. Каждый платёж записывается в БД сразу после создания: webhook об
+    успешном списании может прийти через секунды и обновляет уже существующую строку.
     """
     from services.subscription_service import get_expiring_subscriptions
     
     expiring = await get_expiring_subscriptions(days_before=1)
+    expiring = [sub for sub in expiring if sub['auto_pay_method_id']]
     
     if not expiring:
         logger.info("💳 Нет подписок для автопродления")
         return
     
+    if not YOOKASSA_SHOP_ID or not YOOKASSA_SECRET_KEY:
+        logger.error("❌ YooKassa не настроена: автопродление пропущено")
+        return
+    
     logger.info(f"💳 Найдено {len(expiring)} подписок для автопродления")
     
-    for sub in expiring:
-        user_id = sub['user_id']
-        method_id = sub['auto_pay_method_id']
-        
-        if not method_id:
-            continue
-        
-        result = await create_recurring_payment(user_id, method_id)
+    semaphore = asyncio.Semaphore(AUTO_PAYMENT_CONCURRENCY)
+    
+    async with aiohttp.ClientSession() as session:
+        async def charge(sub):
+            async with semaphore:
+                payment = await _request_recurring_payment(session, sub['user_id'], sub['auto_pay_method_id'])
+            if payment:
+                try:
+                    await _save_recurring_payment(sub['user_id'], payment)
+                except Exception as e:
+                    # Платёж в YooKassa уже создан: webhook всё равно активирует подписку
+                    logger.error(f"❌ Не удалось записать автоплатёж {payment['payment_id']} в БД: {e}", exc_info=True)
+            return payment
         
-        if result:
-            logger.info(f"✅ Автоплатёж создан для user_id={user_id}: {result['payment_id']}")
+        payments = await asyncio.gather(*(charge(sub) for sub in expiring))
+    
+    for sub, payment in zip(expiring, payments):
+        user_id = sub['user_id']
+        if payment:
+            logger.info(f"✅ Автоплатёж создан для user_id={user_id}: {payment['payment_id']}")
         else:
             logger.error(f"❌ Не удалось создать автоплатёж для user_id={user_id}")
             await _notify_user_payment_failed(user_id, "auto_payment_creation_failed")
@@ -350,6 +366,7 @@ async def _notify_user_payment_failed(user_id: int, reason: str):
 
 async def cancel_auto_payment(user_id: int):
     """Отключить автоплатёж"""
+    from database import get_db
     db = await get_db()
     async with db.pool.acquire() as conn:
         await conn.execute("""
@@ -358,4 +375,7 @@ async def cancel_auto_payment(user_id: int):
             WHERE user_id = $1
         """, user_id)
     
+    from services.subscription_service import invalidate_plan_cache
+    invalidate_plan_cache(user_id)
+    
     logger.info(f"🔕 Автоплатёж отключён для user_id={user_id}")
@@ -1,15 +1,48 @@
 import logging
+import time
+from collections import OrderedDict
 from datetime import datetime
+from typing import Optional
 from database import get_db
 from services.ai_service import extract_watering_info
 from services.reminder_service import create_plant_reminder
-from utils.time_utils import get_moscow_now, format_days_ago
-from config import STATE_EMOJI, STATE_NAMES
+from utils.time_utils import get_moscow_now, get_moscow_naive_now, format_days_ago, format_days_ago_label
+from config import STATE_EMOJI, STATE_UI, DEFAULT_STATE_UI, MOSCOW_TZ
 
 logger = logging.getLogger(__name__)
 
-# Временное хранилище для анализов (будет перенесено в Redis в будущем)
-temp_analyses = {}
+# Временное хранилище анализов до сохранения растения: user_id -> (expires_at, data).
+# Запись живёт TEMP_ANALYSIS_TTL_SECONDS, число записей ограничено
+TEMP_ANALYSIS_TTL_SECONDS = 60 * 60
+TEMP_ANALYSIS_MAX_SIZE = 5000
+_temp_analyses = OrderedDict()
+
+
+def set_temp_analysis(user_id: int, data: dict):
+    """Запомнить последний анализ пользователя"""
+    _temp_analyses[user_id] = (time.monotonic() + TEMP_ANALYSIS_TTL_SECONDS, data)
+    _temp_analyses.move_to_end(user_id)
+    while len(_temp_analyses) > TEMP_ANALYSIS_MAX_SIZE:
+        _temp_analyses.popitem(last=False)
+
+
+def get_temp_analysis(user_id: int) -> Optional[dict]:
+    """Последний анализ пользователя или None, если его нет или он устарел"""
+    entry = _temp_analyses.get(user_id)
+    if entry is None:
+        return None
+    expires_at, data = entry
+    if expires_at < time.monotonic():
+        del _temp_analyses[user_id]
+        return None
+    return data
+
+
+def pop_temp_analysis(user_id: int) -> Optional[dict]:
+    """Забрать анализ пользователя (после сохранения растения)"""
+    data = get_temp_analysis(user_id)
+    _temp_analyses.pop(user_id, None)
+    return data
 
 
 async def save_analyzed_plant(user_id: int, analysis_data: dict, last_watered: datetime = None) -> dict:
@@ -44,75 +77,74 @@ async def save_analyzed_plant(user_id: int, analysis_data: dict, last_watered: d
         
         logger.info(f"💧 Интервал полива от GPT: {ai_interval} дней")
         
-        db = await get_db()
-        plant_id = await db.save_plant(
-            user_id=user_id,
-            analysis=raw_analysis,
-            photo_file_id=analysis_data["photo_file_id"],
-            plant_name=analysis_data.get("plant_name", "Неизвестное растение")
-        )
+        # Колонка last_watered хранит московское время без пояса (как и обработчики,
+        # и CURRENT_TIMESTAMP AT TIME ZONE 'Europe/Moscow' в БД) - aware-дату приводим к нему
+        if last_watered is not None and last_watered.tzinfo is not None:
+            last_watered = last_watered.astimezone(MOSCOW_TZ).replace(tzinfo=None)
         
-        # Устанавливаем интервал от GPT (уже с учётом сезона)
-        await db.update_plant_watering_interval(plant_id, ai_interval)
-        
-        # Сохраняем базовый интервал = интервал от GPT
-        # При сезонной корректировке GPT пересчитает его
-        await db.set_base_watering_interval(plant_id, ai_interval)
-        
-        # Устанавливаем last_watered если указано пользователем
-        next_watering_days = ai_interval  # По умолчанию
-        
-        if last_watered:
-            async with db.pool.acquire() as conn:
-                await conn.execute("""
-                    UPDATE plants 
-                    SET last_watered = $1
-                    WHERE id = $2
-                """, last_watered, plant_id)
-            
-            # Рассчитываем дни до следующего полива
-            from datetime import datetime
-            now = datetime.now()
-            days_since_watered = (now - last_watered).days
-            next_watering_days = max(1, ai_interval - days_since_watered)
-            
-            logger.info(f"💧 Последний полив: {days_since_watered} дней назад, следующий через {next_watering_days} дней")
-        
-        # Сохраняем состояние растения
         current_state = state_info.get('current_state', 'healthy')
         state_reason = state_info.get('state_reason', 'Первичный анализ AI')
         
-        await db.update_plant_state(
-            plant_id=plant_id,
-            user_id=user_id,
-            new_state=current_state,
-            change_reason=state_reason,
-            photo_file_id=analysis_data["photo_file_id"],
-            ai_analysis=raw_analysis,
-            watering_adjustment=state_info.get('watering_adjustment', 0),
-            feeding_adjustment=state_info.get('feeding_adjustment'),
-            recommendations=state_info.get('recommendations', '')
-        )
-        
-        # Сохраняем полный анализ в историю
-        await db.save_full_analysis(
-            plant_id=plant_id,
-            user_id=user_id,
-            photo_file_id=analysis_data["photo_file_id"],
-            full_analysis=raw_analysis,
-            confidence=analysis_data.get("confidence", 0),
-            identified_species=analysis_data.get("plant_name"),
-            detected_state=current_state,
-            watering_advice=watering_info.get("personal_recommendations"),
-            lighting_advice=None
-        )
-        
-        # Создаем напоминание с учётом last_watered
-        await create_plant_reminder(plant_id, user_id, next_watering_days)
+        # Растение, интервалы, состояние и полный анализ - одна транзакция на одном соединении
+        db = await get_db()
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                plant_id = await db.save_plant(
+                    user_id=user_id,
+                    analysis=raw_analysis,
+                    photo_file_id=analysis_data["photo_file_id"],
+                    plant_name=analysis_data.get("plant_name", "Неизвестное растение"),
+                    conn=conn
+                )
+                
+                # Интервал от GPT (уже с учётом сезона) он же базовый -
+                # при сезонной корректировке GPT пересчитает его.
+                # Заодно записываем last_watered, если указан, и считаем дни до полива
+                watering = await db.set_initial_watering(
+                    plant_id, ai_interval, last_watered, now=get_moscow_naive_now(), conn=conn
+                )
+                next_watering_days = watering['next_watering_days']
+                
+                if last_watered:
+                    logger.info(f"💧 Последний полив: {watering['days_since_watered']} дней назад, следующий через {next_watering_days} дней")
+                
+                # Состояние растения (его watering_adjustment применяется к записанному интервалу)
+                await db.update_plant_state(
+                    plant_id=plant_id,
+                    user_id=user_id,
+                    new_state=current_state,
+                    change_reason=state_reason,
+                    photo_file_id=analysis_data["photo_file_id"],
+                    ai_analysis=raw_analysis,
+                    watering_adjustment=state_info.get('watering_adjustment', 0),
+                    feeding_adjustment=state_info.get('feeding_adjustment'),
+                    recommendations=state_info.get('recommendations', ''),
+                    conn=conn
+                )
+                
+                # Сохраняем полный анализ в историю
+                await db.save_full_analysis(
+                    plant_id=plant_id,
+                    user_id=user_id,
+                    photo_file_id=analysis_data["photo_file_id"],
+                    full_analysis=raw_analysis,
+                    confidence=analysis_data.get("confidence", 0),
+                    identified_species=analysis_data.get("plant_name"),
+                    detected_state=current_state,
+                    watering_advice=watering_info.get("personal_recommendations"),
+                    lighting_advice=None,
+                    conn=conn
+                )
+        
+        # Напоминание с учётом last_watered - после коммита: растение уже сохранено,
+        # поэтому сбой здесь только логируем
+        try:
+            await create_plant_reminder(plant_id, user_id, next_watering_days)
+        except Exception as e:
+            logger.error(f"❌ Растение {plant_id} сохранено, но напоминание не создано: {e}")
         
         plant_name = analysis_data.get("plant_name", "растение")
-        state_emoji = STATE_EMOJI.get(current_state, '🌱')
-        state_name = STATE_NAMES.get(current_state, 'Здоровое')
+        state_emoji, state_name = STATE_UI.get(current_state, DEFAULT_STATE_UI)
         
         logger.info(f"✅ Растение сохранено: {plant_name}, интервал полива: {ai_interval} дней, следующий полив через: {next_watering_days} дней")
         
@@ -149,7 +181,7 @@ async def update_plant_state_from_photo(plant_id: int, user_id: int,
         
         state_changed = (new_state != previous_state)
         
-        # Обновляем состояние
+        # Обновляем состояние и дату последнего фото одним UPDATE
         await db.update_plant_state(
             plant_id=plant_id,
             user_id=user_id,
@@ -159,18 +191,10 @@ async def update_plant_state_from_photo(plant_id: int, user_id: int,
             ai_analysis=raw_analysis,
             watering_adjustment=state_info.get('watering_adjustment', 0),
             feeding_adjustment=state_info.get('feeding_adjustment'),
-            recommendations=state_info.get('recommendations', '')
+            recommendations=state_info.get('recommendations', ''),
+            update_last_photo=True
         )
         
-        # Обновляем дату последнего фото
-        async with db.pool.acquire() as conn:
-            await conn.execute("""
-                UPDATE plants 
-                SET last_photo_analysis = CURRENT_TIMESTAMP,
-                    photo_file_id = $1
-                WHERE id = $2
-            """, photo_file_id, plant_id)
-        
         return {
             "success": True,
             "state_changed": state_changed,
@@ -190,27 +214,28 @@ async def get_user_plants_list(user_id: int, limit: int = 15) -> list:
         db = await get_db()
         plants = await db.get_user_plants(user_id, limit=limit)
         
-        formatted_plants = []
-        
-        for plant in plants:
-            plant_data = {
+        # Дни с полива уже посчитаны в SQL (water_days_ago), здесь только сборка словарей
+        emoji_get = STATE_EMOJI.get
+        formatted_plants = [
+            {
+                "id": plant.get('id'),
+                "display_name": plant.get('display_name'),
+                "type": 'growing',
+                "emoji": '🌱',
+                "stage_info": plant.get('stage_info', 'В процессе'),
+                "growing_id": plant.get('growing_id')
+            }
+            if plant.get('type') == 'growing' else
+            {
                 "id": plant.get('id'),
                 "display_name": plant.get('display_name'),
                 "type": plant.get('type', 'regular'),
-                "emoji": '🌱'
+                "emoji": emoji_get(plant.get('current_state', 'healthy'), '🌱'),
+                "current_state": plant.get('current_state', 'healthy'),
+                "water_status": format_days_ago_label(plant.get('water_days_ago'))
             }
-            
-            if plant.get('type') == 'growing':
-                plant_data["emoji"] = '🌱'
-                plant_data["stage_info"] = plant.get('stage_info', 'В процессе')
-                plant_data["growing_id"] = plant.get('growing_id')
-            else:
-                current_state = plant.get('current_state', 'healthy')
-                plant_data["emoji"] = STATE_EMOJI.get(current_state, '🌱')
-                plant_data["current_state"] = current_state
-                plant_data["water_status"] = format_days_ago(plant.get('last_watered'))
-            
-            formatted_plants.append(plant_data)
+            for plant in plants
+        ]
         
         return formatted_plants
         
@@ -223,15 +248,14 @@ async def water_plant(user_id: int, plant_id: int) -> dict:
     """Полить растение"""
     try:
         db = await get_db()
-        plant = await db.get_plant_by_id(plant_id, user_id)
+        # Отметка полива и чтение интервала - одним запросом
+        plant = await db.water_plant_atomic(user_id, plant_id)
         
         if not plant:
             return {"success": False, "error": "Растение не найдено"}
         
-        await db.update_watering(user_id, plant_id)
-        
         # Используем интервал из БД (установлен GPT с учётом сезона)
-        interval = plant.get('watering_interval', 7)
+        interval = plant['watering_interval']
         
         await create_plant_reminder(plant_id, user_id, interval)
         
@@ -254,7 +278,9 @@ async def water_all_plants(user_id: int) -> dict:
     """Полить все растения"""
     try:
         db = await get_db()
-        await db.update_watering(user_id)
+        # Полив, история и новые напоминания всех растений - один запрос
+        watered_count = await db.water_all_plants(user_id)
+        logger.info(f"💧 Массовый полив: {watered_count} растений, напоминания перенесены")
         
         return {"success": True}
         
@@ -307,49 +333,73 @@ async def get_plant_details(plant_id: int, user_id: int) -> dict:
         if not plant:
             return None
         
-        plant_name = plant['display_name']
-        current_state = plant.get('current_state', 'healthy')
-        state_emoji = STATE_EMOJI.get(current_state, '🌱')
-        state_name = STATE_NAMES.get(current_state, 'Здоровое')
-        watering_interval = plant.get('watering_interval', 7)
-        state_changes = plant.get('state_changes_count', 0)
-        water_status = format_days_ago(plant.get('last_watered'))
-        
-        return {
-            "plant_id": plant_id,
-            "plant_name": plant_name,
-            "current_state": current_state,
-            "state_emoji": state_emoji,
-            "state_name": state_name,
-            "watering_interval": watering_interval,
-            "state_changes_count": state_changes,
-            "water_status": water_status
-        }
+        return _format_plant_details(plant_id, plant)
         
     except Exception as e:
         logger.error(f"Ошибка получения деталей: {e}")
         return None
 
 
+async def get_plant_details_with_history(plant_id: int, user_id: int, limit: int = 10) -> tuple:
+    """Детали растения и история состояний за один запрос к БД
+    
+    Returns:
+        tuple: (детали как в get_plant_details или None, история как в get_plant_state_history)
+    """
+    try:
+        db = await get_db()
+        plant, history = await db.get_plant_with_history(plant_id, user_id, limit=limit)
+        
+        if not plant:
+            return None, []
+        
+        return _format_plant_details(plant_id, plant), _format_state_history(history)
+        
+    except Exception as e:
+        logger.error(f"Ошибка получения деталей с историей: {e}")
+        return None, []
+
+
+def _format_plant_details(plant_id: int, plant: dict) -> dict:
+    """Детали растения для экранов управления"""
+    current_state = plant.get('current_state', 'healthy')
+    state_emoji, state_name = STATE_UI.get(current_state, DEFAULT_STATE_UI)
+    
+    return {
+        "plant_id": plant_id,
+        "plant_name": plant['display_name'],
+        "current_state": current_state,
+        "state_emoji": state_emoji,
+        "state_name": state_name,
+        "watering_interval": plant.get('watering_interval', 7),
+        "state_changes_count": plant.get('state_changes_count', 0),
+        "water_status": format_days_ago(plant.get('last_watered'))
+    }
+
+
 async def get_plant_state_history(plant_id: int, limit: int = 10) -> list:
     """Получить историю изменений состояний"""
     try:
         db = await get_db()
         history = await db.get_plant_state_history(plant_id, limit=limit)
-        
-        formatted_history = []
-        for entry in history:
-            formatted_history.append({
-                "date": entry.get('change_date'),
-                "from_state": entry.get('previous_state'),
-                "to_state": entry.get('new_state'),
-                "reason": entry.get('change_reason'),
-                "emoji_from": STATE_EMOJI.get(entry.get('previous_state'), ''),
-                "emoji_to": STATE_EMOJI.get(entry.get('new_state'), '🌱')
-            })
-        
-        return formatted_history
+        return _format_state_history(history)
         
     except Exception as e:
         logger.error(f"Ошибка получения истории: {e}")
         return []
+
+
+def _format_state_history(history: list) -> list:
+    """История состояний для показа пользователю"""
+    emoji_get = STATE_EMOJI.get
+    return [
+        {
+            "date": entry.get('change_date'),
+            "from_state": entry.get('previous_state'),
+            "to_state": entry.get('new_state'),
+            "reason": entry.get('change_reason'),
+            "emoji_from": emoji_get(entry.get('previous_state'), ''),
+            "emoji_to": emoji_get(entry.get('new_state'), '🌱')
+        }
+        for entry in history
+    ]
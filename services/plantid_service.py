@@ -1,25 +1,150 @@
+import asyncio
 import logging
-import base64
+import time
 import httpx
+import orjson
 
 from config import PLANTID_API_KEY
+from services.ai_cache import plantid_cache, make_cache_key
+from utils.image_utils import optimize_image_for_analysis
 
 logger = logging.getLogger(__name__)
 
 PLANTID_API_URL = "https://api.plant.id/v3/identification"
 PLANTHEALTH_API_URL = "https://api.plant.id/v3/health_assessment"
 
+# Таймауты по фазам: зависшее соединение отпускаем быстро, а не через 30 с
+PLANTID_TIMEOUT = httpx.Timeout(connect=5.0, read=25.0, write=10.0, pool=2.0)
 
-async def identify_with_plantid(image_data: bytes, include_similar: bool = False) -> dict:
-    """Идентификация растения через Plant.id API"""
+# Общий клиент: идентификация и диагностика одного фото идут по одному HTTP/2-соединению
+_client = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Клиент создаётся при первом запросе к Plant.id, а не при импорте"""
+    global _client
+    if _client is None or _client.is_closed:
+        # retries транспорта повторяют только неудачное соединение - запрос ещё
+        # не отправлен, поэтому повтор POST не приводит к двойной оплате
+        _client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                http1=True,
+                http2=True,
+                retries=2,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+            ),
+            timeout=PLANTID_TIMEOUT
+        )
+    return _client
+
+
+async def close_plantid_client():
+    """Закрыть соединения при остановке бота"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def _image_files(image_data: bytes) -> dict:
+    """Фото для multipart/form-data: байты как есть, без base64"""
+    return {'images': ('photo.jpg', image_data, 'image/jpeg')}
+
+
+async def prepare_plantid_image(image_data: bytes) -> bytes:
+    """Фото для Plant.id: классификатору хватает 1024 px по длинной стороне, JPEG 85"""
+    return await optimize_image_for_analysis(image_data, high_quality=False)
+
+
+_TIMEOUT_PHASES = {
+    httpx.ConnectTimeout: "connect",
+    httpx.ReadTimeout: "read",
+    httpx.WriteTimeout: "write",
+    httpx.PoolTimeout: "pool",
+}
+
+# Предохранитель: после PLANTID_BREAKER_THRESHOLD таймаутов подряд запросы
+# PLANTID_BREAKER_COOLDOWN_SECONDS не отправляются, затем пробуем снова
+PLANTID_BREAKER_THRESHOLD = 5
+PLANTID_BREAKER_COOLDOWN_SECONDS = 60
+_breaker = {"failures": 0, "opened_at": 0.0}
+
+
+def _breaker_is_open() -> bool:
+    return (_breaker["failures"] >= PLANTID_BREAKER_THRESHOLD
+            and time.monotonic() - _breaker["opened_at"] < PLANTID_BREAKER_COOLDOWN_SECONDS)
+
+
+def _breaker_record(result: dict):
+    """Учесть результат запроса: таймаут - сбой, любой ответ API - сброс счётчика"""
+    if result.get("error", "").startswith("Timeout"):
+        _breaker["failures"] += 1
+        _breaker["opened_at"] = time.monotonic()
+        if _breaker["failures"] == PLANTID_BREAKER_THRESHOLD:
+            logger.warning(f"🔌 Plant.id недоступен, пауза {PLANTID_BREAKER_COOLDOWN_SECONDS} с")
+    else:
+        _breaker["failures"] = 0
+
+
+_UNAVAILABLE = {"success": False, "error": "unavailable"}
+
+
+# Одинаковые запросы, уже ушедшие в API: ключ кэша -> задача
+_inflight = {}
+
+
+async def _single_flight(key: str, request_factory) -> dict:
+    """Повторный запрос того же фото, пока первый в пути, ждёт его результата"""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(request_factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        logger.info("⏳ Plant.id: такой же запрос уже выполняется, ждём его")
+    # shield: отмена одного ожидающего не отменяет запрос для остальных
+    return dict(await asyncio.shield(task))
+
+
+def _is_cacheable(result: dict) -> bool:
+    """Кэшируем успешные и окончательные ответы; таймауты, 429 и 5xx - нет"""
+    if result.get("success"):
+        return True
+    error = result.get("error", "")
+    return error.startswith("HTTP 4") and error != "HTTP 429"
+
+
+async def identify_with_plantid(image_data: bytes, include_similar: bool = False,
+                                client: httpx.AsyncClient = None, upload_data: bytes = None) -> dict:
+    """Идентификация растения через Plant.id API (повторное фото - из кэша)
+    
+    upload_data - уже уменьшенное prepare_plantid_image фото, если оно есть
+    """
     if not PLANTID_API_KEY:
         logger.warning("Plant.id API key не установлен")
         return {"success": False, "error": "API key отсутствует"}
     
+    cache_key = make_cache_key(image_data, 'identify', include_similar)
+    cached = plantid_cache.get(cache_key)
+    if cached:
+        return cached
+    
+    if _breaker_is_open():
+        return dict(_UNAVAILABLE)
+    
+    async def request():
+        data = upload_data if upload_data is not None else await prepare_plantid_image(image_data)
+        result = await _identify_with_plantid(data, include_similar, client or _get_client())
+        _breaker_record(result)
+        if _is_cacheable(result):
+            plantid_cache.set(cache_key, result)
+        return result
+    
+    return await _single_flight(cache_key, request)
+
+
+async def _identify_with_plantid(image_data: bytes, include_similar: bool, client: httpx.AsyncClient) -> dict:
     try:
-        # Конвертируем изображение в base64
-        base64_image = base64.b64encode(image_data).decode('utf-8')
-        
         # Параметры запроса
         params = {
             'details': 'common_names,url,description,taxonomy',
@@ -29,28 +154,24 @@ async def identify_with_plantid(image_data: bytes, include_similar: bool = False
         if include_similar:
             params['details'] += ',similar_images'
         
-        # Тело запроса
-        payload = {
-            'images': [base64_image],
-            'latitude': 55.7558,  # Москва (опционально)
-            'longitude': 37.6173,
-            'similar_images': include_similar
+        # Поля формы; фото уходит файлом, без base64 (+33% к размеру)
+        form = {
+            'latitude': '55.7558',  # Москва (опционально)
+            'longitude': '37.6173',
+            'similar_images': 'true' if include_similar else 'false'
         }
         
         # Отправляем запрос
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                PLANTID_API_URL,
-                params=params,
-                json=payload,
-                headers={
-                    'Api-Key': PLANTID_API_KEY,
-                    'Content-Type': 'application/json'
-                }
-            )
-            
-            response.raise_for_status()
-            data = response.json()
+        response = await client.post(
+            PLANTID_API_URL,
+            params=params,
+            data=form,
+            files=_image_files(image_data),
+            headers={'Api-Key': PLANTID_API_KEY}
+        )
+        
+        response.raise_for_status()
+        data = orjson.loads(response.content)
         
         # Парсим ответ
         if not data.get('result') or not data['result'].get('classification'):
@@ -65,15 +186,18 @@ async def identify_with_plantid(image_data: bytes, include_similar: bool = False
         # Берем лучший результат
         best_match = suggestions[0]
         
+        details = best_match.get('details') or {}
+        description = details.get('description') or {}
+        
         result = {
             "success": True,
             "species": best_match.get('name', 'Unknown'),
-            "common_names": best_match.get('details', {}).get('common_names', []),
+            "common_names": details.get('common_names', []),
             "probability": best_match.get('probability', 0) * 100,  # В процентах
             "scientific_name": best_match.get('name', ''),
-            "taxonomy": best_match.get('details', {}).get('taxonomy', {}),
-            "description": best_match.get('details', {}).get('description', {}).get('value', ''),
-            "url": best_match.get('details', {}).get('url', ''),
+            "taxonomy": details.get('taxonomy', {}),
+            "description": description.get('value', ''),
+            "url": details.get('url', ''),
             "is_plant": data['result'].get('is_plant', {}).get('binary', True),
             "similar_images": []
         }
@@ -87,9 +211,10 @@ async def identify_with_plantid(image_data: bytes, include_similar: bool = False
         logger.info(f"✅ Plant.id: {result['species']} ({result['probability']:.1f}%)")
         return result
         
-    except httpx.TimeoutException:
-        logger.error("❌ Plant.id timeout")
-        return {"success": False, "error": "Timeout"}
+    except httpx.TimeoutException as e:
+        phase = _TIMEOUT_PHASES.get(type(e), "timeout")
+        logger.error(f"❌ Plant.id timeout ({phase})")
+        return {"success": False, "error": f"Timeout: {phase}"}
     except httpx.HTTPStatusError as e:
         logger.error(f"❌ Plant.id HTTP error: {e.response.status_code}")
         return {"success": False, "error": f"HTTP {e.response.status_code}"}
@@ -98,40 +223,52 @@ async def identify_with_plantid(image_data: bytes, include_similar: bool = False
         return {"success": False, "error": str(e)}
 
 
-async def diagnose_with_planthealth(image_data: bytes) -> dict:
-    """Диагностика болезней через Plant.health API"""
+async def diagnose_with_planthealth(image_data: bytes, client: httpx.AsyncClient = None,
+                                    upload_data: bytes = None) -> dict:
+    """Диагностика болезней через Plant.health API (повторное фото - из кэша)
+    
+    upload_data - уже уменьшенное prepare_plantid_image фото, если оно есть
+    """
     if not PLANTID_API_KEY:
         return {"success": False, "error": "API key отсутствует"}
     
+    cache_key = make_cache_key(image_data, 'health')
+    cached = plantid_cache.get(cache_key)
+    if cached:
+        return cached
+    
+    if _breaker_is_open():
+        return dict(_UNAVAILABLE)
+    
+    async def request():
+        data = upload_data if upload_data is not None else await prepare_plantid_image(image_data)
+        result = await _diagnose_with_planthealth(data, client or _get_client())
+        _breaker_record(result)
+        if _is_cacheable(result):
+            plantid_cache.set(cache_key, result)
+        return result
+    
+    return await _single_flight(cache_key, request)
+
+
+async def _diagnose_with_planthealth(image_data: bytes, client: httpx.AsyncClient) -> dict:
     try:
-        # Конвертируем изображение в base64
-        base64_image = base64.b64encode(image_data).decode('utf-8')
-        
         # Параметры запроса
         params = {
             'details': 'description,treatment',
             'language': 'ru'
         }
         
-        # Тело запроса
-        payload = {
-            'images': [base64_image]
-        }
+        # Отправляем запрос: фото файлом в multipart
+        response = await client.post(
+            PLANTHEALTH_API_URL,
+            params=params,
+            files=_image_files(image_data),
+            headers={'Api-Key': PLANTID_API_KEY}
+        )
         
-        # Отправляем запрос
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                PLANTHEALTH_API_URL,
-                params=params,
-                json=payload,
-                headers={
-                    'Api-Key': PLANTID_API_KEY,
-                    'Content-Type': 'application/json'
-                }
-            )
-            
-            response.raise_for_status()
-            data = response.json()
+        response.raise_for_status()
+        data = orjson.loads(response.content)
         
         # Проверяем здоровье растения
         is_healthy = data.get('result', {}).get('is_healthy', {}).get('binary', True)
@@ -149,12 +286,13 @@ async def diagnose_with_planthealth(image_data: bytes) -> dict:
         
         diseases = []
         for suggestion in suggestions[:3]:  # Топ-3 болезни
+            details = suggestion.get('details') or {}
             disease = {
                 "name": suggestion.get('name', 'Unknown'),
                 "probability": suggestion.get('probability', 0) * 100,
-                "description": suggestion.get('details', {}).get('description', ''),
-                "treatment": suggestion.get('details', {}).get('treatment', {}).get('chemical', []),
-                "category": suggestion.get('details', {}).get('common_names', [])
+                "description": details.get('description', ''),
+                "treatment": (details.get('treatment') or {}).get('chemical', []),
+                "category": details.get('common_names', [])
             }
             diseases.append(disease)
         
@@ -166,14 +304,42 @@ async def diagnose_with_planthealth(image_data: bytes) -> dict:
             "diseases": diseases
         }
         
-    except httpx.TimeoutException:
-        logger.error("❌ Plant.health timeout")
-        return {"success": False, "error": "Timeout"}
+    except httpx.TimeoutException as e:
+        phase = _TIMEOUT_PHASES.get(type(e), "timeout")
+        logger.error(f"❌ Plant.health timeout ({phase})")
+        return {"success": False, "error": f"Timeout: {phase}"}
+    except httpx.HTTPStatusError as e:
+        logger.error(f"❌ Plant.health HTTP error: {e.response.status_code}")
+        return {"success": False, "error": f"HTTP {e.response.status_code}"}
     except Exception as e:
         logger.error(f"❌ Plant.health error: {e}")
         return {"success": False, "error": str(e)}
 
 
+async def identify_and_diagnose(image_data: bytes, include_similar: bool = False) -> tuple:
+    """
+    Идентификация и диагностика одного фото параллельно
+    
+    Returns:
+        tuple: (результат identify_with_plantid, результат diagnose_with_planthealth)
+    """
+    # Фото уменьшаем один раз для обоих запросов - и только если хотя бы один из них
+    # действительно уйдёт в API: без ключа, при открытом предохранителе или когда оба
+    # ответа уже в кэше ресайз в пуле процессов не нужен
+    client = _get_client()
+    upload_data = None
+    if PLANTID_API_KEY and not _breaker_is_open() and not (
+        plantid_cache.has(make_cache_key(image_data, 'identify', include_similar))
+        and plantid_cache.has(make_cache_key(image_data, 'health'))
+    ):
+        upload_data = await prepare_plantid_image(image_data)
+    identification, diagnosis = await asyncio.gather(
+        identify_with_plantid(image_data, include_similar, client=client, upload_data=upload_data),
+        diagnose_with_planthealth(image_data, client=client, upload_data=upload_data)
+    )
+    return identification, diagnosis
+
+
 async def get_plant_details(species_name: str) -> dict:
     """Получить детальную информацию о растении (если нужно)"""
     # Эта функция может быть расширена для получения
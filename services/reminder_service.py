@@ -1,300 +1,400 @@
+import asyncio
 import logging
-from datetime import datetime, timedelta
+import asyncpg
+from datetime import date, datetime
+from itertools import groupby
+from operator import itemgetter
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramRetryAfter
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
-from config import STATE_EMOJI, STATE_NAMES
-from utils.time_utils import get_moscow_now
+from config import STATE_EMOJI, STATE_UI, DEFAULT_STATE_UI
+from utils.time_utils import get_moscow_now, format_days_ago_label
+from utils.rate_limit import telegram_global_limiter, telegram_chat_limiter
 from database import get_db
 from keyboards.plant_menu import watering_reminder_actions
 
 logger = logging.getLogger(__name__)
 
+# Ожидаемые сбои БД (рестарт, обрыв соединения): логируем без трейсбека и ждём следующей проверки
+_DB_ERRORS = (asyncpg.PostgresError, asyncpg.InterfaceError, OSError)
+
+# Сколько сообщений отправляем в Telegram одновременно при рассылке напоминаний
+REMINDER_SEND_CONCURRENCY = 25
+_send_semaphore = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+# Отправленные напоминания отмечаются в БД пачками по столько штук, не дожидаясь конца прохода
+REMINDER_MARK_BATCH = 100
+# Сколько ждём ответа Bot API на одну отправку, прежде чем считать её неудачной
+REMINDER_SEND_TIMEOUT = 10
+# Напоминаний за один проход; после отметки об отправке следующий проход берёт остальные
+REMINDER_SWEEP_LIMIT = 5000
+
+# Разделитель в логах проверок
+_LOG_RULE = "=" * 60
+
+
+# Подсказка к напоминанию о поливе в зависимости от состояния растения
+WATERING_ADVICE = {
+    'flowering': "💐 Растение цветет - поливайте чаще!",
+    'dormancy': "😴 Период покоя - поливайте реже",
+    'stress': "⚠️ Растение в стрессе - проверьте влажность почвы!",
+}
+
+# "Просрочено на N ...": 1 день, 2-4 дня, остальное - дней
+_OVERDUE_DAYS_WORD = {1: 'день', 2: 'дня', 3: 'дня', 4: 'дня'}
+
+# Клавиатура месячного напоминания не зависит от пользователя - собираем один раз
+_MONTHLY_REMINDER_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🌿 К моей коллекции", callback_data="my_plants")],
+    [InlineKeyboardButton(text="⏰ Напомнить через неделю", callback_data="snooze_monthly_reminder")],
+    [InlineKeyboardButton(text="🔕 Отключить", callback_data="disable_monthly_reminders")],
+])
+
+
+def _task_reminder_keyboard(growing_id: int, task_day: int) -> InlineKeyboardMarkup:
+    """Действия в напоминании о задаче по выращиванию"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Выполнено!", callback_data=f"task_done_{growing_id}_{task_day}")],
+        [InlineKeyboardButton(text="📸 Добавить фото", callback_data=f"add_diary_photo_{growing_id}")],
+    ])
+
+
+# Все напоминания, которые пора отправить сегодня: о поливе и о задачах по выращиванию.
+# Одна выборка через UNION ALL, kind различает тип строки.
+# Порядок колонок важен: отправители распаковывают строку по позициям.
+# Строки чередуются по пользователям (сначала первое напоминание каждого, потом второе...),
+# чтобы воркеры не ждали лимита в один чат, пока остальные пользователи стоят в очереди
+_DUE_REMINDERS_SQL = """
+    SELECT * FROM (
+        SELECT 'watering' as kind, r.id as reminder_id, p.user_id, p.id as object_id,
+               COALESCE(p.custom_name, p.plant_name, 'Растение #' || p.id) as display_name,
+               p.photo_file_id,
+               p.last_watered, 
+               COALESCE(p.watering_interval, 5) as watering_interval, 
+               p.current_state,
+               r.next_date,
+               NULL::integer as task_day
+        FROM plants p
+        JOIN user_settings us ON p.user_id = us.user_id
+        JOIN reminders r ON r.plant_id = p.id 
+                        AND r.reminder_type = 'watering' 
+                        AND r.is_active = TRUE
+        WHERE p.reminder_enabled = TRUE 
+          AND us.reminder_enabled = TRUE
+          AND p.plant_type = 'regular'
+          AND r.next_date < $1::date + 1
+          AND (r.last_sent IS NULL OR r.last_sent < $1::date)
+        UNION ALL
+        SELECT 'task', r.id, gp.user_id, gp.id,
+               gp.plant_name,
+               gp.photo_file_id,
+               NULL, NULL, NULL,
+               r.next_date,
+               r.task_day
+        FROM reminders r
+        JOIN growing_plants gp ON r.growing_plant_id = gp.id
+        JOIN user_settings us ON gp.user_id = us.user_id
+        WHERE r.reminder_type = 'task'
+          AND r.is_active = TRUE
+          AND us.reminder_enabled = TRUE
+          AND gp.status = 'active'
+          AND r.next_date < $1::date + 1
+          AND (r.last_sent IS NULL OR r.last_sent < $1::date)
+    ) due
+    ORDER BY ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY next_date, reminder_id),
+             next_date ASC, reminder_id ASC
+    LIMIT $2
+"""
+
+
+async def _drain_queue(queue: asyncio.Queue, handle):
+    """Воркер рассылки: обрабатывает строки из очереди до сигнала остановки (None)"""
+    while True:
+        row = await queue.get()
+        if row is None:
+            return
+        await handle(row)
+
+
+async def _rate_limited(method, kwargs: dict):
+    """Запрос к Bot API в пределах лимитов: ~1 сообщение в секунду в чат и ~30 на бота"""
+    await telegram_chat_limiter.acquire(kwargs['chat_id'])
+    await telegram_global_limiter.acquire()
+    # Зависшее соединение не должно задерживать всю рассылку
+    return await asyncio.wait_for(method(**kwargs), REMINDER_SEND_TIMEOUT)
+
+
+async def _call_telegram(method, **kwargs):
+    """Вызов Bot API для рассылки
+    
+    Отправки идут через общие лимитеры частоты. Если Telegram всё же ответил
+    flood-лимитом, ждём retry_after и повторяем один раз, остальные
+    сообщения пачки тем временем продолжают уходить. Если пользователь
+    заблокировал бота, выключаем ему напоминания, чтобы не слать каждый день.
+    """
+    try:
+        try:
+            return await _rate_limited(method, kwargs)
+        except TelegramRetryAfter as e:
+            logger.warning(f"⏳ Flood-лимит Telegram для {kwargs.get('chat_id')}: повтор через {e.retry_after} с")
+            await asyncio.sleep(e.retry_after)
+            return await _rate_limited(method, kwargs)
+    except TelegramForbiddenError:
+        user_id = kwargs.get('chat_id')
+        logger.warning(f"🚫 Пользователь {user_id} заблокировал бота - напоминания выключены")
+        db = await get_db()
+        await db.disable_user_reminders(user_id)
+        raise
+
+
+async def _bounded(coro):
+    """Выполнить отправку, не превышая лимит одновременных запросов к Bot API"""
+    async with _send_semaphore:
+        return await coro
+
 
 async def check_and_send_reminders(bot):
     """Проверка и отправка всех напоминаний"""
     try:
-        logger.info("=" * 60)
-        logger.info("🔔 НАЧАЛО ПРОВЕРКИ НАПОМИНАНИЙ")
-        logger.info(f"🕐 Текущее время (МСК): {get_moscow_now()}")
-        logger.info("=" * 60)
-        
-        await send_watering_reminders(bot)
-        await send_growing_reminders(bot)
+        # Время фиксируем один раз на всю проверку и передаём вниз
+        moscow_now = get_moscow_now()
         
-        logger.info("=" * 60)
+        logger.info(_LOG_RULE)
+        logger.info("🔔 НАЧАЛО ПРОВЕРКИ НАПОМИНАНИЙ")
+        logger.info(f"🕐 Текущее время (МСК): {moscow_now}")
+        logger.info(_LOG_RULE)
+        
+        # Накопившиеся напоминания уходят пачками: каждая отмечается отправленной,
+        # прежде чем выбрать следующую. Останавливаемся, когда пачка неполная
+        # или в ней ничего не удалось отправить (иначе повторяли бы те же ошибки)
+        while True:
+            found, sent = await send_due_reminders(bot, moscow_now)
+            if found < REMINDER_SWEEP_LIMIT or not sent:
+                break
+        
+        logger.info(_LOG_RULE)
         logger.info("✅ ПРОВЕРКА НАПОМИНАНИЙ ЗАВЕРШЕНА")
-        logger.info("=" * 60)
+        logger.info(_LOG_RULE)
     except Exception as e:
         logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА проверки напоминаний: {e}", exc_info=True)
 
 
-async def send_watering_reminders(bot):
-    """Отправка напоминаний о поливе"""
+async def send_due_reminders(bot, moscow_now: datetime = None) -> tuple:
+    """Отправка напоминаний о поливе и задачах по выращиванию за один проход
+    
+    Берёт не больше REMINDER_SWEEP_LIMIT напоминаний.
+    Возвращает (найдено, отправлено); при недоступной базе - (0, 0)
+    """
     try:
         db = await get_db()
-        moscow_now = get_moscow_now()
+        moscow_now = moscow_now or get_moscow_now()
         moscow_date = moscow_now.date()
         
         logger.info("")
-        logger.info("💧 ПРОВЕРКА НАПОМИНАНИЙ О ПОЛИВЕ")
+        logger.info("💧🌱 ПРОВЕРКА НАПОМИНАНИЙ О ПОЛИВЕ И ВЫРАЩИВАНИИ")
         logger.info(f"📅 Дата проверки: {moscow_date}")
         
+        # Пачка уже ограничена REMINDER_SWEEP_LIMIT: читаем её целиком и сразу отдаём соединение,
+        # чтобы не держать его и транзакцию открытыми всю рассылку (~30 сообщений в секунду)
         async with db.pool.acquire() as conn:
-            total_plants = await conn.fetchval("""
-                SELECT COUNT(*) FROM plants p
-                JOIN reminders r ON r.plant_id = p.id AND r.reminder_type = 'watering' AND r.is_active = TRUE
-                WHERE p.plant_type = 'regular'
-            """)
-            logger.info(f"📊 Всего растений с активными напоминаниями: {total_plants}")
-            
-            plants_to_water = await conn.fetch("""
-                SELECT p.id, p.user_id, 
-                       COALESCE(p.custom_name, p.plant_name, 'Растение #' || p.id) as display_name,
-                       p.last_watered, 
-                       COALESCE(p.watering_interval, 5) as watering_interval, 
-                       p.photo_file_id, p.notes, p.current_state, p.growth_stage,
-                       r.id as reminder_id,
-                       r.next_date,
-                       r.last_sent,
-                       us.reminder_enabled as user_reminder_enabled,
-                       p.reminder_enabled as plant_reminder_enabled
-                FROM plants p
-                JOIN user_settings us ON p.user_id = us.user_id
-                JOIN reminders r ON r.plant_id = p.id 
-                                AND r.reminder_type = 'watering' 
-                                AND r.is_active = TRUE
-                WHERE p.reminder_enabled = TRUE 
-                  AND us.reminder_enabled = TRUE
-                  AND p.plant_type = 'regular'
-                  AND r.next_date::date <= $1::date
-                  AND (r.last_sent IS NULL OR r.last_sent::date < $1::date)
-                ORDER BY r.next_date ASC
-            """, moscow_date)
-            
-            logger.info(f"🔍 Найдено растений для напоминания: {len(plants_to_water)}")
+            rows = await conn.fetch(_DUE_REMINDERS_SQL, moscow_date, REMINDER_SWEEP_LIMIT)
+        
+        found_count = {'watering': 0, 'task': 0}
+        for row in rows:
+            found_count[row[0]] += 1
+        logger.info(f"🔍 Найдено напоминаний: о поливе {found_count['watering']}, по выращиванию {found_count['task']}")
+        
+        sent_at = moscow_now.replace(tzinfo=None)
+        sent_count = 0
+        failed_count = 0
+        unmarked_ids = []
+        
+        async def flush_marks():
+            """Отметить отправленные напоминания одним UPDATE; при ошибке БД они останутся до следующей попытки"""
+            if not unmarked_ids:
+                return
+            batch = unmarked_ids[:]
+            unmarked_ids.clear()
+            try:
+                await db.mark_reminders_sent(batch, sent_at)
+            except _DB_ERRORS as e:
+                logger.warning(f"⚠️ Не удалось отметить {len(batch)} отправленных напоминаний: {e}")
+                unmarked_ids.extend(batch)
+        
+        async def send_one(row):
+            nonlocal sent_count, failed_count
+            kind = row[0]
+            try:
+                if kind == 'watering':
+                    reminder_id = await _bounded(send_single_watering_reminder(bot, row, moscow_date))
+                else:
+                    reminder_id = await _bounded(send_task_reminder(bot, row))
+            except TelegramAPIError as e:
+                failed_count += 1
+                logger.warning(f"⚠️ Напоминание {kind} для растения {row[3]} не отправлено: {e}")
+                return
+            except asyncio.TimeoutError:
+                failed_count += 1
+                logger.warning(f"⏱️ Напоминание {kind} для растения {row[3]}: Telegram не ответил за {REMINDER_SEND_TIMEOUT} с")
+                return
+            except Exception as e:
+                failed_count += 1
+                logger.error(f"❌ Ошибка отправки напоминания {kind} для растения {row[3]}: {e}", exc_info=True)
+                return
             
-            if len(plants_to_water) > 0:
-                logger.info("📋 СПИСОК РАСТЕНИЙ ДЛЯ НАПОМИНАНИЙ:")
-                for i, plant in enumerate(plants_to_water, 1):
-                    days_overdue = (moscow_date - plant['next_date'].date()).days
-                    logger.info(f"   {i}. ID={plant['id']}, User={plant['user_id']}, "
-                              f"Название='{plant['display_name']}', "
-                              f"Просрочено на {days_overdue} дней, "
-                              f"NextDate={plant['next_date'].date()}, "
-                              f"LastSent={plant['last_sent'].date() if plant['last_sent'] else 'никогда'}")
-            else:
-                logger.info("✅ Нет растений требующих напоминания на эту дату")
-            
-            sent_count = 0
-            error_count = 0
-            
-            for plant in plants_to_water:
-                try:
-                    await send_single_watering_reminder(bot, plant)
-                    sent_count += 1
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"❌ Ошибка отправки напоминания для растения {plant['id']}: {e}")
-            
-            logger.info(f"📊 ИТОГО: Отправлено {sent_count}, Ошибок {error_count}")
+            sent_count += 1
+            unmarked_ids.append(reminder_id)
+            if len(unmarked_ids) >= REMINDER_MARK_BATCH:
+                await flush_marks()
+        
+        queue = asyncio.Queue()
+        for row in rows:
+            queue.put_nowait(row)
+        workers = [asyncio.create_task(_drain_queue(queue, send_one)) for _ in range(REMINDER_SEND_CONCURRENCY)]
+        for _ in workers:
+            queue.put_nowait(None)
+        
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # Остаток отмечаем даже при сбое или отмене, иначе повторная проверка отправит его ещё раз
+            await flush_marks()
+        
+        logger.info(f"📊 ИТОГО: Отправлено {sent_count}, Ошибок {failed_count}")
+        if unmarked_ids:
+            # Неотмеченные напоминания снова попадут в выборку: следующую пачку в этот раз не берём
+            logger.warning(f"⚠️ {len(unmarked_ids)} отправленных напоминаний не отмечены в БД")
+            return len(rows), 0
+        return len(rows), sent_count
                 
-    except Exception as e:
-        logger.error(f"❌ ОШИБКА send_watering_reminders: {e}", exc_info=True)
+    except _DB_ERRORS as e:
+        logger.warning(f"⚠️ send_due_reminders: база недоступна, повторим на следующей проверке: {e}")
+        return 0, 0
 
 
-async def send_single_watering_reminder(bot, plant_row):
-    """Отправка одного напоминания о поливе"""
-    try:
-        user_id = plant_row['user_id']
-        plant_id = plant_row['id']
-        plant_name = plant_row['display_name']
-        current_state = plant_row.get('current_state', 'healthy')
-        
-        moscow_now = get_moscow_now()
-        
-        days_overdue = (moscow_now.date() - plant_row['next_date'].date()).days
-        
-        if plant_row['last_watered']:
-            days_ago = (moscow_now.date() - plant_row['last_watered'].date()).days
-            if days_ago == 0:
-                time_info = f"Последний полив был сегодня"
-            elif days_ago == 1:
-                time_info = f"Последний полив был вчера"
-            else:
-                time_info = f"Последний полив был {days_ago} дней назад"
-        else:
-            time_info = "Растение еще ни разу не поливали"
-        
-        state_emoji = STATE_EMOJI.get(current_state, '🌱')
-        state_name = STATE_NAMES.get(current_state, 'Здоровое')
-        
-        message_text = f"💧 <b>Время полить растение!</b>\n\n"
-        message_text += f"{state_emoji} <b>{plant_name}</b>\n"
-        message_text += f"📊 Состояние: {state_name}\n"
-        message_text += f"⏰ {time_info}\n"
-        
-        if days_overdue > 0:
-            message_text += f"⚠️ <b>Просрочено на {days_overdue} {'день' if days_overdue == 1 else 'дня' if days_overdue < 5 else 'дней'}</b>\n"
-        
-        message_text += f"\n"
-        
-        if current_state == 'flowering':
-            message_text += f"💐 Растение цветет - поливайте чаще!\n"
-        elif current_state == 'dormancy':
-            message_text += f"😴 Период покоя - поливайте реже\n"
-        elif current_state == 'stress':
-            message_text += f"⚠️ Растение в стрессе - проверьте влажность почвы!\n"
-        
-        interval = plant_row.get('watering_interval', 5)
-        message_text += f"\n⏱️ Интервал: каждые {interval} дней"
-        
-        keyboard = watering_reminder_actions(plant_id)
-        
-        logger.info(f"📤 Отправка напоминания: User={user_id}, Plant='{plant_name}' (ID={plant_id}), Просрочено={days_overdue} дней")
-        
-        await bot.send_photo(
+async def send_single_watering_reminder(bot, plant_row, moscow_date: date) -> int:
+    """Отправка одного напоминания о поливе, возвращает ID отправленного напоминания
+    
+    moscow_date - дата проверки, общая для всей пачки напоминаний.
+    Ошибки отправки пробрасываются: их логирует и считает send_due_reminders
+    """
+    (_, reminder_id, user_id, plant_id, plant_name, photo_file_id,
+     last_watered, interval, current_state, next_date, _) = plant_row
+    
+    days_overdue = (moscow_date - next_date.date()).days
+    
+    if last_watered:
+        time_info = f"Последний полив был {format_days_ago_label((moscow_date - last_watered.date()).days)}"
+    else:
+        time_info = "Растение еще ни разу не поливали"
+    
+    state_emoji, state_name = STATE_UI.get(current_state, DEFAULT_STATE_UI)
+    
+    lines = [
+        "💧 <b>Время полить растение!</b>",
+        "",
+        f"{state_emoji} <b>{plant_name}</b>",
+        f"📊 Состояние: {state_name}",
+        f"⏰ {time_info}",
+    ]
+    
+    if days_overdue > 0:
+        lines.append(f"⚠️ <b>Просрочено на {days_overdue} {_OVERDUE_DAYS_WORD.get(days_overdue, 'дней')}</b>")
+    
+    lines.append("")
+    
+    advice = WATERING_ADVICE.get(current_state)
+    if advice:
+        lines.append(advice)
+    
+    lines.append("")
+    lines.append(f"⏱️ Интервал: каждые {interval} дней")
+    
+    message_text = "\n".join(lines)
+    
+    keyboard = watering_reminder_actions(plant_id)
+    
+    logger.debug("📤 Отправка напоминания: User=%s, Plant='%s' (ID=%s), Просрочено=%d дней",
+                 user_id, plant_name, plant_id, days_overdue)
+    
+    await _call_telegram(
+        bot.send_photo,
+        chat_id=user_id,
+        photo=photo_file_id,
+        caption=message_text,
+        parse_mode="HTML",
+        reply_markup=keyboard
+    )
+    
+    logger.debug("✅ Напоминание о поливе отправлено: растение %s", plant_id)
+    return reminder_id
+
+
+async def send_task_reminder(bot, reminder_row) -> int:
+    """Отправка напоминания о задаче, возвращает ID отправленного напоминания
+    
+    Ошибки отправки пробрасываются: их логирует и считает send_due_reminders
+    """
+    (_, reminder_id, user_id, growing_id, plant_name, photo_file_id,
+     _, _, _, _, task_day) = reminder_row
+    
+    message_text = (
+        f"🌱 <b>Задача по выращиванию</b>\n\n"
+        f"<b>{plant_name}</b>\n"
+        f"📅 День {task_day}\n"
+        f"\n📋 Проверьте задачи на сегодня!"
+    )
+    
+    keyboard = _task_reminder_keyboard(growing_id, task_day)
+    
+    if photo_file_id:
+        await _call_telegram(
+            bot.send_photo,
             chat_id=user_id,
-            photo=plant_row['photo_file_id'],
+            photo=photo_file_id,
             caption=message_text,
             parse_mode="HTML",
             reply_markup=keyboard
         )
-        
-        db = await get_db()
-        moscow_now_naive = moscow_now.replace(tzinfo=None)
-        
-        async with db.pool.acquire() as conn:
-            await conn.execute("""
-                UPDATE reminders
-                SET last_sent = $1,
-                    send_count = COALESCE(send_count, 0) + 1
-                WHERE id = $2
-            """, moscow_now_naive, plant_row['reminder_id'])
-        
-        logger.info(f"✅ Напоминание отправлено! Будет повторяться каждый день до полива.")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки напоминания для растения {plant_row.get('id')}: {e}", exc_info=True)
-        raise
-
-
-async def send_growing_reminders(bot):
-    """Отправка напоминаний по выращиванию"""
-    try:
-        db = await get_db()
-        moscow_now = get_moscow_now()
-        
-        logger.info("")
-        logger.info("🌱 ПРОВЕРКА НАПОМИНАНИЙ ПО ВЫРАЩИВАНИЮ")
-        
-        async with db.pool.acquire() as conn:
-            reminders = await conn.fetch("""
-                SELECT r.id as reminder_id, r.task_day, r.stage_number,
-                       gp.id as growing_id, gp.user_id, gp.plant_name, 
-                       gp.task_calendar, gp.current_stage, gp.started_date,
-                       gp.photo_file_id
-                FROM reminders r
-                JOIN growing_plants gp ON r.growing_plant_id = gp.id
-                JOIN user_settings us ON gp.user_id = us.user_id
-                WHERE r.reminder_type = 'task'
-                  AND r.is_active = TRUE
-                  AND us.reminder_enabled = TRUE
-                  AND gp.status = 'active'
-                  AND r.next_date::date <= $1::date
-                  AND (r.last_sent IS NULL OR r.last_sent::date < $1::date)
-            """, moscow_now.date())
-            
-            logger.info(f"🔍 Найдено напоминаний по выращиванию: {len(reminders)}")
-            
-            for reminder in reminders:
-                await send_task_reminder(bot, reminder)
-                
-    except Exception as e:
-        logger.error(f"❌ ОШИБКА send_growing_reminders: {e}", exc_info=True)
-
-
-async def send_task_reminder(bot, reminder_row):
-    """Отправка напоминания о задаче"""
-    try:
-        user_id = reminder_row['user_id']
-        growing_id = reminder_row['growing_id']
-        plant_name = reminder_row['plant_name']
-        task_day = reminder_row['task_day']
-        
-        message_text = f"🌱 <b>Задача по выращиванию</b>\n\n"
-        message_text += f"<b>{plant_name}</b>\n"
-        message_text += f"📅 День {task_day}\n"
-        message_text += f"\n📋 Проверьте задачи на сегодня!"
-        
-        keyboard = [
-            [InlineKeyboardButton(text="✅ Выполнено!", callback_data=f"task_done_{growing_id}_{task_day}")],
-            [InlineKeyboardButton(text="📸 Добавить фото", callback_data=f"add_diary_photo_{growing_id}")],
-        ]
-        
-        if reminder_row['photo_file_id']:
-            await bot.send_photo(
-                chat_id=user_id,
-                photo=reminder_row['photo_file_id'],
-                caption=message_text,
-                parse_mode="HTML",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-            )
-        else:
-            await bot.send_message(
-                chat_id=user_id,
-                text=message_text,
-                parse_mode="HTML",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-            )
-        
-        db = await get_db()
-        moscow_now = get_moscow_now().replace(tzinfo=None)
-        async with db.pool.acquire() as conn:
-            await conn.execute("""
-                UPDATE reminders
-                SET last_sent = $1,
-                    send_count = COALESCE(send_count, 0) + 1
-                WHERE id = $2
-            """, moscow_now, reminder_row['reminder_id'])
-        
-        logger.info(f"🌱 Напоминание о задаче отправлено: {plant_name} (пользователь {user_id})")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки задачи: {e}", exc_info=True)
+    else:
+        await _call_telegram(
+            bot.send_message,
+            chat_id=user_id,
+            text=message_text,
+            parse_mode="HTML",
+            reply_markup=keyboard
+        )
+    
+    logger.debug("🌱 Напоминание о задаче отправлено: %s (пользователь %s)", plant_name, user_id)
+    return reminder_id
 
 
 async def create_plant_reminder(plant_id: int, user_id: int, interval_days: int = 5):
     """Создать напоминание о поливе"""
     try:
         db = await get_db()
-        moscow_now = get_moscow_now()
-        next_watering = moscow_now + timedelta(days=interval_days)
-        next_watering_naive = next_watering.replace(tzinfo=None)
         
+        # Активное напоминание уникально (reminders_unique_active): переносим его
+        # одним upsert вместо деактивации старого и вставки нового.
+        # Дата считается в SQL так же, как в db.water_all_plants
         async with db.pool.acquire() as conn:
-            deactivated = await conn.fetchval("""
-                UPDATE reminders 
-                SET is_active = FALSE 
-                WHERE user_id = $1 
-                AND plant_id = $2 
-                AND reminder_type = 'watering'
-                AND is_active = TRUE
-                RETURNING id
-            """, user_id, plant_id)
-            
-            if deactivated:
-                logger.info(f"⚙️ Деактивировано старое напоминание для растения {plant_id}")
-            
-            reminder_id = await conn.fetchval("""
+            reminder = await conn.fetchrow("""
                 INSERT INTO reminders (user_id, plant_id, reminder_type, next_date, is_active)
-                VALUES ($1, $2, 'watering', $3, TRUE)
-                RETURNING id
-            """, user_id, plant_id, next_watering_naive)
-        
-        logger.info(f"✅ Создано напоминание ID={reminder_id} для растения {plant_id} (user {user_id}) на {next_watering.date()} (через {interval_days} дней)")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка создания напоминания для растения {plant_id}: {e}", exc_info=True)
+                VALUES ($1, $2, 'watering',
+                        (CURRENT_TIMESTAMP AT TIME ZONE 'Europe/Moscow') + make_interval(days => $3),
+                        TRUE)
+                ON CONFLICT (user_id, plant_id, reminder_type)
+                    WHERE is_active = TRUE AND plant_id IS NOT NULL
+                DO UPDATE SET next_date = EXCLUDED.next_date,
+                              created_at = CURRENT_TIMESTAMP,
+                              last_sent = NULL,
+                              send_count = 0
+                RETURNING id, next_date
+            """, user_id, plant_id, interval_days)
+        
+        logger.info(f"✅ Создано напоминание ID={reminder['id']} для растения {plant_id} (user {user_id}) на {reminder['next_date'].date()} (через {interval_days} дней)")
+        
+    except _DB_ERRORS as e:
+        logger.error(f"❌ Ошибка создания напоминания для растения {plant_id}: {e}")
         raise
 
 
@@ -309,36 +409,44 @@ async def check_monthly_photo_reminders(bot):
         
         logger.info(f"🔍 Найдено {len(plants)} растений для месячного напоминания")
         
-        users_plants = {}
-        for plant in plants:
-            user_id = plant['user_id']
-            if user_id not in users_plants:
-                users_plants[user_id] = []
-            users_plants[user_id].append(plant)
-        
-        for user_id, user_plants in users_plants.items():
-            await send_monthly_photo_reminder(bot, user_id, user_plants)
-            await db.mark_monthly_reminder_sent(user_id)
+        # Строки уже отсортированы по user_id - группируем за один проход
+        users_plants = [
+            (user_id, list(user_plants))
+            for user_id, user_plants in groupby(plants, key=itemgetter('user_id'))
+        ]
+        sent = await asyncio.gather(*(
+            _bounded(send_monthly_photo_reminder(bot, user_id, user_plants))
+            for user_id, user_plants in users_plants
+        ))
+        
+        # Отмечаем только тех, кому сообщение действительно ушло - одним UPDATE
+        await db.mark_monthly_reminders_sent(
+            [user_id for (user_id, _), ok in zip(users_plants, sent) if ok]
+        )
         
+    except _DB_ERRORS as e:
+        logger.warning(f"⚠️ Месячные напоминания: база недоступна, повторим на следующей проверке: {e}")
     except Exception as e:
         logger.error(f"❌ Ошибка месячных напоминаний: {e}", exc_info=True)
 
 
-async def send_monthly_photo_reminder(bot, user_id: int, plants: list):
-    """Отправить месячное напоминание об обновлении фото"""
+async def send_monthly_photo_reminder(bot, user_id: int, plants: list) -> bool:
+    """Отправить месячное напоминание об обновлении фото, True - если сообщение ушло"""
     try:
         if not plants:
-            return
+            return False
         
-        plants_text = ""
-        for i, plant in enumerate(plants[:5], 1):
-            plant_name = plant.get('custom_name') or plant.get('plant_name') or f"Растение #{plant['id']}"
-            days_ago = (get_moscow_now() - plant['last_photo_analysis']).days
-            current_state = STATE_EMOJI.get(plant.get('current_state', 'healthy'), '🌱')
-            plants_text += f"{i}. {current_state} {plant_name} (фото {days_ago} дней назад)\n"
+        # Название и давность фото уже посчитаны в SQL
+        lines = [
+            f"{i}. {STATE_EMOJI.get(plant['current_state'], '🌱')} {plant['display_name']} "
+            + (f"(фото {plant['days_ago']} дней назад)" if plant['days_ago'] is not None else "(фото еще не обновляли)")
+            for i, plant in enumerate(plants[:5], 1)
+        ]
         
         if len(plants) > 5:
-            plants_text += f"...и еще {len(plants) - 5} растений\n"
+            lines.append(f"...и еще {len(plants) - 5} растений")
+        
+        plants_text = "\n".join(lines) + "\n"
         
         message_text = f"""
 📸 <b>Время обновить фото ваших растений!</b>
@@ -357,79 +465,23 @@ async def send_monthly_photo_reminder(bot, user_id: int, plants: list):
 Просто пришлите новое фото каждого растения!
 """
         
-        keyboard = [
-            [InlineKeyboardButton(text="🌿 К моей коллекции", callback_data="my_plants")],
-            [InlineKeyboardButton(text="⏰ Напомнить через неделю", callback_data="snooze_monthly_reminder")],
-            [InlineKeyboardButton(text="🔕 Отключить", callback_data="disable_monthly_reminders")],
-        ]
-        
-        await bot.send_message(
+        await _call_telegram(
+            bot.send_message,
             chat_id=user_id,
             text=message_text,
             parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+            reply_markup=_MONTHLY_REMINDER_KEYBOARD
         )
         
-        logger.info(f"📸 Месячное напоминание отправлено: {user_id} ({len(plants)} растений)")
+        logger.debug("📸 Месячное напоминание отправлено: %s (%d растений)", user_id, len(plants))
+        return True
         
+    except TelegramAPIError as e:
+        logger.warning(f"⚠️ Месячное напоминание для {user_id} не отправлено: {e}")
+        return False
+    except asyncio.TimeoutError:
+        logger.warning(f"⏱️ Месячное напоминание для {user_id}: Telegram не ответил за {REMINDER_SEND_TIMEOUT} с")
+        return False
     except Exception as e:
         logger.error(f"❌ Ошибка отправки месячного напоминания: {e}", exc_info=True)
-
-
-async def adjust_all_watering_intervals():
-    """Автоматическая сезонная корректировка интервалов полива для всех растений"""
-    try:
-        logger.info("=" * 60)
-        logger.info("🌍 АВТОМАТИЧЕСКАЯ СЕЗОННАЯ КОРРЕКТИРОВКА")
-        logger.info("=" * 60)
-        
-        from utils.season_utils import get_current_season, adjust_watering_interval
-        
-        season_info = get_current_season()
-        logger.info(f"🌍 Текущий сезон: {season_info['season_ru']}")
-        logger.info(f"📝 Рекомендации: {season_info['watering_adjustment']}")
-        
-        db = await get_db()
-        
-        async with db.pool.acquire() as conn:
-            plants = await conn.fetch("""
-                SELECT id, user_id, 
-                       COALESCE(base_watering_interval, watering_interval, 5) as base_interval,
-                       watering_interval as current_interval,
-                       COALESCE(custom_name, plant_name, 'Растение #' || id) as display_name
-                FROM plants
-                WHERE plant_type = 'regular'
-                  AND reminder_enabled = TRUE
-            """)
-            
-            logger.info(f"📊 Найдено растений для корректировки: {len(plants)}")
-            
-            updated_count = 0
-            for plant in plants:
-                plant_id = plant['id']
-                user_id = plant['user_id']
-                base_interval = plant['base_interval']
-                current_interval = plant['current_interval']
-                
-                new_interval = adjust_watering_interval(base_interval, season_info['season'])
-                
-                if new_interval != current_interval:
-                    await conn.execute("""
-                        UPDATE plants 
-                        SET watering_interval = $1
-                        WHERE id = $2
-                    """, new_interval, plant_id)
-                    
-                    await create_plant_reminder(plant_id, user_id, new_interval)
-                    
-                    logger.info(f"   ✅ {plant['display_name']}: {current_interval} → {new_interval} дней")
-                    updated_count += 1
-            
-            logger.info(f"✅ Обновлено растений: {updated_count} из {len(plants)}")
-        
-        logger.info("=" * 60)
-        logger.info("✅ СЕЗОННАЯ КОРРЕКТИРОВКА ЗАВЕРШЕНА")
-        logger.info("=" * 60)
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка сезонной корректировки: {e}", exc_info=True)
+        return False
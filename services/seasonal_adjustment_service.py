@@ -3,37 +3,35 @@
 Запускается 1 числа каждого месяца, спрашивает GPT о новых интервалах
 """
 
+import asyncio
 import logging
-from openai import AsyncOpenAI
+import re
+from typing import Optional
 
 from database import get_db
-from config import OPENAI_API_KEY
+from config import OPENAI_BATCH_ENABLED
+from services.openai_client import openai_client, text_semaphore
+from services.openai_batcher import run_chat_batch
 from utils.season_utils import get_current_season
 
 logger = logging.getLogger(__name__)
 
-# Инициализация OpenAI клиента
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+SEASONAL_MODEL = "gpt-4o-mini"  # Используем дешёвую модель для простых запросов
+SEASONAL_CONCURRENCY = 10  # воркеров (одновременных запросов к GPT) при ежемесячной корректировке
 
+# (вид, месяц) -> задача с запросом интервала, пока она выполняется
+_inflight = {}
 
-async def get_seasonal_watering_interval(plant_name: str, current_interval: int, season_info: dict) -> int:
-    """
-    Спросить GPT какой интервал полива нужен для растения в текущем сезоне
-    
-    Args:
-        plant_name: название растения
-        current_interval: текущий интервал полива
-        season_info: информация о текущем сезоне
-        
-    Returns:
-        int: новый интервал полива в днях
-    """
-    if not openai_client:
-        logger.warning("⚠️ OpenAI недоступен, оставляем текущий интервал")
-        return current_interval
-    
-    try:
-        prompt = f"""Ты - эксперт по комнатным растениям. 
+# Число дней в ответе GPT
+_NUM_RE = re.compile(r"(\d+)")
+
+# Разделитель в логах корректировки
+_LOG_RULE = "=" * 60
+
+
+def _build_seasonal_request(plant_name: str, current_interval: int, season_info: dict) -> dict:
+    """Тело запроса chat.completions для сезонного интервала"""
+    prompt = f"""Ты - эксперт по комнатным растениям. 
 
 Растение: {plant_name}
 Текущий интервал полива: {current_interval} дней
@@ -56,124 +54,189 @@ async def get_seasonal_watering_interval(plant_name: str, current_interval: int,
 Ответь ТОЛЬКО ОДНИМ ЧИСЛОМ - количество дней между поливами.
 Число должно быть от 3 до 28."""
 
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o-mini",  # Используем дешёвую модель для простых запросов
-            messages=[
-                {"role": "system", "content": "Ты эксперт по уходу за комнатными растениями. Отвечай только числом - количеством дней между поливами."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=10,
-            temperature=0.3
-        )
-        
-        answer = response.choices[0].message.content.strip()
+    return {
+        "model": SEASONAL_MODEL,
+        "messages": [
+            {"role": "system", "content": "Ты эксперт по уходу за комнатными растениями. Отвечай только числом - количеством дней между поливами."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 10,
+        "temperature": 0.3
+    }
+
+
+def _extract_interval(answer: str) -> Optional[int]:
+    """Первое число из ответа GPT в пределах 3-28 дней или None"""
+    match = _NUM_RE.search(answer)
+    if not match:
+        return None
+    # Валидация
+    return max(3, min(28, int(match.group(1))))
+
+
+def _species_key(plant_name: str) -> str:
+    """Ключ кэша: один и тот же вид, как бы его ни записали"""
+    return plant_name.strip().lower()
+
+
+async def _ask_seasonal_interval(plant_name: str, current_interval: int, season_info: dict,
+                                 check_cache: bool = True, species: str = None) -> Optional[int]:
+    """Интервал для вида из кэша в БД или от GPT (успешный ответ сохраняется); None - ответа нет
+    
+    check_cache=False - вид уже известен как отсутствующий в кэше, лишний запрос к БД не нужен
+    species - ключ вида, посчитанный в SQL (get_species_for_seasonal_update): именно по нему
+    apply_seasonal_intervals соединяет растения с кэшем
+    """
+    db = await get_db()
+    species = species or _species_key(plant_name)
+    month = season_info['month']
+    
+    if check_cache:
+        try:
+            cached = await db.get_seasonal_interval(species, month)
+            if cached is not None:
+                logger.debug("⚡ Сезонный интервал из кэша: %s → %s дней", plant_name, cached)
+                return cached
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш сезонных интервалов недоступен: {e}")
+    
+    try:
+        async with text_semaphore:
+            response = await openai_client.chat.completions.create(
+                **_build_seasonal_request(plant_name, current_interval, season_info)
+            )
         
-        # Извлекаем число из ответа
-        import re
-        numbers = re.findall(r'\d+', answer)
-        if numbers:
-            interval = int(numbers[0])
-            # Валидация
-            interval = max(3, min(28, interval))
-            logger.info(f"✅ GPT: {plant_name} → {interval} дней ({season_info['season_ru']})")
-            return interval
-        else:
-            logger.warning(f"⚠️ GPT не вернул число для {plant_name}: '{answer}', оставляем {current_interval}")
-            return current_interval
-            
+        # Пробелы вокруг числа регулярке не мешают
+        answer = response.choices[0].message.content or ''
     except Exception as e:
         logger.error(f"❌ Ошибка GPT для {plant_name}: {e}")
+        return None
+    
+    interval = _extract_interval(answer)
+    if interval is None:
+        logger.warning(f"⚠️ GPT не вернул число для {plant_name}: '{answer}'")
+        return None
+    
+    logger.debug("✅ GPT: %s → %d дней (%s)", plant_name, interval, season_info['season_ru'])
+    try:
+        await db.save_seasonal_interval(species, month, interval)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить сезонный интервал {plant_name}: {e}")
+    return interval
+
+
+async def get_seasonal_watering_interval(plant_name: str, current_interval: int, season_info: dict) -> int:
+    """
+    Спросить GPT какой интервал полива нужен для растения в текущем сезоне
+    
+    Ответ зависит только от вида и месяца, поэтому хранится в seasonal_interval_cache,
+    а одновременные запросы одного вида ждут один общий вызов GPT.
+    
+    Args:
+        plant_name: название растения
+        current_interval: текущий интервал полива
+        season_info: информация о текущем сезоне
+        
+    Returns:
+        int: новый интервал полива в днях
+    """
+    if not openai_client:
+        logger.warning("⚠️ OpenAI недоступен, оставляем текущий интервал")
         return current_interval
+    
+    key = (_species_key(plant_name), season_info['month'])
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_ask_seasonal_interval(plant_name, current_interval, season_info))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    
+    # shield: отмена одного ожидающего не отменяет запрос для остальных
+    interval = await asyncio.shield(task)
+    return interval if interval is not None else current_interval
 
 
 async def adjust_all_plants_for_season():
     """
     Главная функция: пересчитать интервалы полива для всех растений через GPT
     Запускается 1 числа каждого месяца
+    
+    GPT спрашиваем один раз на вид (ответ ложится в seasonal_interval_cache),
+    затем все растения обновляются одним запросом по кэшу.
     """
     try:
-        logger.info("=" * 60)
+        logger.info(_LOG_RULE)
         logger.info("🌍 СЕЗОННАЯ КОРРЕКТИРОВКА ИНТЕРВАЛОВ ПОЛИВА (GPT)")
-        logger.info("=" * 60)
+        logger.info(_LOG_RULE)
         
         season_info = get_current_season()
+        month = season_info['month']
         logger.info(f"📅 Месяц: {season_info['month_name_ru']}")
         logger.info(f"🌍 Сезон: {season_info['season_ru']}")
         logger.info(f"🌱 Фаза: {season_info['growth_phase']}")
         
         db = await get_db()
         
-        # Получаем все растения для корректировки
-        plants = await db.get_all_plants_for_seasonal_update()
+        # Виды растений, у которых включены напоминания; растения без названия пропускаются
+        species_rows = await db.get_species_for_seasonal_update(month)
+        pending = [row for row in species_rows if not row['cached']]
         
-        logger.info(f"📊 Найдено растений для обработки: {len(plants)}")
+        logger.info(f"📊 Видов растений: {len(species_rows)}, нужно спросить GPT: {len(pending)}")
         
-        if not plants:
+        if not species_rows:
             logger.info("✅ Нет растений для корректировки")
             return
         
-        updated_count = 0
-        error_count = 0
-        skipped_count = 0
+        if pending and not openai_client:
+            logger.warning("⚠️ OpenAI недоступен, интервалы обновятся только по кэшу")
+            pending = []
         
-        # Группируем по пользователям для логирования
-        current_user_id = None
-        
-        for plant in plants:
-            try:
-                plant_id = plant['id']
-                user_id = plant['user_id']
-                plant_name = plant['plant_name'] or plant['display_name']
-                current_interval = plant['current_interval'] or 7
-                
-                # Логируем смену пользователя
-                if user_id != current_user_id:
-                    current_user_id = user_id
-                    logger.info(f"👤 Пользователь {user_id}:")
-                
-                # Пропускаем только если plant_name пустое или NULL
-                # Название сохраняется при анализе фото, если уверенность была достаточной
-                if not plant_name or not plant_name.strip():
-                    logger.info(f"   ⏭️ {plant['display_name']}: пропущено (нет названия вида)")
-                    skipped_count += 1
+        # Фоновая задача не ограничена по времени: при включённом Batch API
+        # отправляем все виды одним пакетом, неразобранные ответы - обычным путём
+        if OPENAI_BATCH_ENABLED and pending:
+            batch_answers = await run_chat_batch({
+                str(i): _build_seasonal_request(row['plant_name'], row['current_interval'], season_info)
+                for i, row in enumerate(pending)
+            })
+            unanswered = []
+            for i, row in enumerate(pending):
+                interval = _extract_interval(batch_answers.get(str(i)) or '')
+                if interval is None:
+                    unanswered.append(row)
                     continue
-                
-                # Получаем новый интервал от GPT
-                new_interval = await get_seasonal_watering_interval(
-                    plant_name, 
-                    current_interval, 
-                    season_info
+                await db.save_seasonal_interval(row['species'], month, interval)
+            pending = unanswered
+        
+        queue = asyncio.Queue()
+        for row in pending:
+            queue.put_nowait(row)
+        failed_species = []
+        
+        async def worker():
+            """Берёт виды из очереди, пока она не опустеет"""
+            while not queue.empty():
+                row = queue.get_nowait()
+                interval = await _ask_seasonal_interval(
+                    row['plant_name'], row['current_interval'], season_info,
+                    check_cache=False, species=row['species']
                 )
-                
-                # Обновляем только если изменился
-                if new_interval != current_interval:
-                    async with db.pool.acquire() as conn:
-                        await conn.execute("""
-                            UPDATE plants 
-                            SET watering_interval = $1
-                            WHERE id = $2
-                        """, new_interval, plant_id)
-                    
-                    # Пересоздаём напоминание с новым интервалом
-                    from services.reminder_service import create_plant_reminder
-                    await create_plant_reminder(plant_id, user_id, new_interval)
-                    
-                    logger.info(f"   🌱 {plant['display_name']}: {current_interval} → {new_interval} дней")
-                    updated_count += 1
-                else:
-                    logger.info(f"   🌱 {plant['display_name']}: без изменений ({current_interval} дней)")
-                    
-            except Exception as e:
-                error_count += 1
-                logger.error(f"   ❌ Ошибка для растения {plant.get('id')}: {e}")
+                if interval is None:
+                    failed_species.append(row['species'])
+                elif logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("   🌱 %s (%d растений): %d дней", row['plant_name'], row['plants'], interval)
+        
+        # Не больше SEASONAL_CONCURRENCY одновременных запросов к GPT
+        await asyncio.gather(*(worker() for _ in range(min(SEASONAL_CONCURRENCY, len(pending)))))
+        
+        # Интервалы и напоминания всех изменившихся растений - одним запросом по кэшу
+        updated_count = await db.apply_seasonal_intervals(month)
         
-        logger.info("=" * 60)
+        logger.info(_LOG_RULE)
         logger.info(f"✅ КОРРЕКТИРОВКА ЗАВЕРШЕНА")
-        logger.info(f"📊 Обновлено: {updated_count}")
-        logger.info(f"⏭️ Пропущено: {skipped_count}")
-        if error_count:
-            logger.info(f"❌ Ошибок: {error_count}")
-        logger.info("=" * 60)
+        logger.info(f"📊 Обновлено растений: {updated_count}")
+        if failed_species:
+            logger.info(f"❌ Видов без ответа GPT (интервал не менялся): {len(failed_species)}")
+        logger.info(_LOG_RULE)
             
     except Exception as e:
         logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА сезонной корректировки: {e}", exc_info=True)
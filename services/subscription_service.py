@@ -1,4 +1,6 @@
 import logging
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import Dict, Optional, Tuple
 
@@ -7,8 +9,96 @@ from config import FREE_LIMITS, PRO_DURATION_DAYS, PRO_GRACE_PERIOD_DAYS, ADMIN_
 
 logger = logging.getLogger(__name__)
 
+# План читается на каждое действие пользователя (лимиты), поэтому кэшируется ненадолго.
+# Изменения подписки через этот модуль сбрасывают запись сразу, TTL нужен для истечения срока
+PLAN_CACHE_TTL_SECONDS = 60
+PLAN_CACHE_MAX_SIZE = 10000
+# Строк usage_limits за одну транзакцию при ежемесячном сбросе
+USAGE_RESET_BATCH_SIZE = 10000
+_plan_cache = {}  # user_id -> (expires_at, plan)
 
-async def get_user_plan(user_id: int) -> Dict:
+
+@asynccontextmanager
+async def _connection(conn=None):
+    """Соединение вызывающего (одно на весь запрос пользователя) или новое из пула"""
+    if conn is not None:
+        yield conn
+    else:
+        db = await get_db()
+        async with db.pool.acquire() as new_conn:
+            yield new_conn
+
+
+_next_reset_cache = (None, None)  # ((год, месяц), первое число следующего месяца)
+
+
+def _next_reset(now: datetime) -> datetime:
+    """Дата следующего сброса лимитов - первое число следующего месяца (кэш на текущий месяц)"""
+    global _next_reset_cache
+    month_key = (now.year, now.month)
+    if _next_reset_cache[0] != month_key:
+        _next_reset_cache = (month_key, (now.replace(day=1) + timedelta(days=32)).replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        ))
+    return _next_reset_cache[1]
+
+
+def invalidate_plan_cache(user_id: int):
+    """Сбросить закэшированный план пользователя после изменения подписки"""
+    _plan_cache.pop(user_id, None)
+
+
+def _cache_plan(user_id: int, plan: Dict) -> Dict:
+    """Запомнить план пользователя и вернуть его"""
+    if len(_plan_cache) >= PLAN_CACHE_MAX_SIZE:
+        _plan_cache.clear()
+    _plan_cache[user_id] = (time.monotonic() + PLAN_CACHE_TTL_SECONDS, plan)
+    return dict(plan)
+
+
+def _cached_plan(user_id: int) -> Optional[Dict]:
+    """План из кэша или None, если его там нет или он устарел"""
+    entry = _plan_cache.get(user_id)
+    if entry and entry[0] > time.monotonic():
+        return dict(entry[1])
+    return None
+
+
+# Подписка, счётчики использования и число растений - одним запросом.
+# LEFT JOIN от user_id: строка есть всегда, даже если подписки или счётчиков ещё нет.
+# users.plants_count ведёт триггер plants_count_trigger, COUNT(*) по plants не нужен
+_USER_CONTEXT_SQL = """
+    SELECT s.plan, s.expires_at, s.auto_pay_method_id, s.granted_by_admin,
+           u.user_id IS NOT NULL as has_usage,
+           u.analyses_used, u.questions_used, u.reset_date,
+           COALESCE(us.plants_count, 0) as plants_count
+    FROM (SELECT $1::bigint as user_id) x
+    LEFT JOIN users us ON us.user_id = x.user_id
+    LEFT JOIN subscriptions s ON s.user_id = x.user_id
+    LEFT JOIN usage_limits u ON u.user_id = x.user_id
+"""
+
+
+async def _fetch_user_context(user_id: int, *, conn=None):
+    """Строка с подпиской, использованием и числом растений пользователя"""
+    async with _connection(conn) as conn:
+        return await conn.fetchrow(_USER_CONTEXT_SQL, user_id)
+
+
+def _usage_from_context(context) -> Optional[Dict]:
+    """Счётчики из строки контекста; None - записи ещё нет или пора сбросить (нужен get_or_create_usage)"""
+    if not context['has_usage']:
+        return None
+    if context['reset_date'] and context['reset_date'] <= datetime.now():
+        return None
+    return {
+        'analyses_used': context['analyses_used'],
+        'questions_used': context['questions_used'],
+        'reset_date': context['reset_date'],
+    }
+
+
+async def get_user_plan(user_id: int, *, conn=None) -> Dict:
     """
     Получить текущий план пользователя.
     
@@ -21,57 +111,81 @@ async def get_user_plan(user_id: int) -> Dict:
             'auto_pay': bool,
         }
     """
-    db = await get_db()
-    async with db.pool.acquire() as conn:
+    cached = _cached_plan(user_id)
+    if cached:
+        return cached
+    
+    async with _connection(conn) as conn:
         row = await conn.fetchrow("""
             SELECT plan, expires_at, auto_pay_method_id, granted_by_admin
             FROM subscriptions
             WHERE user_id = $1
         """, user_id)
-    
-    if not row or row['plan'] == 'free':
-        return {
+        
+        return await _plan_from_row(user_id, row, conn=conn)
+
+
+async def _plan_from_row(user_id: int, row, *, conn=None) -> Dict:
+    """План по строке подписки (subscriptions или контекст пользователя), результат кэшируется"""
+    if not row or row['plan'] in (None, 'free'):
+        return _cache_plan(user_id, {
             'plan': 'free',
             'expires_at': None,
             'is_grace_period': False,
             'days_left': None,
             'auto_pay': False,
-        }
+        })
     
     now = datetime.now()
     expires_at = row['expires_at']
     
     if expires_at and expires_at > now:
         days_left = (expires_at - now).days
-        return {
+        return _cache_plan(user_id, {
             'plan': 'pro',
             'expires_at': expires_at,
             'is_grace_period': False,
             'days_left': days_left,
             'auto_pay': bool(row['auto_pay_method_id']),
-        }
+        })
     
     # Проверяем grace period
     if expires_at:
         grace_end = expires_at + timedelta(days=PRO_GRACE_PERIOD_DAYS)
         if now < grace_end:
-            return {
+            return _cache_plan(user_id, {
                 'plan': 'pro',
                 'expires_at': expires_at,
                 'is_grace_period': True,
                 'days_left': 0,
                 'auto_pay': bool(row['auto_pay_method_id']),
-            }
+            })
     
-    # Подписка истекла — переводим на free
-    await downgrade_to_free(user_id)
-    return {
+    # Подписка истекла — переводим на free одним условным UPDATE:
+    # если её успели продлить после нашего чтения, строка не подойдёт под условие
+    async with _connection(conn) as conn:
+        downgraded = await conn.fetchval("""
+            UPDATE subscriptions
+            SET plan = 'free', auto_pay_method_id = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = $1
+              AND plan = 'pro'
+              AND (expires_at IS NULL OR expires_at <= $2)
+            RETURNING TRUE
+        """, user_id, now - timedelta(days=PRO_GRACE_PERIOD_DAYS))
+        
+        if not downgraded:
+            # Подписка изменилась между чтением и UPDATE - читаем заново
+            invalidate_plan_cache(user_id)
+            return await get_user_plan(user_id, conn=conn)
+    
+    logger.info(f"⬇️ Пользователь {user_id} переведён на FREE план")
+    return _cache_plan(user_id, {
         'plan': 'free',
         'expires_at': None,
         'is_grace_period': False,
         'days_left': None,
         'auto_pay': False,
-    }
+    })
 
 
 async def is_pro(user_id: int) -> bool:
@@ -96,30 +210,37 @@ async def check_limit(user_id: int, action: str) -> Tuple[bool, Optional[str]]:
     if user_id in ADMIN_USER_IDS:
         return True, None
     
-    # PRO без лимитов
-    if await is_pro(user_id):
+    # PRO без лимитов (по кэшу - без запроса к БД)
+    plan = _cached_plan(user_id)
+    if plan and plan['plan'] == 'pro':
         return True, None
     
-    db = await get_db()
-    usage = await get_or_create_usage(user_id)
+    # Одно соединение на все запросы; обычно запрос всего один - контекст пользователя
+    async with _connection() as conn:
+        # План, счётчики и число растений - одним запросом
+        context = await _fetch_user_context(user_id, conn=conn)
+        if plan is None:
+            plan = await _plan_from_row(user_id, context, conn=conn)
+            if plan['plan'] == 'pro':
+                return True, None
+        
+        usage = None
+        if action != 'plants':
+            usage = _usage_from_context(context) or await get_or_create_usage(user_id, conn=conn)
     
     limit = FREE_LIMITS.get(action, 0)
     
     if action == 'plants':
         # Для растений проверяем общее количество в коллекции
-        async with db.pool.acquire() as conn:
-            count = await conn.fetchval(
-                "SELECT COUNT(*) FROM plants WHERE user_id = $1 AND plant_type = 'regular'",
-                user_id
-            )
-        if count >= limit:
+        if context['plants_count'] >= limit:
             return False, (
                 f"🌱 Достигнут лимит бесплатного плана: <b>{limit} растений</b>\n\n"
                 f"Оформите <b>PRO подписку</b> за 199₽/мес для неограниченного доступа!"
             )
         return True, None
     
-    elif action == 'analyses':
+    
+    if action == 'analyses':
         if usage['analyses_used'] >= limit:
             return False, (
                 f"📸 Достигнут лимит бесплатного плана: <b>{limit} анализа фото</b> в месяц\n\n"
@@ -138,39 +259,51 @@ async def check_limit(user_id: int, action: str) -> Tuple[bool, Optional[str]]:
     return True, None
 
 
+# action -> (увеличиваемый счётчик, второй счётчик, который обнуляется при сбросе)
+_USAGE_COLUMNS = {
+    'analyses': ('analyses_used', 'questions_used'),
+    'questions': ('questions_used', 'analyses_used'),
+}
+
+
 async def increment_usage(user_id: int, action: str):
     """
     Увеличить счётчик использования.
     
     action: 'analyses' | 'questions'
+    
+    Один UPSERT: создаёт запись, сбрасывает счётчики в новом месяце и увеличивает нужный
     """
-    if await is_pro(user_id):
+    columns = _USAGE_COLUMNS.get(action)
+    if not columns:
         return
     
-    db = await get_db()
-    await get_or_create_usage(user_id)
-    
-    column_map = {
-        'analyses': 'analyses_used',
-        'questions': 'questions_used',
-    }
-    
-    column = column_map.get(action)
-    if not column:
+    # Админы - без await, остальные PRO - по кэшу плана
+    if user_id in ADMIN_USER_IDS or await is_pro(user_id):
         return
     
+    column, other = columns
+    now = datetime.now()
+    next_reset = _next_reset(now)
+    
+    db = await get_db()
     async with db.pool.acquire() as conn:
         await conn.execute(f"""
-            UPDATE usage_limits
-            SET {column} = {column} + 1
-            WHERE user_id = $1
-        """, user_id)
+            INSERT INTO usage_limits (user_id, {column}, reset_date)
+            VALUES ($1, 1, $2)
+            ON CONFLICT (user_id) DO UPDATE SET
+                {column} = CASE WHEN usage_limits.reset_date <= $3
+                                THEN 1 ELSE usage_limits.{column} + 1 END,
+                {other} = CASE WHEN usage_limits.reset_date <= $3
+                               THEN 0 ELSE usage_limits.{other} END,
+                reset_date = CASE WHEN usage_limits.reset_date <= $3
+                                  THEN $2 ELSE usage_limits.reset_date END
+        """, user_id, next_reset, now)
 
 
-async def get_or_create_usage(user_id: int) -> Dict:
+async def get_or_create_usage(user_id: int, *, conn=None) -> Dict:
     """Получить или создать запись использования"""
-    db = await get_db()
-    async with db.pool.acquire() as conn:
+    async with _connection(conn) as conn:
         row = await conn.fetchrow(
             "SELECT * FROM usage_limits WHERE user_id = $1", user_id
         )
@@ -179,7 +312,7 @@ async def get_or_create_usage(user_id: int) -> Dict:
             # Проверяем нужен ли сброс (новый месяц)
             now = datetime.now()
             if row['reset_date'] and row['reset_date'] <= now:
-                next_reset = (now.replace(day=1) + timedelta(days=32)).replace(day=1)
+                next_reset = _next_reset(now)
                 await conn.execute("""
                     UPDATE usage_limits
                     SET analyses_used = 0, questions_used = 0, reset_date = $2
@@ -194,7 +327,7 @@ async def get_or_create_usage(user_id: int) -> Dict:
         
         # Создаём новую запись
         now = datetime.now()
-        next_reset = (now.replace(day=1) + timedelta(days=32)).replace(day=1)
+        next_reset = _next_reset(now)
         await conn.execute("""
             INSERT INTO usage_limits (user_id, analyses_used, questions_used, reset_date)
             VALUES ($1, 0, 0, $2)
@@ -210,15 +343,12 @@ async def get_or_create_usage(user_id: int) -> Dict:
 
 async def get_usage_stats(user_id: int) -> Dict:
     """Получить статистику использования для отображения"""
-    plan_info = await get_user_plan(user_id)
-    usage = await get_or_create_usage(user_id)
-    
-    db = await get_db()
-    async with db.pool.acquire() as conn:
-        plants_count = await conn.fetchval(
-            "SELECT COUNT(*) FROM plants WHERE user_id = $1 AND plant_type = 'regular'",
-            user_id
-        )
+    # Одно соединение на все запросы; обычно запрос всего один - контекст пользователя
+    async with _connection() as conn:
+        context = await _fetch_user_context(user_id, conn=conn)
+        plan_info = _cached_plan(user_id) or await _plan_from_row(user_id, context, conn=conn)
+        usage = _usage_from_context(context) or await get_or_create_usage(user_id, conn=conn)
+    plants_count = context['plants_count']
     
     return {
         'plan': plan_info['plan'],
@@ -235,49 +365,91 @@ async def get_usage_stats(user_id: int) -> Dict:
     }
 
 
-async def activate_pro(user_id: int, days: int = PRO_DURATION_DAYS,
-                       payment_method_id: str = None, granted_by: int = None):
-    """Активировать PRO подписку"""
-    db = await get_db()
-    now = datetime.now()
+# Продление считается в SQL по текущей строке подписки: без предварительного SELECT
+# и одним запросом на любой список пользователей
+_ACTIVATE_PRO_SQL = """
+    INSERT INTO subscriptions (user_id, plan, expires_at, auto_pay_method_id, granted_by_admin, updated_at)
+    SELECT uid, 'pro', $2::timestamp + $3::int * INTERVAL '1 day', $4::text, $5::bigint, CURRENT_TIMESTAMP
+    FROM UNNEST($1::bigint[]) AS uid
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        plan = 'pro',
+        expires_at = CASE
+            WHEN subscriptions.plan = 'pro' AND subscriptions.expires_at > $2
+                THEN subscriptions.expires_at + $3::int * INTERVAL '1 day'
+            ELSE EXCLUDED.expires_at
+        END,
+        auto_pay_method_id = COALESCE(EXCLUDED.auto_pay_method_id, subscriptions.auto_pay_method_id),
+        granted_by_admin = EXCLUDED.granted_by_admin,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING user_id, expires_at
+"""
+
+
+async def activate_pro_bulk(user_ids: list, days: int = PRO_DURATION_DAYS,
+                            granted_by: int = None, payment_method_id: str = None) -> Dict[int, datetime]:
+    """Активировать PRO подписку списку пользователей одним запросом
+    
+    Returns:
+        Dict user_id -> новая дата окончания
+    """
+    # Повтор user_id в одном ON CONFLICT DO UPDATE - ошибка Postgres
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
     
+    db = await get_db()
     async with db.pool.acquire() as conn:
-        # Проверяем существующую подписку
-        existing = await conn.fetchrow(
-            "SELECT expires_at, plan FROM subscriptions WHERE user_id = $1", user_id
+        rows = await conn.fetch(
+            _ACTIVATE_PRO_SQL, user_ids, datetime.now(), days, payment_method_id, granted_by
         )
-        
-        if existing and existing['plan'] == 'pro' and existing['expires_at'] and existing['expires_at'] > now:
-            # Продлеваем от текущей даты окончания
-            expires_at = existing['expires_at'] + timedelta(days=days)
-        else:
-            expires_at = now + timedelta(days=days)
-        
-        await conn.execute("""
-            INSERT INTO subscriptions (user_id, plan, expires_at, auto_pay_method_id, granted_by_admin, updated_at)
-            VALUES ($1, 'pro', $2, $3, $4, CURRENT_TIMESTAMP)
-            ON CONFLICT (user_id) 
-            DO UPDATE SET 
-                plan = 'pro',
-                expires_at = $2,
-                auto_pay_method_id = COALESCE($3, subscriptions.auto_pay_method_id),
-                granted_by_admin = $4,
-                updated_at = CURRENT_TIMESTAMP
-        """, user_id, expires_at, payment_method_id, granted_by)
+    for user_id in user_ids:
+        invalidate_plan_cache(user_id)
+    
+    if len(user_ids) > 1:
+        logger.info(f"✅ PRO активирован для {len(rows)} пользователей на {days} дней, granted_by={granted_by}")
+    return {row['user_id']: row['expires_at'] for row in rows}
+
+
+async def activate_pro(user_id: int, days: int = PRO_DURATION_DAYS,
+                       payment_method_id: str = None, granted_by: int = None):
+    """Активировать PRO подписку"""
+    expires = await activate_pro_bulk([user_id], days, granted_by, payment_method_id)
+    expires_at = expires[user_id]
     
     logger.info(f"✅ PRO активирован для user_id={user_id}, expires={expires_at}, granted_by={granted_by}")
     return expires_at
 
 
-async def downgrade_to_free(user_id: int):
-    """Понизить до бесплатного плана"""
+async def revoke_pro_bulk(user_ids: list) -> int:
+    """Перевести список пользователей на FREE одним запросом
+    
+    Returns:
+        int: сколько подписок изменено
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    
     db = await get_db()
     async with db.pool.acquire() as conn:
-        await conn.execute("""
+        result = await conn.execute("""
             UPDATE subscriptions
             SET plan = 'free', auto_pay_method_id = NULL, updated_at = CURRENT_TIMESTAMP
-            WHERE user_id = $1
-        """, user_id)
+            WHERE user_id = ANY($1::bigint[])
+        """, user_ids)
+    for user_id in user_ids:
+        invalidate_plan_cache(user_id)
+    
+    revoked = int(result.split()[-1])
+    if len(user_ids) > 1:
+        logger.info(f"⬇️ {revoked} пользователей переведены на FREE план")
+    return revoked
+
+
+async def downgrade_to_free(user_id: int):
+    """Понизить до бесплатного плана"""
+    await revoke_pro_bulk([user_id])
     
     logger.info(f"⬇️ Пользователь {user_id} переведён на FREE план")
 
@@ -288,19 +460,36 @@ async def revoke_pro(user_id: int):
 
 
 async def reset_all_usage_limits():
-    """Сброс лимитов у всех пользователей (вызывается 1 числа)"""
+    """Сброс лимитов у всех пользователей (вызывается 1 числа)
+    
+    Сбрасываем пачками по USAGE_RESET_BATCH_SIZE: каждая пачка - короткая отдельная
+    транзакция. Строки, занятые в этот момент increment_usage, пропускаются -
+    их сбросит проверка reset_date при следующем действии пользователя
+    """
     db = await get_db()
     now = datetime.now()
-    next_reset = (now.replace(day=1) + timedelta(days=32)).replace(day=1)
+    next_reset = _next_reset(now)
     
+    total = 0
     async with db.pool.acquire() as conn:
-        result = await conn.execute("""
-            UPDATE usage_limits
-            SET analyses_used = 0, questions_used = 0, reset_date = $1
-            WHERE reset_date <= $2
-        """, next_reset, now)
+        while True:
+            result = await conn.execute("""
+                UPDATE usage_limits
+                SET analyses_used = 0, questions_used = 0, reset_date = $1
+                WHERE user_id IN (
+                    SELECT user_id FROM usage_limits
+                    WHERE reset_date <= $2
+                    ORDER BY user_id
+                    LIMIT $3
+                    FOR UPDATE SKIP LOCKED
+                )
+            """, next_reset, now, USAGE_RESET_BATCH_SIZE)
+            updated = int(result.split()[-1])
+            total += updated
+            if updated == 0:
+                break
     
-    logger.info(f"🔄 Лимиты использования сброшены, следующий сброс: {next_reset}")
+    logger.info(f"🔄 Лимиты использования сброшены у {total} пользователей, следующий сброс: {next_reset}")
 
 
 async def get_expiring_subscriptions(days_before: int = 1) -> list:
@@ -14,10 +14,7 @@ class PlantStates(StatesGroup):
     onboarding_quick_start = State()
     waiting_state_update_photo = State()
     
-    # Новые состояния для указания даты полива при добавлении растения
-    waiting_last_watering = State()  # Ожидание выбора даты последнего полива
-    
-    # Новые состояния для указания даты последнего полива при сохранении
+    # Выбор даты последнего полива при сохранении растения
     waiting_last_watering = State()
 
 
@@ -6,6 +6,10 @@ import re
 from datetime import datetime, timedelta
 from typing import Optional
 
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from utils.time_utils import get_moscow_naive_now
+
 # Месяцы на русском
 MONTHS_RU = {
     'январ': 1, 'янв': 1,
@@ -22,6 +26,15 @@ MONTHS_RU = {
     'декабр': 12, 'дек': 12
 }
 
+# Шаблоны разбора собираются один раз при импорте
+_DAYS_AGO_RE = re.compile(r'(\d+)\s*(дн|день|дня|дней)')
+_WEEKS_RE = re.compile(r'(\d+)\s*недел')
+_RANGE_RE = re.compile(r'(\d+)\s*-\s*(\d+)\s*(дн|день|дня|дней)')
+_DATE_DOT_RE = re.compile(r'(\d{1,2})\.(\d{1,2})(?:\.(\d{2,4}))?')
+_DAY_RE = re.compile(r'(\d{1,2})')
+# Все названия месяцев одной альтернацией; длинные раньше, чтобы "март" не читался как "ма"
+_MONTH_RE = re.compile('|'.join(sorted(MONTHS_RU, key=len, reverse=True)))
+
 
 def parse_user_date(text: str) -> Optional[datetime]:
     """
@@ -40,7 +53,8 @@ def parse_user_date(text: str) -> Optional[datetime]:
         return None
     
     text = text.lower().strip()
-    now = datetime.now()
+    # Московское время без пояса - так хранится plants.last_watered
+    now = get_moscow_naive_now()
     
     # Относительные даты
     if text in ('сегодня', 'сейчас'):
@@ -53,7 +67,7 @@ def parse_user_date(text: str) -> Optional[datetime]:
         return now - timedelta(days=2)
     
     # "X дней назад"
-    days_ago_match = re.search(r'(\d+)\s*(дн|день|дня|дней)', text)
+    days_ago_match = _DAYS_AGO_RE.search(text)
     if days_ago_match and 'назад' in text:
         days = int(days_ago_match.group(1))
         if 1 <= days <= 365:
@@ -61,7 +75,7 @@ def parse_user_date(text: str) -> Optional[datetime]:
     
     # "неделю назад"
     if 'недел' in text and 'назад' in text:
-        weeks_match = re.search(r'(\d+)\s*недел', text)
+        weeks_match = _WEEKS_RE.search(text)
         if weeks_match:
             weeks = int(weeks_match.group(1))
         else:
@@ -70,7 +84,7 @@ def parse_user_date(text: str) -> Optional[datetime]:
             return now - timedelta(weeks=weeks)
     
     # "2-3 дня назад" - берём среднее
-    range_match = re.search(r'(\d+)\s*-\s*(\d+)\s*(дн|день|дня|дней)', text)
+    range_match = _RANGE_RE.search(text)
     if range_match and 'назад' in text:
         days_min = int(range_match.group(1))
         days_max = int(range_match.group(2))
@@ -79,7 +93,7 @@ def parse_user_date(text: str) -> Optional[datetime]:
             return now - timedelta(days=days_avg)
     
     # Формат "28.01" или "28.01.2025"
-    date_dot_match = re.search(r'(\d{1,2})\.(\d{1,2})(?:\.(\d{2,4}))?', text)
+    date_dot_match = _DATE_DOT_RE.search(text)
     if date_dot_match:
         day = int(date_dot_match.group(1))
         month = int(date_dot_match.group(2))
@@ -108,29 +122,39 @@ def parse_user_date(text: str) -> Optional[datetime]:
             pass
     
     # Формат "28 января" или "28 янв"
-    for month_name, month_num in MONTHS_RU.items():
-        if month_name in text:
-            day_match = re.search(r'(\d{1,2})', text)
-            if day_match:
-                day = int(day_match.group(1))
-                year = now.year
+    month_match = _MONTH_RE.search(text)
+    if month_match:
+        month_num = MONTHS_RU[month_match.group(0)]
+        day_match = _DAY_RE.search(text)
+        if day_match:
+            day = int(day_match.group(1))
+            year = now.year
+            
+            try:
+                result = datetime(year, month_num, day)
+                # Если дата в будущем, значит это прошлый год
+                if result > now:
+                    result = datetime(year - 1, month_num, day)
                 
-                try:
-                    result = datetime(year, month_num, day)
-                    # Если дата в будущем, значит это прошлый год
-                    if result > now:
-                        result = datetime(year - 1, month_num, day)
-                    
-                    # Проверяем что дата не слишком старая
-                    if result > now - timedelta(days=365):
-                        return result
-                except ValueError:
-                    pass
-            break
+                # Проверяем что дата не слишком старая
+                if result > now - timedelta(days=365):
+                    return result
+            except ValueError:
+                pass
     
     return None
 
 
+# Подписи для последних 30 дней по числу прошедших дней; старше - дата "28.01"
+_AGO_LABELS = (
+    ("сегодня", "вчера", "позавчера")
+    + tuple(f"{days} дней назад" for days in range(3, 8))
+    + ("неделю назад",) * 7
+    + ("2 недели назад",) * 7
+    + ("3 недели назад",) * 9
+)
+
+
 def format_date_ago(date: datetime) -> str:
     """
     Форматирует дату в человекочитаемый формат.
@@ -141,26 +165,10 @@ def format_date_ago(date: datetime) -> str:
     if not date:
         return "неизвестно"
     
-    now = datetime.now()
-    diff = now - date
-    days = diff.days
-    
-    if days == 0:
-        return "сегодня"
-    elif days == 1:
-        return "вчера"
-    elif days == 2:
-        return "позавчера"
-    elif days <= 7:
-        return f"{days} дней назад"
-    elif days <= 14:
-        return "неделю назад"
-    elif days <= 21:
-        return "2 недели назад"
-    elif days <= 30:
-        return "3 недели назад"
-    else:
-        return date.strftime("%d.%m")
+    days = (get_moscow_naive_now() - date).days
+    if 0 <= days < len(_AGO_LABELS):
+        return _AGO_LABELS[days]
+    return date.strftime("%d.%m")
 
 
 def get_days_offset(choice: str) -> int:
@@ -183,24 +191,24 @@ def get_days_offset(choice: str) -> int:
     return offsets.get(choice, -1)
 
 
+# Клавиатура выбора даты последнего полива одинакова для всех - собираем один раз
+_LAST_WATERING_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="💧 Сегодня", callback_data="last_watering_0"),
+        InlineKeyboardButton(text="💧 Вчера", callback_data="last_watering_1"),
+    ],
+    [
+        InlineKeyboardButton(text="💧 2-3 дня назад", callback_data="last_watering_3"),
+        InlineKeyboardButton(text="💧 Неделю назад", callback_data="last_watering_7"),
+    ],
+    [
+        InlineKeyboardButton(text="🤷 Не помню / Пропустить", callback_data="last_watering_skip"),
+    ],
+])
+
+
 def get_last_watering_keyboard():
     """
     Возвращает клавиатуру для выбора даты последнего полива.
     """
-    from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-    
-    keyboard = [
-        [
-            InlineKeyboardButton(text="💧 Сегодня", callback_data="last_watering_0"),
-            InlineKeyboardButton(text="💧 Вчера", callback_data="last_watering_1"),
-        ],
-        [
-            InlineKeyboardButton(text="💧 2-3 дня назад", callback_data="last_watering_3"),
-            InlineKeyboardButton(text="💧 Неделю назад", callback_data="last_watering_7"),
-        ],
-        [
-            InlineKeyboardButton(text="🤷 Не помню / Пропустить", callback_data="last_watering_skip"),
-        ],
-    ]
-    
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    return _LAST_WATERING_KEYBOARD
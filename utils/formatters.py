@@ -1,116 +1,123 @@
-from config import STATE_EMOJI, STATE_NAMES
+from functools import lru_cache
+
+from config import STATE_UI, DEFAULT_STATE_UI
+
+def _format_plant_name(value: str, ctx: dict) -> str:
+    display_name, sep, rest = value.partition("(")
+    text = f"🌿 <b>{display_name.strip()}</b>\n"
+    if sep:
+        latin_name = rest.partition(")")[0]
+        text += f"🏷️ <i>{latin_name}</i>\n"
+    return text
+
+
+# Уровни уверенности по 20%: (иконка у строки "Уверенность", итоговая подпись).
+# Ниже 60% - низкая, 60-79% - хорошая, от 80% - высокая
+_LOW_CONFIDENCE = ("🤔", "\n\n🤔 <i>Требуется дополнительная идентификация</i>")
+_CONFIDENCE_LEVELS = (
+    _LOW_CONFIDENCE, _LOW_CONFIDENCE, _LOW_CONFIDENCE,
+    ("🎪", "\n\n👍 <i>Хорошее распознавание</i>"),
+    ("🎯", "\n\n🏆 <i>Высокая точность распознавания</i>"),
+)
+
+
+def _confidence_level(confidence: float) -> tuple:
+    try:
+        bucket = int(confidence) // 20
+    except (ValueError, OverflowError):  # nan / inf из ответа модели
+        bucket = 0
+    return _CONFIDENCE_LEVELS[min(max(bucket, 0), 4)]
+
+
+def _format_confidence(value: str, ctx: dict) -> str:
+    try:
+        ctx['confidence'] = float(value.replace("%", ""))
+    except ValueError:
+        return f"🎪 <b>Уверенность:</b> {value}\n\n"
+    conf_icon = _confidence_level(ctx['confidence'])[0]
+    return f"{conf_icon} <b>Уверенность:</b> {value}\n\n"
+
+
+# Основы слов в описании состояния, по которым выбирается иконка
+_HEALTHY_WORDS = ("здоров", "хорош", "отличн", "норм")
+_PROBLEM_WORDS = ("проблем", "болен", "плох", "стресс")
+_UNKNOWN_WATERING_WORDS = ("невозможно", "не видна")
+
+
+def _format_condition(value: str, ctx: dict) -> str:
+    condition = value.lower()
+    if any(word in condition for word in _HEALTHY_WORDS):
+        icon = "✅"
+    elif any(word in condition for word in _PROBLEM_WORDS):
+        icon = "⚠️"
+    else:
+        icon = "ℹ️"
+    return f"{icon} <b>Общее состояние:</b> {value}\n\n"
+
+
+def _format_watering_analysis(value: str, ctx: dict) -> str:
+    analysis = value.lower()
+    if any(word in analysis for word in _UNKNOWN_WATERING_WORDS):
+        icon = "❓"
+    else:
+        icon = "💧"
+    return f"{icon} <b>Анализ полива:</b> {value}\n"
+
+
+def _template_line(template: str):
+    """Обработчик строки с фиксированным оформлением"""
+    return lambda value, ctx: template.format(value)
+
+
+# "КЛЮЧ: значение" из ответа анализа -> оформление строки.
+# ТЕКУЩЕЕ_СОСТОЯНИЕ не выводится: состояние показывается отдельно из state_info
+_ANALYSIS_LINE_HANDLERS = {
+    "РАСТЕНИЕ": _format_plant_name,
+    "УВЕРЕННОСТЬ": _format_confidence,
+    "СОСТОЯНИЕ": _format_condition,
+    "ПОЛИВ_АНАЛИЗ": _format_watering_analysis,
+    "ПОЛИВ_РЕКОМЕНДАЦИИ": _template_line("💡 <b>Рекомендации:</b> {}\n"),
+    "ПОЛИВ_ИНТЕРВАЛ": _template_line("⏰ <b>Интервал полива:</b> каждые {} дней\n\n"),
+    "СВЕТ": _template_line("☀️ <b>Освещение:</b> {}\n"),
+    "ТЕМПЕРАТУРА": _template_line("🌡️ <b>Температура:</b> {}\n"),
+    "ВЛАЖНОСТЬ": _template_line("💨 <b>Влажность:</b> {}\n"),
+    "ПОДКОРМКА": _template_line("🍽️ <b>Подкормка:</b> {}\n"),
+    "СОВЕТ": _template_line("\n💡 <b>Персональный совет:</b> {}"),
+    "СЕЗОННЫЙ_СОВЕТ": _template_line("\n\n🌍 <b>Важно для текущего сезона:</b> {}"),
+}
+
 
 def format_plant_analysis(raw_text: str, confidence: float = None, state_info: dict = None) -> str:
     """Форматирование анализа с состоянием"""
-    lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
-    formatted = ""
-    
-    plant_name = "Неизвестное растение"
-    confidence_level = confidence or 0
-    
-    for line in lines:
-        if line.startswith("РАСТЕНИЕ:"):
-            plant_name = line.replace("РАСТЕНИЕ:", "").strip()
-            display_name = plant_name.split("(")[0].strip()
-            formatted += f"🌿 <b>{display_name}</b>\n"
-            if "(" in plant_name:
-                latin_name = plant_name[plant_name.find("(")+1:plant_name.find(")")]
-                formatted += f"🏷️ <i>{latin_name}</i>\n"
-            
-        elif line.startswith("УВЕРЕННОСТЬ:"):
-            conf = line.replace("УВЕРЕННОСТЬ:", "").strip()
-            try:
-                confidence_level = float(conf.replace("%", ""))
-                if confidence_level >= 80:
-                    conf_icon = "🎯"
-                elif confidence_level >= 60:
-                    conf_icon = "🎪"
-                else:
-                    conf_icon = "🤔"
-                formatted += f"{conf_icon} <b>Уверенность:</b> {conf}\n\n"
-            except:
-                formatted += f"🎪 <b>Уверенность:</b> {conf}\n\n"
-        
-        elif line.startswith("ТЕКУЩЕЕ_СОСТОЯНИЕ:"):
-            pass
-        
-        elif line.startswith("СОСТОЯНИЕ:"):
-            condition = line.replace("СОСТОЯНИЕ:", "").strip()
-            if any(word in condition.lower() for word in ["здоров", "хорош", "отличн", "норм"]):
-                icon = "✅"
-            elif any(word in condition.lower() for word in ["проблем", "болен", "плох", "стресс"]):
-                icon = "⚠️"
-            else:
-                icon = "ℹ️"
-            formatted += f"{icon} <b>Общее состояние:</b> {condition}\n\n"
-        
-        elif line.startswith("ПОЛИВ_АНАЛИЗ:"):
-            analysis = line.replace("ПОЛИВ_АНАЛИЗ:", "").strip()
-            if "невозможно" in analysis.lower() or "не видна" in analysis.lower():
-                icon = "❓"
-            else:
-                icon = "💧"
-            formatted += f"{icon} <b>Анализ полива:</b> {analysis}\n"
-            
-        elif line.startswith("ПОЛИВ_РЕКОМЕНДАЦИИ:"):
-            recommendations = line.replace("ПОЛИВ_РЕКОМЕНДАЦИИ:", "").strip()
-            formatted += f"💡 <b>Рекомендации:</b> {recommendations}\n"
-            
-        elif line.startswith("ПОЛИВ_ИНТЕРВАЛ:"):
-            interval = line.replace("ПОЛИВ_ИНТЕРВАЛ:", "").strip()
-            formatted += f"⏰ <b>Интервал полива:</b> каждые {interval} дней\n\n"
-            
-        elif line.startswith("СВЕТ:"):
-            light = line.replace("СВЕТ:", "").strip()
-            formatted += f"☀️ <b>Освещение:</b> {light}\n"
-            
-        elif line.startswith("ТЕМПЕРАТУРА:"):
-            temp = line.replace("ТЕМПЕРАТУРА:", "").strip()
-            formatted += f"🌡️ <b>Температура:</b> {temp}\n"
-            
-        elif line.startswith("ВЛАЖНОСТЬ:"):
-            humidity = line.replace("ВЛАЖНОСТЬ:", "").strip()
-            formatted += f"💨 <b>Влажность:</b> {humidity}\n"
-            
-        elif line.startswith("ПОДКОРМКА:"):
-            feeding = line.replace("ПОДКОРМКА:", "").strip()
-            formatted += f"🍽️ <b>Подкормка:</b> {feeding}\n"
-        
-        elif line.startswith("СОВЕТ:"):
-            advice = line.replace("СОВЕТ:", "").strip()
-            formatted += f"\n💡 <b>Персональный совет:</b> {advice}"
-        
-        elif line.startswith("СЕЗОННЫЙ_СОВЕТ:"):
-            seasonal_advice = line.replace("СЕЗОННЫЙ_СОВЕТ:", "").strip()
-            formatted += f"\n\n🌍 <b>Важно для текущего сезона:</b> {seasonal_advice}"
+    ctx = {'confidence': confidence or 0}
+    # Части ответа собираются в список и склеиваются один раз в конце
+    parts = []
     
     if state_info:
         current_state = state_info.get('current_state', 'healthy')
-        state_emoji = STATE_EMOJI.get(current_state, '🌱')
-        state_name = STATE_NAMES.get(current_state, 'Здоровое')
-        
-        formatted = f"\n{state_emoji} <b>Текущее состояние:</b> {state_name}\n" + formatted
-        
-        if state_info.get('state_reason'):
-            formatted += f"\n📋 <b>Почему:</b> {state_info['state_reason']}"
+        state_emoji, state_name = STATE_UI.get(current_state, DEFAULT_STATE_UI)
+        parts.append(f"\n{state_emoji} <b>Текущее состояние:</b> {state_name}\n")
     
-    if confidence_level >= 80:
-        formatted += "\n\n🏆 <i>Высокая точность распознавания</i>"
-    elif confidence_level >= 60:
-        formatted += "\n\n👍 <i>Хорошее распознавание</i>"
-    else:
-        formatted += "\n\n🤔 <i>Требуется дополнительная идентификация</i>"
+    for line in raw_text.splitlines():
+        key, sep, value = line.strip().partition(":")
+        handler = _ANALYSIS_LINE_HANDLERS.get(key) if sep else None
+        if handler:
+            parts.append(handler(value.strip(), ctx))
+    
+    if state_info and state_info.get('state_reason'):
+        parts.append(f"\n📋 <b>Почему:</b> {state_info['state_reason']}")
     
-    formatted += "\n💾 <i>Сохраните для отслеживания изменений!</i>"
+    parts.append(_confidence_level(ctx['confidence'])[1])
     
-    return formatted
+    parts.append("\n💾 <i>Сохраните для отслеживания изменений!</i>")
+    
+    return "".join(parts)
 
 
-def get_state_recommendations(state: str, plant_name: str = "растение") -> str:
-    """Получить рекомендации для состояния"""
-    recommendations = {
-        'flowering': f"""
-💐 <b>{plant_name} цветет!</b>
+# Шаблоны рекомендаций по состоянию: {plant} - название растения
+_STATE_RECOMMENDATIONS = {
+    'flowering': """
+💐 <b>{plant} цветет!</b>
 
 <b>Изменения в уходе:</b>
 • 💧 <b>Полив:</b> Чаще на 2 дня (больше воды при цветении)
@@ -121,8 +128,8 @@ def get_state_recommendations(state: str, plant_name: str = "растение")
 ⚠️ <b>Важно:</b> Не перемещайте растение во время цветения!
 💡 <b>Совет:</b> Удаляйте увядшие цветы для продления цветения
 """,
-        'active_growth': f"""
-🌿 <b>{plant_name} активно растет!</b>
+    'active_growth': """
+🌿 <b>{plant} активно растет!</b>
 
 <b>Изменения в уходе:</b>
 • 💧 <b>Полив:</b> Регулярный, не допускайте пересыхания
@@ -132,8 +139,8 @@ def get_state_recommendations(state: str, plant_name: str = "растение")
 
 💡 <b>Совет:</b> Это лучшее время для формирования кроны
 """,
-        'dormancy': f"""
-😴 <b>{plant_name} в периоде покоя</b>
+    'dormancy': """
+😴 <b>{plant} в периоде покоя</b>
 
 <b>Изменения в уходе:</b>
 • 💧 <b>Полив:</b> Реже на 5 дней (минимальный полив)
@@ -144,8 +151,8 @@ def get_state_recommendations(state: str, plant_name: str = "растение")
 💡 <b>Совет:</b> Весной растение проснется с новыми силами!
 ⚠️ Не тревожьте растение в этот период
 """,
-        'stress': f"""
-⚠️ <b>Внимание! {plant_name} в стрессе</b>
+    'stress': """
+⚠️ <b>Внимание! {plant} в стрессе</b>
 
 <b>Срочные действия:</b>
 • 🔍 <b>Диагностика:</b> Определите причину (полив/свет/вредители)
@@ -157,8 +164,8 @@ def get_state_recommendations(state: str, plant_name: str = "растение")
 📸 <b>Важно:</b> Загрузите фото через 3-5 дней для контроля!
 ❓ Если не помогает - задайте вопрос с фото проблемы
 """,
-        'adaptation': f"""
-🔄 <b>{plant_name} адаптируется</b>
+    'adaptation': """
+🔄 <b>{plant} адаптируется</b>
 
 <b>Щадящий режим:</b>
 • 💧 <b>Полив:</b> Умеренный, без переувлажнения
@@ -169,8 +176,8 @@ def get_state_recommendations(state: str, plant_name: str = "растение")
 💡 <b>Совет:</b> Не пересаживайте и не тревожьте растение
 📸 Сфотографируйте через неделю для контроля состояния
 """,
-        'healthy': f"""
-🌱 <b>{plant_name} здоровое!</b>
+    'healthy': """
+🌱 <b>{plant} здоровое!</b>
 
 <b>Продолжайте текущий уход:</b>
 • 💧 Регулярный полив по графику
@@ -181,6 +188,14 @@ def get_state_recommendations(state: str, plant_name: str = "растение")
 💡 <b>Совет:</b> Продолжайте в том же духе!
 📸 Обновляйте фото раз в месяц для отслеживания
 """
-    }
-    
-    return recommendations.get(state, recommendations['healthy'])
+}
+
+
+_DEFAULT_STATE_RECOMMENDATION = _STATE_RECOMMENDATIONS['healthy']
+
+
+@lru_cache(maxsize=1024)
+def get_state_recommendations(state: str, plant_name: str = "растение") -> str:
+    """Получить рекомендации для состояния"""
+    template = _STATE_RECOMMENDATIONS.get(state, _DEFAULT_STATE_RECOMMENDATION)
+    return template.format(plant=plant_name)
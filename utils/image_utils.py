@@ -1,20 +1,58 @@
+import asyncio
+import base64
 import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 from PIL import Image
 
 logger = logging.getLogger(__name__)
 
-async def optimize_image_for_analysis(image_data: bytes, high_quality: bool = True) -> bytes:
-    """Оптимизация изображения для анализа"""
+# Декодирование/ресайз/кодирование JPEG - CPU-работа, выносим из event loop в процессы
+IMAGE_POOL_WORKERS = max(1, min(4, os.cpu_count() or 1))
+_image_pool = None
+
+
+def _get_image_pool() -> ProcessPoolExecutor:
+    """Пул процессов создаётся при первом фото, а не при импорте
+    
+    К этому моменту в процессе уже есть потоки (to_thread, executor'ы), а fork
+    многопоточного процесса может зависнуть на чужой блокировке. Поэтому воркеры
+    запускаются через forkserver (spawn там, где его нет)
+    """
+    global _image_pool
+    if _image_pool is None:
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _image_pool = ProcessPoolExecutor(
+            max_workers=IMAGE_POOL_WORKERS,
+            mp_context=multiprocessing.get_context(start_method),
+        )
+    return _image_pool
+
+
+def shutdown_image_pool():
+    """Остановить пул процессов при завершении бота"""
+    global _image_pool
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=False, cancel_futures=True)
+        _image_pool = None
+
+
+def _optimize_image_sync(image_data: bytes, high_quality: bool = True) -> bytes:
+    """Оптимизация изображения для анализа (выполняется в процессе пула)"""
     try:
-        # Если получили BytesIO - конвертируем в bytes
-        if isinstance(image_data, BytesIO):
-            image_data = image_data.getvalue()
-        
         image = Image.open(BytesIO(image_data))
+        max_side = 2048 if high_quality else 1024
+        if image.format == 'JPEG' and max(image.size) > max_side:
+            # JPEG можно декодировать сразу в 1/2, 1/4 или 1/8 размера - без полного кадра в памяти.
+            # До convert(): он загружает картинку, и draft внутри thumbnail уже не сработает.
+            # Запас x2 к итоговому размеру - как reducing_gap у thumbnail, качество не теряется
+            ratio = 2 * max_side / max(image.size)
+            image.draft('RGB', (int(image.size[0] * ratio), int(image.size[1] * ratio)))
         if image.mode != 'RGB':
             image = image.convert('RGB')
-        
+
         if high_quality:
             if max(image.size) < 1024:
                 ratio = 1024 / max(image.size)
@@ -25,16 +63,40 @@ async def optimize_image_for_analysis(image_data: bytes, high_quality: bool = Tr
         else:
             if max(image.size) > 1024:
                 image.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
-        
+
         output = BytesIO()
         quality = 95 if high_quality else 85
-        image.save(output, format='JPEG', quality=quality, optimize=True)
-        
+        # optimize - второй проход для оптимальных таблиц Хаффмана: кодирование почти вдвое дольше
+        # ради ~3% размера. Оставляем только для фото в GPT, где размер крупнее
+        image.save(output, format='JPEG', quality=quality, optimize=high_quality)
+
         # ИСПРАВЛЕНО: возвращаем bytes, а не BytesIO объект
         return output.getvalue()
     except Exception as e:
         logger.error(f"Ошибка оптимизации изображения: {e}", exc_info=True)
-        # В случае ошибки возвращаем исходные данные как bytes
-        if isinstance(image_data, BytesIO):
-            return image_data.getvalue()
+        # В случае ошибки возвращаем исходные данные
         return image_data
+
+
+def _encode_image_sync(image_data: bytes, high_quality: bool = True) -> str:
+    """Оптимизация и base64 в одном процессе: обратно передаётся только готовая строка"""
+    return base64.b64encode(_optimize_image_sync(image_data, high_quality)).decode('ascii')
+
+
+async def optimize_image_for_analysis(image_data: bytes, high_quality: bool = True) -> bytes:
+    """Оптимизация изображения для анализа"""
+    # Если получили BytesIO - конвертируем в bytes
+    if isinstance(image_data, BytesIO):
+        image_data = image_data.getvalue()
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_image_pool(), _optimize_image_sync, image_data, high_quality)
+
+
+async def encode_image_for_analysis(image_data: bytes, high_quality: bool = True) -> str:
+    """Оптимизированное изображение в base64 (JPEG)"""
+    if isinstance(image_data, BytesIO):
+        image_data = image_data.getvalue()
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_image_pool(), _encode_image_sync, image_data, high_quality)
@@ -0,0 +1,67 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# Лимиты Bot API на рассылку: ~30 сообщений в секунду на бота и ~1 в секунду в один чат
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_PER_CHAT_RATE = 1
+# Сколько последних чатов помним для лимита на чат
+PER_CHAT_BUCKETS_MAX = 10000
+
+
+class AsyncTokenBucket:
+    """Token bucket для asyncio: не больше rate событий за per секунд"""
+
+    def __init__(self, rate: float, per: float = 1.0):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Дождаться свободного токена"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.per)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class KeyedTokenBuckets:
+    """Отдельный token bucket на каждый ключ (например, chat_id), давно не использованные вытесняются"""
+
+    def __init__(self, rate: float, per: float = 1.0, maxsize: int = PER_CHAT_BUCKETS_MAX):
+        self.rate = rate
+        self.per = per
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    def get(self, key) -> AsyncTokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = AsyncTokenBucket(self.rate, self.per)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def acquire(self, key):
+        await self.get(key).acquire()
+
+
+# Общие лимитеры рассылок бота
+telegram_global_limiter = AsyncTokenBucket(TELEGRAM_GLOBAL_RATE)
+telegram_chat_limiter = KeyedTokenBuckets(TELEGRAM_PER_CHAT_RATE)
@@ -3,10 +3,14 @@
 GPT сам определяет интервалы полива, здесь только информация о сезоне
 """
 
+import time
 from datetime import datetime
 from typing import Dict
 import pytz
 
+# Данные о сезоне зависят только от даты: кэшируем до ближайшей полуночи
+_season_cache = {}  # timezone -> (expires_at, season_info)
+
 
 def get_current_season(timezone_str: str = 'Europe/Moscow') -> Dict[str, str]:
     """
@@ -15,83 +19,136 @@ def get_current_season(timezone_str: str = 'Europe/Moscow') -> Dict[str, str]:
     Returns:
         Dict с информацией о сезоне для передачи в GPT
     """
-    tz = pytz.timezone(timezone_str)
-    now = datetime.now(tz)
-    month = now.month
+    entry = _season_cache.get(timezone_str)
+    now_monotonic = time.monotonic()
+    if entry and entry[0] > now_monotonic:
+        return dict(entry[1])
     
-    # Определяем сезон для северного полушария (Россия)
-    if month in [12, 1, 2]:
-        season = 'winter'
-        season_ru = 'Зима'
-        growth_phase = 'Период покоя'
-        light_hours = 'Короткий световой день (7-9 часов)'
-        temperature_note = 'Оптимально 16-20°C, избегать сквозняков от батарей'
-        watering_adjustment = 'Полив сокращается в 1.5-2.5 раза'
-        recommendations = (
+    now = datetime.now(pytz.timezone(timezone_str))
+    season_info = _compute_season(now)
+    seconds_to_midnight = 24 * 60 * 60 - (now.hour * 3600 + now.minute * 60 + now.second)
+    _season_cache[timezone_str] = (now_monotonic + seconds_to_midnight, season_info)
+    return dict(season_info)
+
+
+# Неизменная часть информации о сезоне; месяц и дата добавляются в _compute_season
+_SEASON_TEMPLATES = {
+    'winter': {
+        'season': 'winter',
+        'season_ru': 'Зима',
+        'growth_phase': 'Период покоя',
+        'light_hours': 'Короткий световой день (7-9 часов)',
+        'temperature_note': 'Оптимально 16-20°C, избегать сквозняков от батарей',
+        'watering_adjustment': 'Полив сокращается в 1.5-2.5 раза',
+        'recommendations': (
             'Большинство растений в состоянии покоя. '
             'Сократить полив, прекратить подкормки. '
             'Избегать переувлажнения - риск корневых гнилей.'
-        )
-    elif month in [3, 4, 5]:
-        season = 'spring'
-        season_ru = 'Весна'
-        growth_phase = 'Начало вегетации'
-        light_hours = 'Увеличивающийся световой день (11-15 часов)'
-        temperature_note = 'Оптимально 18-22°C'
-        watering_adjustment = 'Постепенно увеличивать полив'
-        recommendations = (
+        ),
+    },
+    'spring': {
+        'season': 'spring',
+        'season_ru': 'Весна',
+        'growth_phase': 'Начало вегетации',
+        'light_hours': 'Увеличивающийся световой день (11-15 часов)',
+        'temperature_note': 'Оптимально 18-22°C',
+        'watering_adjustment': 'Постепенно увеличивать полив',
+        'recommendations': (
             'Растения выходят из покоя и начинают рост. '
             'Постепенно увеличивать полив, начинать подкормки. '
             'Оптимальное время для пересадки.'
-        )
-    elif month in [6, 7, 8]:
-        season = 'summer'
-        season_ru = 'Лето'
-        growth_phase = 'Активная вегетация'
-        light_hours = 'Длинный световой день (15-18 часов)'
-        temperature_note = 'Оптимально 20-26°C, проветривание при жаре'
-        watering_adjustment = 'Максимальная частота полива'
-        recommendations = (
+        ),
+    },
+    'summer': {
+        'season': 'summer',
+        'season_ru': 'Лето',
+        'growth_phase': 'Активная вегетация',
+        'light_hours': 'Длинный световой день (15-18 часов)',
+        'temperature_note': 'Оптимально 20-26°C, проветривание при жаре',
+        'watering_adjustment': 'Максимальная частота полива',
+        'recommendations': (
             'Период максимальной активности растений. '
             'Регулярный полив, не допускать пересыхания. '
             'Подкормки каждые 1-2 недели.'
-        )
-    else:  # 9, 10, 11
-        season = 'autumn'
-        season_ru = 'Осень'
-        growth_phase = 'Подготовка к покою'
-        light_hours = 'Сокращающийся световой день (10-12 часов)'
-        temperature_note = 'Оптимально 18-22°C, постепенно снижать'
-        watering_adjustment = 'Постепенно сокращать полив'
-        recommendations = (
+        ),
+    },
+    'autumn': {
+        'season': 'autumn',
+        'season_ru': 'Осень',
+        'growth_phase': 'Подготовка к покою',
+        'light_hours': 'Сокращающийся световой день (10-12 часов)',
+        'temperature_note': 'Оптимально 18-22°C, постепенно снижать',
+        'watering_adjustment': 'Постепенно сокращать полив',
+        'recommendations': (
             'Растения готовятся к периоду покоя. '
             'Постепенно сокращать полив и подкормки. '
             'С октября прекратить подкормки.'
-        )
-    
-    return {
-        'season': season,
-        'season_ru': season_ru,
-        'month': month,
-        'month_name': now.strftime('%B'),
-        'month_name_ru': get_month_name_ru(month),
-        'growth_phase': growth_phase,
-        'light_hours': light_hours,
-        'temperature_note': temperature_note,
-        'watering_adjustment': watering_adjustment,
-        'recommendations': recommendations,
-        'date': now.strftime('%Y-%m-%d')
-    }
+        ),
+    },
+}
+
+# Сезоны для северного полушария (Россия), индекс - номер месяца
+_MONTH_SEASONS = (
+    None, 'winter', 'winter', 'spring', 'spring', 'spring', 'summer',
+    'summer', 'summer', 'autumn', 'autumn', 'autumn', 'winter'
+)
+
+
+def _compute_season(now: datetime) -> Dict[str, str]:
+    """Вычислить информацию о сезоне на дату now"""
+    month = now.month
+    season_info = _SEASON_TEMPLATES[_MONTH_SEASONS[month]].copy()
+    season_info['month'] = month
+    season_info['month_name'] = _MONTH_NAMES_EN[month]
+    season_info['month_name_ru'] = _MONTH_NAMES_RU[month]
+    season_info['date'] = f"{now.year:04d}-{month:02d}-{now.day:02d}"
+    return season_info
+
+
+# Названия как у strftime('%B') в локали C, но без зависимости от локали процесса
+_MONTH_NAMES_EN = (
+    '', 'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December'
+)
+
+_MONTH_NAMES_RU = (
+    '', 'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+    'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'
+)
 
 
 def get_month_name_ru(month: int) -> str:
     """Получить название месяца на русском"""
-    months = {
-        1: 'Январь', 2: 'Февраль', 3: 'Март', 4: 'Апрель',
-        5: 'Май', 6: 'Июнь', 7: 'Июль', 8: 'Август',
-        9: 'Сентябрь', 10: 'Октябрь', 11: 'Ноябрь', 12: 'Декабрь'
+    return _MONTH_NAMES_RU[month] if 1 <= month <= 12 else ''
+
+
+# Сезон -> состояние растения -> совет
+_SEASONAL_CARE_TIPS = {
+    'winter': {
+        'healthy': 'Зимой главное - не переливать! Большинство растений в покое.',
+        'flowering': 'Зимнее цветение требует дополнительного освещения и аккуратного полива.',
+        'stress': 'Зимой стресс часто связан с переливом или холодом от окна.',
+        'dormancy': 'Нормальное состояние для зимы. Минимальный полив, никаких подкормок.'
+    },
+    'spring': {
+        'healthy': 'Весна - лучшее время для пересадки и начала подкормок.',
+        'flowering': 'Весеннее цветение естественно. Поддержите удобрениями для цветения.',
+        'stress': 'Весной растения быстро восстанавливаются.',
+        'active_growth': 'Идеальное время для роста. Обеспечьте питание и полив.'
+    },
+    'summer': {
+        'healthy': 'Летом следите за влажностью. Поливайте чаще, но не заливайте.',
+        'flowering': 'Летнее цветение требует регулярного полива и подкормок.',
+        'stress': 'Летом стресс может быть от жары. Притените от прямого солнца.',
+        'active_growth': 'Пик вегетации. Регулярные подкормки и полив.'
+    },
+    'autumn': {
+        'healthy': 'Осенью готовьте растения к зиме, сокращая полив.',
+        'flowering': 'Осеннее цветение - продолжайте поддерживать растение.',
+        'stress': 'Осенний стресс может быть от сокращения света.',
+        'dormancy': 'Растение готовится к покою - это нормально.'
     }
-    return months.get(month, '')
+}
 
 
 def get_seasonal_care_tips(season: str, plant_state: str = 'healthy') -> str:
@@ -102,31 +159,4 @@ def get_seasonal_care_tips(season: str, plant_state: str = 'healthy') -> str:
         season: текущий сезон
         plant_state: состояние растения (healthy, flowering, stress и т.д.)
     """
-    tips = {
-        'winter': {
-            'healthy': 'Зимой главное - не переливать! Большинство растений в покое.',
-            'flowering': 'Зимнее цветение требует дополнительного освещения и аккуратного полива.',
-            'stress': 'Зимой стресс часто связан с переливом или холодом от окна.',
-            'dormancy': 'Нормальное состояние для зимы. Минимальный полив, никаких подкормок.'
-        },
-        'spring': {
-            'healthy': 'Весна - лучшее время для пересадки и начала подкормок.',
-            'flowering': 'Весеннее цветение естественно. Поддержите удобрениями для цветения.',
-            'stress': 'Весной растения быстро восстанавливаются.',
-            'active_growth': 'Идеальное время для роста. Обеспечьте питание и полив.'
-        },
-        'summer': {
-            'healthy': 'Летом следите за влажностью. Поливайте чаще, но не заливайте.',
-            'flowering': 'Летнее цветение требует регулярного полива и подкормок.',
-            'stress': 'Летом стресс может быть от жары. Притените от прямого солнца.',
-            'active_growth': 'Пик вегетации. Регулярные подкормки и полив.'
-        },
-        'autumn': {
-            'healthy': 'Осенью готовьте растения к зиме, сокращая полив.',
-            'flowering': 'Осеннее цветение - продолжайте поддерживать растение.',
-            'stress': 'Осенний стресс может быть от сокращения света.',
-            'dormancy': 'Растение готовится к покою - это нормально.'
-        }
-    }
-    
-    return tips.get(season, {}).get(plant_state, 'Следите за состоянием растения.')
+    return _SEASONAL_CARE_TIPS.get(season, {}).get(plant_state, 'Следите за состоянием растения.')
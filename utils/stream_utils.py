@@ -0,0 +1,42 @@
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Telegram ограничивает частоту редактирования сообщений
+STREAM_EDIT_INTERVAL = 1.0  # секунд
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+_HTML_TAG_RE = re.compile(r'<[^>]*>?')
+
+
+def make_message_streamer(message, header: str, min_interval: float = STREAM_EDIT_INTERVAL,
+                          strip_html: bool = False):
+    """
+    Callback для потоковой генерации: показывает накопленный текст в сообщении
+    
+    Сообщение редактируется не чаще min_interval секунд, текст отправляется
+    без parse_mode - незакрытые теги в середине генерации сломали бы HTML.
+    strip_html убирает теги из промежуточного текста.
+    """
+    last_edit = 0.0
+    
+    async def on_delta(text: str):
+        nonlocal last_edit
+        now = time.monotonic()
+        if now - last_edit < min_interval or not text.strip():
+            return
+        last_edit = now
+        
+        if strip_html:
+            text = _HTML_TAG_RE.sub('', text)
+        preview = f"{header}\n\n{text}"
+        if len(preview) > TELEGRAM_MESSAGE_LIMIT:
+            preview = preview[:TELEGRAM_MESSAGE_LIMIT - 1] + "…"
+        try:
+            await message.edit_text(preview)
+        except Exception as e:
+            logger.debug(f"Не удалось обновить сообщение: {e}")
+    
+    return on_delta
@@ -1,7 +1,9 @@
-from datetime import datetime
-import pytz
+from datetime import datetime, timezone
 from config import MOSCOW_TZ
 
+# В Москве нет перехода на летнее время (UTC+3 с 2014 года): смещение считаем один раз
+_MOSCOW_UTC_OFFSET = MOSCOW_TZ.utcoffset(datetime.now())
+
 def get_moscow_now():
     """Получить текущее время в Москве"""
     return datetime.now(MOSCOW_TZ)
@@ -10,31 +12,42 @@ def get_moscow_date():
     """Получить текущую дату в Москве"""
     return get_moscow_now().date()
 
+def get_moscow_naive_now():
+    """Текущее московское время без пояса - в таком виде хранится plants.last_watered"""
+    return get_moscow_now().replace(tzinfo=None)
+
 def moscow_to_naive(moscow_datetime):
     """Конвертировать московское время в naive datetime"""
     if moscow_datetime.tzinfo is not None:
         return moscow_datetime.replace(tzinfo=None)
     return moscow_datetime
 
+def _days_word(days):
+    """Склонение слова 'день' для числа: 1 день, 2 дня, 5 дней, 21 день"""
+    if days % 10 == 1 and days % 100 != 11:
+        return "день"
+    if 2 <= days % 10 <= 4 and not 12 <= days % 100 <= 14:
+        return "дня"
+    return "дней"
+
+# Подписи для первого года готовы заранее; остальные собираются по шаблону
+_DAYS_AGO_LABELS = {None: "еще не поливали", 0: "сегодня", 1: "вчера"}
+_DAYS_AGO_LABELS.update({days: f"{days} {_days_word(days)} назад" for days in range(2, 366)})
+
+def format_days_ago_label(days_ago):
+    """Подпись для готового числа дней с последнего полива (None - не поливали)"""
+    label = _DAYS_AGO_LABELS.get(days_ago)
+    if label is None:
+        label = f"{days_ago} {_days_word(days_ago)} назад"
+    return label
+
 def format_days_ago(last_date):
-    """Форматировать 'N дней назад'"""
+    """Форматировать 'N дней назад' (naive last_date - московское время, как last_watered в БД)"""
     if not last_date:
-        return "еще не поливали"
-    
-    moscow_now = get_moscow_now()
-    
-    # Конвертируем в московское время если нужно
-    if last_date.tzinfo is None:
-        last_date_utc = pytz.UTC.localize(last_date)
-    else:
-        last_date_utc = last_date
+        return _DAYS_AGO_LABELS[None]
     
-    last_date_moscow = last_date_utc.astimezone(MOSCOW_TZ)
-    days_ago = (moscow_now.date() - last_date_moscow.date()).days
+    if last_date.tzinfo is not None:
+        last_date = last_date.replace(tzinfo=None) - last_date.utcoffset() + _MOSCOW_UTC_OFFSET
     
-    if days_ago == 0:
-        return "сегодня"
-    elif days_ago == 1:
-        return "вчера"
-    else:
-        return f"{days_ago} дней назад"
+    moscow_today = (datetime.now(timezone.utc) + _MOSCOW_UTC_OFFSET).date()
+    return format_days_ago_label((moscow_today - last_date.date()).days)